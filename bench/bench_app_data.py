@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du dashboard : coût d'un rerun Streamlit (slider, multiselect) sur un CSV nettoyé
+    python bench/bench_app_data.py [--n 100000] [--app]
+- avant : tout le chargement + enrichissement refait à chaque rerun (read_csv + prepare)
+- après : data_layer.load_data (cache par version du fichier) + masque de filtres
+- --app : exécute aussi src/app.py via streamlit.testing (premier run puis rerun après un slider)
+Sans index géocodage construit, un mini-index des CP du jeu synthétique est utilisé.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import warnings
+import logging
+
+import pandas as pd
+
+import synthetic  # ajoute src/ au sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # script de rerun
+import geoindex
+import data_layer
+
+ZIPS = {"75011": (48.8590, 2.3800), "78000": (48.8049, 2.1204), "92100": (48.8353, 2.2410),
+        "93100": (48.8620, 2.4410), "94000": (48.7904, 2.4556), "95000": (49.0364, 2.0761)}
+CITIES = ["Paris", "Versailles", "Boulogne-Billancourt", "Montreuil", "Créteil", "Cergy"]
+
+
+def make_csv(path, n):
+    rnd = random.Random(7)
+    rows = []
+    for i in range(n):
+        z = rnd.choice(list(ZIPS))
+        lat, lon = ZIPS[z]
+        geo = rnd.random() < 0.6
+        price = rnd.randint(80, 1500) * 1000.0
+        surface = round(rnd.uniform(9, 200), 1)
+        rows.append({
+            "title": f"Appartement {i}", "price_eur": price, "surface_m2": surface,
+            "price_per_m2": round(price / surface, 2), "rooms": rnd.randint(1, 6),
+            "city": rnd.choice(CITIES), "zipcode": z,
+            "latitude": lat + rnd.uniform(-.02, .02) if geo else None,
+            "longitude": lon + rnd.uniform(-.02, .02) if geo else None,
+            "url": f"https://www.seloger.com/annonces/{200000000 + i}.htm",
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def ensure_geo_index(tmp):
+    """Mini-index local si l'index versionné n'a pas été construit."""
+    if geoindex.get_index() is not None:
+        return
+    src = os.path.join(tmp, "FR.txt")
+    with open(src, "w", encoding="utf-8") as f:
+        for z, (lat, lon) in ZIPS.items():
+            f.write(f"FR\t{z}\tVille {z}\t\t\t\t\t\t\t{lat}\t{lon}\t\n")
+    out = os.path.join(tmp, "geo")
+    geoindex.build(src, out)
+    idx = geoindex.GeoIndex(out)
+    geoindex.get_index = lambda path=None: idx
+
+
+def timeit(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t)
+    return best
+
+
+def filter_mask(df):
+    """Même masquage que l'app (sliders à mi-course, 5 villes)."""
+    pmin, pmax = df["price_eur"].min(), df["price_eur"].max()
+    mask = df["price_eur"].between(pmin, (pmin + pmax) / 2) & df["surface_m2"].between(20, 120)
+    mask &= df["city"].isin(CITIES[:5])
+    fdf = df[mask]
+    return fdf[fdf["in_idf"]]
+
+
+RERUN_SCRIPT = """
+import sys, time
+sys.path.insert(0, {src!r})
+import streamlit as st
+import geoindex, data_layer
+from bench_app_data import filter_mask, ensure_geo_index
+ensure_geo_index({tmp!r})
+t = time.perf_counter()
+df = data_layer.load_data({csv!r})
+t_load = time.perf_counter() - t
+t = time.perf_counter()
+filter_mask(df)
+st.session_state.setdefault("timings", []).append((t_load, time.perf_counter() - t))
+"""
+
+
+def bench_rerun(tmp, csv, reruns=5):
+    """load_data + filtres dans un vrai runtime Streamlit (hors runtime, st.cache_data ne met rien en cache)."""
+    from streamlit.testing.v1 import AppTest
+    code = RERUN_SCRIPT.format(src=str(synthetic.ROOT / "src"), tmp=tmp, csv=csv)
+    at = AppTest.from_string(code, default_timeout=600)
+    for _ in range(reruns + 1):
+        at.run()
+    assert not at.exception, at.exception
+    first, *rest = at.session_state["timings"]
+    load, mask = min(rest)
+    return first[0], load, mask
+
+
+def bench_app(tmp, csv):
+    """Exécute la vraie app dans une copie du dépôt (DATA_PATH est relatif à src/)."""
+    from streamlit.testing.v1 import AppTest
+    repo = os.path.join(tmp, "repo")
+    shutil.copytree(synthetic.ROOT / "src", os.path.join(repo, "src"),
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    os.makedirs(os.path.join(repo, "data"))
+    shutil.copy(csv, os.path.join(repo, "data", "cleaned_data.csv"))
+    # data_layer réimporté depuis la copie (DATA_PATH en dépend)
+    sys.modules.pop("data_layer", None)
+    sys.path.insert(0, os.path.join(repo, "src"))
+    at = AppTest.from_file(os.path.join(repo, "src", "app.py"), default_timeout=600)
+    t = time.perf_counter(); at.run(); t_first = time.perf_counter() - t
+    if at.exception or not at.slider:
+        return t_first, float("nan"), at.exception
+    lo, hi = at.slider[0].value
+    at.slider[0].set_value((lo, (lo + hi) / 2))
+    t = time.perf_counter(); at.run(); t_rerun = time.perf_counter() - t
+    return t_first, t_rerun, at.exception
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--app", action="store_true", help="mesure aussi l'app complète (AppTest)")
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore")
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv = os.path.join(tmp, "cleaned_data.csv")
+        make_csv(csv, args.n)
+        ensure_geo_index(tmp)
+
+        t_old = timeit(lambda: filter_mask(data_layer.prepare(pd.read_csv(csv))), repeat=1)
+        t_cold, t_hit, t_mask = bench_rerun(tmp, csv)
+
+        print(f"{args.n} lignes")
+        print(f"avant  : rerun = chargement + enrichissement + filtres      {t_old * 1000:9.1f} ms")
+        print(f"après  : premier chargement (cache vide)                  {t_cold * 1000:9.1f} ms")
+        print(f"         rerun = cache (version + copie) {t_hit * 1000:7.1f} ms + filtres "
+              f"{t_mask * 1000:6.1f} ms = {(t_hit + t_mask) * 1000:7.1f} ms  → x{t_old / (t_hit + t_mask):.0f}")
+
+        if args.app:
+            t_first, t_rerun, exc = bench_app(tmp, csv)
+            print(f"app    : premier run {t_first:.2f} s • rerun après slider {t_rerun:.2f} s"
+                  + (f" (exception : {exc})" if exc else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de l'extraction des cartes d'annonces d'une page de résultats enregistrée
+    python bench/bench_cards.py [--pages 200] [--cards 25] [--html-dir data/html]
+- avant : BeautifulSoup, select("[data-test]") ou select("article,div,li") (200 max) puis get_text()
+  de chaque descendant de chaque carte (coût quadratique en profondeur)
+- après : parse_local_html.parse_html (une passe lxml qui marque les nœuds, champs lus sur les nœuds marqués)
+Pages de résultats synthétiques (avec et sans attributs data-test), ou les pages de --html-dir si
+le dossier existe ; vérifie que les deux versions donnent les mêmes annonces sur les pages data-test.
+"""
+
+import re
+import time
+import random
+import argparse
+
+from bs4 import BeautifulSoup as BS
+
+import synthetic  # noqa: F401  (ajoute src/ au sys.path)
+import parse_local_html as plh
+from bench_local_html import results_page, CITIES
+
+
+def plain_page(i: int, cards: int = 25) -> str:
+    """Même page sans data-test, cartes imbriquées dans des div (repli article/div/li de l'ancien code)."""
+    rnd = random.Random(i)
+    out = ['<html><body><div id="app"><div class="layout"><h1>Achat appartement Île-de-France</h1>'
+           '<div class="results"><ul>']
+    for _ in range(cards):
+        lid = 250_000_000 + rnd.randint(0, 5_000_000)
+        out.append(
+            f'<li><div class="card"><div class="media"><a href="https://www.seloger.com/annonces/achat/{lid}.htm">'
+            f'<img src="p.jpg"></a></div><div class="body"><div class="title">Appartement {rnd.randint(1, 6)} '
+            f'pièces</div><div class="price"><span>{rnd.randint(150, 900)} 000 €</span></div>'
+            f'<div class="tags"><span>{rnd.randint(20, 120)} m²</span><span>{rnd.choice(CITIES)}</span>'
+            "</div></div></div></li>"
+        )
+    out.append("</ul></div></div></div></body></html>")
+    return "".join(out)
+
+
+# ---------- Ancienne version (copie de parse_local_html avant la passe unique) ----------
+def legacy_pick_num(txt):
+    if not txt: return None
+    m = re.search(r"[\d\s]+(?:[\.,]\d+)?", txt)
+    if not m: return None
+    return m.group(0).replace(" ", "").replace(",", ".")
+
+
+def legacy_card(card):
+    title = card.get_text(" ", strip=True)[:140]
+    price = surface = rooms = url = None
+    a = card.find("a", href=True)
+    if a:
+        url = a["href"]
+    for tag in card.find_all(True):
+        t = tag.get_text(" ", strip=True).lower()
+        if any(k in t for k in ["€", "prix"]):
+            price = legacy_pick_num(t)
+        if any(k in t for k in ["m²", "surface"]):
+            surface = legacy_pick_num(t)
+        if "pièce" in t or "pieces" in t or "pièces" in t:
+            rooms = legacy_pick_num(t)
+    return {"title": title or None, "price": price, "surface_m2": surface, "rooms": rooms, "url": url}
+
+
+def legacy(html):
+    soup = BS(html, "lxml")
+    items = []
+    cards = soup.select("[data-test]") or soup.select("article,div,li")
+    for c in cards[:200]:
+        it = legacy_card(c)
+        if any([it.get("price"), it.get("surface_m2"), it.get("url")]):
+            items.append(it)
+    h1 = soup.find("h1")
+    if h1:
+        t = h1.get_text(" ", strip=True)
+        if t and len(t) > 5:
+            items.append({"title": t})
+    return items
+
+
+def run(name, pages, check):
+    t = time.perf_counter(); old = [legacy(h) for h in pages]; t_old = time.perf_counter() - t
+    t = time.perf_counter(); new = [plh.parse_html(h) for h in pages]; t_new = time.perf_counter() - t
+    n_old, n_new = sum(map(len, old)), sum(map(len, new))
+    same = f" • mêmes annonces : {old == new}" if check else ""
+    print(f"{name} ({len(pages)} pages)")
+    print(f"  avant : {t_old / len(pages) * 1000:7.2f} ms/page • {n_old} enregistrements")
+    print(f"  après : {t_new / len(pages) * 1000:7.2f} ms/page • {n_new} enregistrements "
+          f"→ x{t_old / t_new:.0f}{same}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--cards", type=int, default=25)
+    ap.add_argument("--html-dir", default=plh.HTML_DIR)
+    args = ap.parse_args()
+
+    saved = []
+    for path in plh.iter_html_files(args.html_dir):
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            saved.append(f.read())
+        if len(saved) >= args.pages:
+            break
+    if saved:
+        run(f"pages enregistrées {args.html_dir}", saved, check=False)
+    run("pages data-test", [results_page(i, args.cards) for i in range(args.pages)], check=True)
+    run("pages sans data-test", [plain_page(i, args.cards) for i in range(args.pages)], check=False)
+
+
+if __name__ == "__main__":
+    main()
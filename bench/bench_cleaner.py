@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du nettoyage : boucle Python par annonce + apply(axis=1) (ancien) vs opérations colonnes
+    python bench/bench_cleaner.py [--n 1000000]
+Génère un fichier brut JSON Lines synthétique (formats de prix / CP / coordonnées variés),
+puis mesure lecture + nettoyage + filtre ÎDF pour les deux versions et compare les sorties.
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import pandas as pd
+
+import synthetic  # noqa: F401  (ajoute src/ au sys.path)
+import cleaner
+
+
+def make_raw(path, n):
+    rnd = random.Random(42)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            price = rnd.randint(80, 1500) * 1000
+            surface = round(rnd.uniform(9, 200), 1)
+            zipcode = rnd.choice(["75011", "78000", "92100", "93100", "94000", "95000"])
+            geo = rnd.random() < 0.6
+            f.write(json.dumps({
+                "title": f"Appartement {i}",
+                # surtout des nombres (sortie du spider), quelques formats texte / manquants
+                "price": rnd.choices([float(price), f"{price:,} €".replace(",", " "), None], [85, 10, 5])[0],
+                "surface_m2": rnd.choices([surface, str(surface).replace(".", ","), 0, None], [85, 5, 5, 5])[0],
+                "rooms": rnd.randint(1, 6),
+                "city": "Ville",
+                "zipcode": rnd.choices([zipcode, int(zipcode), f"{zipcode[:2]} {zipcode[2:]}", None],
+                                       [80, 5, 5, 10])[0],
+                "latitude": 48.5 + rnd.random() if geo else None,
+                "longitude": 2.0 + rnd.random() * 2 if geo else None,
+                "url": f"https://www.seloger.com/annonces/{200000000 + i}.htm",
+            }, ensure_ascii=False) + "\n")
+
+
+def legacy(path):
+    """Copie de l'ancien cleaner.main (chargement complet + boucle + apply)."""
+    rows = []
+    for d in cleaner.load_raw_legacy(path):
+        price = d.get("price")
+        surface = d.get("surface_m2")
+        lat = d.get("latitude"); lon = d.get("longitude")
+        if price is None or surface in (None, 0, "", "0"):
+            continue
+        try:
+            price = float(str(price).replace(" ", "").replace(",", ".").replace("€", ""))
+            surface = float(str(surface).replace(",", "."))
+            if surface <= 0:
+                continue
+        except Exception:
+            continue
+        zip_digits = re.sub(r"\D", "", str(d.get("zipcode") or ""))
+        zipcode = zip_digits[:5] if len(zip_digits) >= 5 else None
+        ok_geo = lat not in (None, "") and lon not in (None, "") and cleaner.in_idf(lat, lon)
+        rows.append({
+            "title": d.get("title"), "price_eur": round(price, 2), "surface_m2": round(surface, 2),
+            "price_per_m2": round(price / surface, 2) if surface else None, "rooms": d.get("rooms"),
+            "city": d.get("city"), "zipcode": zipcode,
+            "latitude": float(lat) if ok_geo else None, "longitude": float(lon) if ok_geo else None,
+            "url": d.get("url"),
+        })
+    df = pd.DataFrame(rows)
+    df["zipcode"] = df["zipcode"].astype("string")
+    mask = df.apply(lambda r: cleaner.in_idf(r["latitude"], r["longitude"]), axis=1)
+    df.loc[~mask, ["latitude", "longitude"]] = pd.NA
+    return df
+
+
+def vectorized(path):
+    frames = [cleaner.clean_records(b) for b in cleaner.iter_batches(cleaner.load_raw(path))]
+    df = pd.concat(frames, ignore_index=True)
+    mask = cleaner.idf_mask(df["latitude"], df["longitude"])
+    df["latitude"], df["longitude"] = df["latitude"].where(mask), df["longitude"].where(mask)
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".jsonl") as tmp:
+        make_raw(tmp.name, args.n)
+        t = time.perf_counter(); a = legacy(tmp.name); t_old = time.perf_counter() - t
+        t = time.perf_counter(); b = vectorized(tmp.name); t_new = time.perf_counter() - t
+
+    b = b[list(a.columns)]  # + listing_id (clé canonique), absente de l'ancienne sortie
+    same = a.reset_index(drop=True).astype(str).equals(b.reset_index(drop=True).astype(str))
+    print(f"{args.n} annonces brutes → {len(b)} lignes nettoyées (sorties identiques : {same})")
+    print(f"avant : {t_old:7.2f} s")
+    print(f"après : {t_new:7.2f} s  → x{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark extract_from_jsonobjs : walk_json + deep_get (ancien) vs table compilée
+    python bench/bench_extract_fields.py [--repeat 5]
+"""
+
+import time
+import argparse
+
+from synthetic import load_pages
+from json_extract import json_blocks_from_html
+from field_paths import extract_fields
+
+
+# --- copie de l'ancienne implémentation (src/spider.py) ---
+def first(*vals):
+    for v in vals:
+        if v not in (None, "", [], {}):
+            return v
+    return None
+
+
+def deep_get(obj, *paths):
+    for path in paths:
+        cur = obj
+        try:
+            for key in path.split("."):
+                if isinstance(cur, list):
+                    nxt = None
+                    for it in cur:
+                        if isinstance(it, dict) and key in it:
+                            nxt = it[key]
+                            break
+                    cur = nxt if nxt is not None else (cur[0] if cur else None)
+                else:
+                    cur = cur[key]
+            if cur not in (None, "", [], {}):
+                return cur
+        except Exception:
+            continue
+    return None
+
+
+def walk_json(obj):
+    if isinstance(obj, dict):
+        yield obj
+        for v in obj.values():
+            yield from walk_json(v)
+    elif isinstance(obj, list):
+        for it in obj:
+            yield from walk_json(it)
+
+
+def extract_legacy(jsonobjs):
+    price = surface = rooms = city = zipcode = lat = lon = url = title = None
+    for obj in jsonobjs:
+        for d in walk_json(obj):
+            url = first(url, d.get("url"), deep_get(d, "mainEntityOfPage.@id"))
+            title = first(title, d.get("name"), d.get("headline"), d.get("title"))
+            price = first(price, d.get("price"), deep_get(d, "offers.price"), deep_get(d, "offers.0.price"),
+                          deep_get(d, "price.value"), deep_get(d, "pricing.price"), deep_get(d, "ad.price.value"))
+            surface = first(surface, d.get("floorSize"), d.get("area"), d.get("livingArea"),
+                            deep_get(d, "floorSize.value"), deep_get(d, "surface.value"),
+                            deep_get(d, "property.surface"), deep_get(d, "habitableSurface"))
+            rooms = first(rooms, d.get("numberOfRooms"), d.get("rooms"),
+                          deep_get(d, "ad.rooms"), deep_get(d, "property.rooms"))
+            city = first(city, deep_get(d, "address.addressLocality"), deep_get(d, "address.locality"),
+                         deep_get(d, "location.city"), d.get("city"))
+            zipcode = first(zipcode, deep_get(d, "address.postalCode"), deep_get(d, "address.zipCode"),
+                            d.get("postalCode"))
+            lat = first(lat, deep_get(d, "geo.latitude"), d.get("latitude"))
+            lon = first(lon, deep_get(d, "geo.longitude"), d.get("longitude"))
+    return price, surface, rooms, city, zipcode, lat, lon
+
+
+def bench(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for objs in pages:
+            fn(objs)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000 / len(pages)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    pages = [json_blocks_from_html(html) for _, html in load_pages()]
+    before = bench(extract_legacy, pages, args.repeat)
+    after = bench(extract_fields, pages, args.repeat)
+    print(f"{len(pages)} pages")
+    print(f"avant : {before:8.2f} ms/page")
+    print(f"après : {after:8.2f} ms/page  → x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
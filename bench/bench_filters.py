@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark des filtres du dashboard (prix, surface, villes) pendant un glissement de slider
+    python bench/bench_filters.py [--n 1000000] [--steps 50]
+- avant : between(...) & between(...) & isin(...) sur tout le DataFrame + df[mask]
+- après : filter_index.FilterIndex (searchsorted + postings par ville), sans puis avec cache
+- pagination du tableau : sort_values + tranche (avant) vs FilterIndex.page (tri global restreint)
+Vérifie que les deux donnent les mêmes lignes.
+"""
+
+import time
+import random
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import synthetic  # noqa: F401  (ajoute src/ au sys.path)
+from filter_index import FilterIndex
+
+CITIES = [f"Ville {k}" for k in range(1300)]  # ~ nombre de communes d'ÎDF
+
+
+def make_df(n):
+    rng = np.random.default_rng(3)
+    price = rng.integers(80, 1500, n) * 1000.0
+    price[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        "price_eur": price,
+        "surface_m2": rng.uniform(9, 200, n).round(1),
+        "city": pd.Series(rng.choice(CITIES, n)).where(rng.random(n) > 0.01, None),
+    })
+
+
+def legacy(df, r, s, sel):
+    mask = df["price_eur"].between(*r) & df["surface_m2"].between(*s)
+    if sel:
+        mask &= df["city"].isin(sel)
+    return df[mask]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    ap.add_argument("--steps", type=int, default=50)
+    args = ap.parse_args()
+
+    df = make_df(args.n)
+    t = time.perf_counter(); index = FilterIndex(df); t_build = time.perf_counter() - t
+
+    # glissement du slider prix, surface fixe, 5 villes
+    rnd = random.Random(0)
+    sel = rnd.sample(CITIES, 5)
+    steps = [((80_000.0, 80_000.0 + k * 1_420_000 / args.steps), (20.0, 120.0), sel)
+             for k in range(1, args.steps + 1)]
+
+    t = time.perf_counter()
+    old = [legacy(df, *p) for p in steps]
+    t_old = (time.perf_counter() - t) / len(steps)
+    t = time.perf_counter()
+    new = [index.filter(*p) for p in steps]
+    t_new = (time.perf_counter() - t) / len(steps)
+    t = time.perf_counter()
+    for p in steps:
+        index.filter(*p)
+    t_hit = (time.perf_counter() - t) / len(steps)
+
+    assert all(a.index.equals(b.index) for a, b in zip(old, new)), "résultats différents"
+    full = ((0.0, 1e12), (0.0, 1e6), [])
+    assert legacy(df, *full).index.equals(index.filter(*full).index)
+
+    # page 3 triée par prix décroissant, puis page suivante (tri en cache)
+    r, s_, sel_ = steps[-1]
+    fdf, rows = old[-1], index.query(r, s_, sel_)
+    t = time.perf_counter(); ref = fdf.sort_values("price_eur", ascending=False, kind="stable").iloc[100:150]
+    t_sort_old = time.perf_counter() - t
+    index.sort_order("price_eur", False)  # tri global construit une fois par version
+    t = time.perf_counter(); page = index.page(rows, "price_eur", False, page=2, size=50)
+    t_page = time.perf_counter() - t
+    t = time.perf_counter(); index.page(rows, "price_eur", False, page=3, size=50)
+    t_next = time.perf_counter() - t
+    assert np.array_equal(df["price_eur"].to_numpy()[page], ref["price_eur"].to_numpy())
+
+    print(f"{args.n} lignes, {len(CITIES)} villes • index construit en {t_build * 1000:.0f} ms")
+    print(f"avant : {t_old * 1000:8.2f} ms / position du slider")
+    print(f"après : {t_new * 1000:8.2f} ms (requête) • {t_hit * 1000:.3f} ms (cache) → x{t_old / t_new:.0f}")
+    print(f"page triée ({len(rows)} lignes filtrées) : sort_values {t_sort_old * 1000:.2f} ms • "
+          f"index {t_page * 1000:.2f} ms • page suivante {t_next * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
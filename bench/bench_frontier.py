@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du crawl partagé (src/frontier.py) : N workers, panne, reprise, politesse commune
+    python bench/bench_frontier.py [--n 1000] [--workers 4] [--rate 25]
+Processus réels (spawn : un reactor Twisted propre à chacun), chacun avec son SelogerSpider en mode
+frontière ; réponses du site synthétique de bench_serp au lieu du téléchargeur, attente de politesse
+par PolitenessMiddleware.process_request (même chemin que sous Scrapy). Appels à la frontière directs
+(Frontier.threaded = False), spider_idle simulé par claim_rows / claim_batch.
+- avant : N processus à seaux locaux -> budget par hôte dépassé N fois (--rate choisi sous le débit
+  qu'un worker tient seul, pour que ce soit la politesse et non le CPU qui limite)
+- après : seaux partagés -> débit global <= --rate, une transaction SQLite par lot de créneaux et
+  non par page ; un worker tué en cours de route, ses baux expirent et sont repris ; crawl
+  interrompu puis relancé : rien n'est refait
+Vérifie que chaque annonce est émise au moins une fois et compte les pages refaites.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing as mp
+from collections import deque
+
+os.environ.setdefault("LEASE_SECONDS", "2")  # baux courts : reprise après panne visible en quelques secondes
+
+from scrapy import Spider, Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
+
+import synthetic  # noqa: F401  (ajoute src/ au sys.path)
+import spider
+from throttle import PolitenessMiddleware
+from frontier import Frontier, FrontierMiddleware, seed
+from bench_serp import make_site, detail_url, fetch
+
+
+def worker(wid, db, site, rate, shared, crash_after, out):
+    """Processus d'un worker : boucle de crawl sous le reactor (attentes de politesse = Deferreds)."""
+    failures = []
+    d = crawl_loop(wid, db, site, rate, shared, crash_after, out)
+    d.addErrback(failures.append).addBoth(lambda _: reactor.stop())
+    reactor.run()
+    if failures:
+        failures[0].raiseException()
+
+
+@inlineCallbacks
+def crawl_loop(wid, db, site, rate, shared, crash_after, out):
+    """Boucle d'un worker : requêtes de départ tirées une à une (comme Scrapy), lot suivant quand
+    la file est vide, fin quand la frontière est vide et sans bail en cours chez les autres."""
+    spider.FRONTIER_DB, spider.WORKER_ID, spider.STATE_DB = db, wid, ""
+    Frontier.threaded = False
+    sp = spider.SelogerSpider.from_crawler(get_crawler(spider.SelogerSpider))
+    crawler = get_crawler(Spider, {"THROTTLE_RATE": rate, "THROTTLE_BURST": 1, "THROTTLE_STATS_INTERVAL": 0,
+                                   "THROTTLE_SHARED_DB": db if shared else ""})
+    throttle = PolitenessMiddleware(crawler)
+    mw = FrontierMiddleware()
+    queue = deque(sp.start_requests())
+    stamps, items = [], []  # battement de cœur : LoopingCall du spider, sous ce reactor
+    while True:
+        if not queue:  # spider_idle
+            rows, pending = sp.claim_rows()
+            batch = sp.claim_batch(rows)
+            if batch:
+                queue.extend(batch)
+            elif pending:
+                yield deferLater(reactor, 0.1, lambda: None)
+            elif not rows:
+                break
+            continue
+        req = queue.popleft()
+        yield throttle.process_request(req, sp)  # None ou Deferred de l'attente
+        stamps.append(time.time())
+        if len(stamps) == crash_after:
+            out.put((wid, stamps, items, tx(throttle)))
+            out.close()
+            out.join_thread()
+            os._exit(1)  # panne : ni pages marquées faites, ni baux rendus
+        status, html = fetch(site, 25, req.url)
+        resp = HtmlResponse(req.url, status=status, body=html.encode("utf-8"), encoding="utf-8", request=req)
+        for r in mw.process_spider_output(resp, req.callback(resp, **req.cb_kwargs) or [], sp):
+            if not isinstance(r, Request):
+                items.append(r["listing_id"])
+    sp.closed("finished")
+    out.put((wid, stamps, items, tx(throttle)))
+    if throttle.shared is not None:
+        throttle.shared.close()
+
+
+def tx(throttle):
+    """Transactions sur les seaux partagés (0 en seaux locaux)."""
+    return throttle.shared.transactions if throttle.shared is not None else 0
+
+
+def run(db, site, n_workers, rate, shared, crash=None):
+    """crash : {n° worker: pages avant panne}."""
+    crash = crash or {}
+    ctx = mp.get_context("spawn")  # pas de fork : le reactor (epoll) ne se partage pas entre processus
+    out = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(f"w{i}", db, site, rate, shared, crash.get(i, 0), out))
+             for i in range(n_workers)]
+    t = time.perf_counter()
+    for p in procs:
+        p.start()
+    res = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    secs = time.perf_counter() - t
+    stamps = sorted(s for _, st, _, _ in res for s in st)
+    items = [i for _, _, it, _ in res for i in it]
+    # pire fenêtre d'une seconde (2 pointeurs)
+    peak, j = 0, 0
+    for i, s in enumerate(stamps):
+        while stamps[j] < s - 1.0:
+            j += 1
+        peak = max(peak, i - j + 1)
+    return {"pages": len(stamps), "items": items, "secs": secs, "rate": len(stamps) / max(secs, 1e-9),
+            "peak": peak, "counts": Frontier(db).counts(), "tx": sum(t for *_, t in res)}
+
+
+def report(label, r, n, rate):
+    print(f"{label} : {r['pages']} pages en {r['secs']:.1f} s • {r['rate']:.0f} pages/s (pic {r['peak']}/s, "
+          f"x{r['peak'] / rate:.1f} le budget de {rate:g}) • {len(set(r['items']))}/{n} annonces "
+          f"• frontière {r['counts']}")
+    if r["tx"]:
+        print(f"  {r['tx']} transactions sur les seaux partagés ({r['pages'] / r['tx']:.1f} pages par transaction)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--rate", type=float, default=25)
+    args = ap.parse_args()
+
+    listings = make_site(args.n)
+    site = {"listings": listings, "by_url": {detail_url(l): l for l in listings}}
+    with tempfile.TemporaryDirectory() as tmp:
+        seeds = os.path.join(tmp, "urls.txt")
+        with open(seeds, "w") as f:
+            f.writelines(detail_url(l) + "\n" for l in listings)
+        spider.URLS_PATH, spider.CRAWL_MODE = seeds, "detail"
+
+        def fresh(name):
+            db = os.path.join(tmp, name)
+            seed(Frontier(db))
+            return db
+
+        print(f"{args.n} annonces, {args.workers} workers, budget {args.rate:g} pages/s pour l'hôte")
+        report("avant (seaux locaux)   ", run(fresh("local.sqlite"), site, args.workers, args.rate, False),
+               args.n, args.rate)
+
+        r = run(fresh("shared.sqlite"), site, args.workers, args.rate, True, crash={0: args.n // 10})
+        report("après (seaux partagés) ", r, args.n, args.rate)
+        print(f"  worker w0 tué après {args.n // 10} pages : {r['pages'] - args.n} pages refaites "
+              f"(lot réclamé non terminé), {len(r['items']) - len(set(r['items']))} annonces en double")
+
+        db = fresh("resume.sqlite")
+        a = run(db, site, args.workers, args.rate, True, crash={i: args.n // (2 * args.workers)
+                                                               for i in range(args.workers)})
+        time.sleep(float(os.environ["LEASE_SECONDS"]))  # baux des workers tués expirés
+        b = run(db, site, 2, args.rate, True)
+        done = len(set(a["items"]) | set(b["items"]))
+        print(f"reprise : run interrompu {a['pages']} pages (tous les workers tués) + relance 2 workers "
+              f"{b['pages']} pages = {a['pages'] + b['pages'] - args.n} pages refaites • {done}/{args.n} annonces "
+              f"• frontière {b['counts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la préparation du dashboard : remplissage CP + jitter
+    python bench/bench_jitter.py [--n 100000]
+- avant : DataFrame.apply(axis=1) ligne à ligne (fill_row, add_jitter -> jitter_stable)
+- après : data_layer.prepare (map par CP, SHA-1 en lot, trigonométrie NumPy)
+Vérifie que les coordonnées produites sont identiques au bit près.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from bench_app_data import make_csv, ensure_geo_index
+import data_layer
+from data_layer import geocode_zips, in_idf, jitter_stable
+
+
+def legacy(df):
+    """Copie de l'ancien remplissage + jitter de src/app.py (apply ligne à ligne)."""
+    mask_missing = df["latitude"].isna() | df["longitude"].isna()
+    df["_from_zip"] = mask_missing.copy()
+
+    cand = df.loc[mask_missing, "zipcode_str"].dropna().unique()
+    if cand.size > 0:
+        geo_lat, geo_lon = geocode_zips(cand)
+        mapping = {
+            str(pc): (lat, lon)
+            for pc, lat, lon in zip(cand, geo_lat, geo_lon)
+            if pd.notna(lat) and pd.notna(lon)
+        }
+
+        def fill_row(row):
+            if (pd.isna(row["latitude"]) or pd.isna(row["longitude"])) and pd.notna(row["zipcode_str"]):
+                key = str(row["zipcode_str"])
+                if key in mapping:
+                    lat, lon = mapping[key]
+                    if pd.notna(lat) and pd.notna(lon) and in_idf(lat, lon):
+                        row["latitude"] = float(lat)
+                        row["longitude"] = float(lon)
+            return row
+
+        df = df.apply(fill_row, axis=1)
+
+    counts = (
+        df.loc[df["_from_zip"] & df["zipcode_str"].notna(), "zipcode_str"]
+          .map(df["zipcode_str"].value_counts())
+    )
+    df["_jitter_me"] = df["_from_zip"] & df["zipcode_str"].notna() & (counts > 1)
+
+    def add_jitter(row):
+        if bool(row.get("_jitter_me")) and pd.notna(row["latitude"]) and pd.notna(row["longitude"]):
+            key = row.get("url") or row.get("title") or row.name
+            row["latitude"], row["longitude"] = jitter_stable(row["latitude"], row["longitude"], key)
+        return row
+
+    df = df.apply(add_jitter, axis=1)
+    return df.drop(columns=["_from_zip", "_jitter_me"], errors="ignore")
+
+
+def hygiene(csv):
+    """Partie commune (to_numeric + CP) : seule la suite est comparée."""
+    df = pd.read_csv(csv)
+    for col in ["price_eur", "surface_m2", "price_per_m2", "latitude", "longitude", "rooms"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    z = df["zipcode"].astype(str).replace(r"\D", "", regex=True).str[:5]
+    df["zipcode_str"] = z.where(z.str.len() == 5, np.nan)
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv = os.path.join(tmp, "cleaned_data.csv")
+        make_csv(csv, args.n)
+        ensure_geo_index(tmp)
+        # quelques clés dégénérées : url absente, titre absent
+        df = pd.read_csv(csv)
+        df.loc[::97, "url"] = np.nan
+        df.loc[::89, ["url", "title"]] = np.nan
+        df.to_csv(csv, index=False)
+
+        base = hygiene(csv)
+        t = time.perf_counter(); a = legacy(base.copy()); t_old = time.perf_counter() - t
+        t = time.perf_counter(); b = data_layer.prepare(pd.read_csv(csv)); t_new = time.perf_counter() - t
+
+    moved = int((~np.isclose(a["latitude"].to_numpy("float64"), base["latitude"].to_numpy("float64"),
+                             rtol=0, atol=0, equal_nan=True)).sum())
+    same = all(
+        np.array_equal(a[c].to_numpy("float64"), b[c].to_numpy("float64"), equal_nan=True)
+        for c in ("latitude", "longitude")
+    )
+    print(f"{args.n} lignes, {moved} coordonnées remplies/décalées (identiques au bit près : {same})")
+    print(f"avant : {t_old:7.2f} s   (apply ligne à ligne)")
+    print(f"après : {t_new:7.2f} s   (prepare complet, lecture CSV comprise) → x{t_old / t_new:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de parse_local_html sur un gros dossier de pages enregistrées
+    python bench/bench_local_html.py [--files 2000] [--workers 4]
+- avant : os.listdir + parse_file en série, tout en mémoire, set() de dédoublonnage (sans le plafond de 200)
+- après : parse_local_html.main (parcours en flux, processus de parsing, JSONL au fil de l'eau, Bloom)
+Pages de résultats synthétiques (cartes d'annonces) réparties en sous-dossiers ; vérifie que les
+deux versions écrivent les mêmes annonces.
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import synthetic  # noqa: F401  (ajoute src/ au sys.path)
+import parse_local_html as plh
+
+CITIES = [c for c, _ in synthetic.CITIES]
+
+
+def results_page(i: int, cards: int = 25) -> str:
+    rnd = random.Random(i)
+    out = ["<html><body><h1>Achat appartement Île-de-France</h1><ul>"]
+    for k in range(cards):
+        lid = 250_000_000 + rnd.randint(0, 5_000_000)  # recouvrements -> doublons entre pages
+        out.append(
+            f'<li><article data-test="sl.card"><a href="https://www.seloger.com/annonces/achat/{lid}.htm">'
+            f"Appartement {rnd.randint(1, 6)} pièces</a><span>{rnd.randint(150, 900)} 000 €</span>"
+            f"<span>{rnd.randint(20, 120)} m²</span><span>{rnd.choice(CITIES)}</span></article></li>"
+        )
+    out.append("</ul></body></html>")
+    return "".join(out)
+
+
+def legacy(html_dir):
+    """Ancien main() sans le plafond : listdir (un niveau), tout en mémoire, set()."""
+    items = []
+    for d, _, names in os.walk(html_dir):
+        for name in sorted(names):
+            if name.lower().endswith((".html", ".htm")):
+                items.extend(plh.parse_file(os.path.join(d, name)))
+    seen, dedup = set(), []
+    for it in items:
+        key = (it.get("url"), it.get("title"))
+        if key not in seen:
+            seen.add(key)
+            dedup.append(it)
+    return dedup
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=2000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        html_dir = os.path.join(tmp, "html")
+        for i in range(args.files):
+            sub = os.path.join(html_dir, f"{i // 500:03d}")
+            os.makedirs(sub, exist_ok=True)
+            with open(os.path.join(sub, f"page-{i:06d}.html"), "w", encoding="utf-8") as f:
+                f.write(results_page(i))
+
+        t = time.perf_counter(); old = legacy(html_dir); t_old = time.perf_counter() - t
+        out = os.path.join(tmp, "raw.jsonl")
+        t = time.perf_counter()
+        plh.main(["--html-dir", html_dir, "--out", out, "--workers", str(args.workers)])
+        t_new = time.perf_counter() - t
+        with open(out, encoding="utf-8") as f:
+            new = [json.loads(line) for line in f]
+
+        key = lambda it: (str(it.get("url")), str(it.get("title")))  # noqa: E731
+        same = sorted(map(key, old)) == sorted(map(key, new))
+        print(f"{args.files} fichiers, {len(old)} annonces uniques")
+        print(f"avant : {t_old:6.2f} s ({args.files / t_old:6.0f} fichiers/s, série)")
+        print(f"après : {t_new:6.2f} s ({args.files / t_new:6.0f} fichiers/s, {args.workers} workers) "
+              f"• mêmes annonces : {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la carte : taille du JSON pydeck envoyé au navigateur et temps de construction
+    python bench/bench_map.py [--n 100000]
+- avant : gdf complet (toutes les colonnes) dans un ScatterplotLayer + un TextLayer
+- après : map_clusters.layer_data au zoom proposé par défaut (cellules + points isolés, colonnes utiles)
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import warnings
+
+import pandas as pd
+import pydeck as pdk
+
+from bench_app_data import make_csv, ensure_geo_index
+import data_layer
+import map_clusters
+
+
+def deck_json(layers) -> str:
+    view = pdk.ViewState(latitude=48.85, longitude=2.35, zoom=10)
+    return pdk.Deck(initial_view_state=view, layers=layers).to_json()
+
+
+def legacy(gdf):
+    point = pdk.Layer("ScatterplotLayer", data=gdf, get_position="[longitude, latitude]", get_radius=70)
+    text = pdk.Layer("TextLayer", data=gdf, get_position="[longitude, latitude]", get_text="price_label")
+    return deck_json([point, text])
+
+
+def clustered(gdf):
+    finest = map_clusters.pick_zoom(gdf["qx"], gdf["qy"])
+    zoom = min(map_clusters.fit_zoom(gdf["latitude"], gdf["longitude"]), finest)
+    points, cells = map_clusters.layer_data(gdf, zoom)
+    labels = pd.concat([points[["longitude", "latitude", "price_label"]],
+                        cells[["longitude", "latitude", "price_label"]]], ignore_index=True)
+    return deck_json([
+        pdk.Layer("ScatterplotLayer", data=cells, get_position="[longitude, latitude]", get_radius="radius"),
+        pdk.Layer("ScatterplotLayer", data=points, get_position="[longitude, latitude]", get_radius=70),
+        pdk.Layer("TextLayer", data=labels, get_position="[longitude, latitude]", get_text="price_label"),
+    ]), zoom, len(cells), len(points)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv = os.path.join(tmp, "cleaned_data.csv")
+        make_csv(csv, args.n)
+        ensure_geo_index(tmp)
+        df = data_layer.prepare(pd.read_csv(csv))
+        gdf = df[df["in_idf"]]
+
+        t = time.perf_counter(); old = legacy(gdf); t_old = time.perf_counter() - t
+        t = time.perf_counter(); new, zoom, n_cells, n_points = clustered(gdf); t_new = time.perf_counter() - t
+
+        print(f"{len(gdf)} points en IDF")
+        print(f"avant : {len(old) / 1e6:8.2f} Mo de JSON, {t_old * 1000:8.1f} ms")
+        print(f"après : {len(new) / 1e6:8.2f} Mo de JSON, {t_new * 1000:8.1f} ms "
+              f"(zoom {zoom} : {n_cells} cellules, {n_points} points isolés)")
+
+
+if __name__ == "__main__":
+    main()
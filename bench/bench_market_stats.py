@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark des indicateurs de marché : p10 / médiane / p90 du €/m² par code postal et par commune
+    python bench/bench_market_stats.py [--n 1000000] [--runs 30]
+- avant : quantiles exacts recalculés sur tout l'historique à chaque run (groupby().quantile())
+- après : market_stats (esquisse fusionnable) mise à jour avec les seules lignes du run
+Mesure le coût du dernier run, la taille de l'état conservé et l'erreur relative des quantiles.
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import synthetic  # noqa: F401  (ajoute src/ au sys.path)
+import market_stats
+
+ZIPS = [f"{d}{k:03d}" for d in (75, 77, 78, 91, 92, 93, 94, 95) for k in range(0, 200, 10)]
+
+
+def make_run(rng, n):
+    z = rng.choice(ZIPS, n)
+    base = np.array([9000 if c.startswith("75") else 5000 for c in z])
+    return pd.DataFrame({
+        "price_per_m2": (base * rng.lognormal(0, 0.35, n)).round(2),
+        "zipcode": z,
+        "city": np.char.add("Ville ", z),
+    })
+
+
+def exact(history):
+    frames = []
+    for level in market_stats.LEVELS:
+        q = history.groupby(level)["price_per_m2"].quantile(list(market_stats.QUANTILES.values())).unstack()
+        q.columns = list(market_stats.QUANTILES)
+        frames.append(q.assign(level=level).rename_axis("key").reset_index())
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000, help="lignes au total (tous runs)")
+    ap.add_argument("--runs", type=int, default=30)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(1)
+    runs = [make_run(rng, args.n // args.runs) for _ in range(args.runs)]
+    history = pd.concat(runs, ignore_index=True)
+    sketch = market_stats.merge(*[market_stats.sketch_rows(r, f"2026-{k % 12 + 1:02d}")
+                                  for k, r in enumerate(runs[:-1])])
+
+    t = time.perf_counter(); ref = exact(history); t_old = time.perf_counter() - t
+    t = time.perf_counter()
+    sketch = market_stats.merge(sketch, market_stats.sketch_rows(runs[-1], "2026-12"))
+    got = market_stats.quantiles(sketch[sketch["period"] == market_stats.ALL], ["level", "key"])
+    t_new = time.perf_counter() - t
+
+    cmp = ref.merge(got, on=["level", "key"], suffixes=("_exact", ""))
+    err = max((cmp[q] / cmp[f"{q}_exact"] - 1).abs().max() for q in market_stats.QUANTILES)
+    print(f"{len(history)} lignes en {args.runs} runs • {len(ref)} clés")
+    print(f"état  : historique {history.memory_usage(deep=True).sum() / 1e6:.0f} Mo • "
+          f"esquisse {sketch.memory_usage(deep=True).sum() / 1e6:.0f} Mo ({len(sketch)} seaux)")
+    print(f"avant : {t_old * 1000:8.1f} ms (quantiles exacts sur l'historique)")
+    print(f"après : {t_new * 1000:8.1f} ms (dernier run fusionné) • erreur relative max {err:.2%}")
+
+
+if __name__ == "__main__":
+    main()
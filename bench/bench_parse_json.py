@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark parse_json_blocks : ancienne version (regex par script) vs extracteur en un passage
+    python bench/bench_parse_json.py [--repeat 5]
+Mesure ms/page sur les pages de data/html/ (ou des pages synthétiques).
+"""
+
+import re
+import json
+import time
+import argparse
+
+from synthetic import load_pages
+from scrapy.http import HtmlResponse
+
+from json_extract import json_blocks_from_root, orjson
+
+
+def parse_json_blocks_legacy(response):
+    """Copie de l'implémentation d'origine (src/spider.py avant l'extracteur dédié)."""
+    objs = []
+    for txt in response.css('script[type="application/ld+json"]::text, script[type="application/json"]::text').getall():
+        txt = (txt or "").strip()
+        if not txt:
+            continue
+        try:
+            objs.append(json.loads(txt))
+        except Exception:
+            pass
+    for raw in response.css("script::text").getall():
+        t = (raw or "").strip()
+        if not t:
+            continue
+        m = re.search(r"__NEXT_DATA__\s*=\s*({.*?});", t, flags=re.S)
+        if m:
+            try:
+                objs.append(json.loads(m.group(1)))
+            except Exception:
+                pass
+            continue
+        if "price" in t or "offers" in t or "address" in t or "geo" in t:
+            m2 = re.search(r"({.*})", t, flags=re.S)
+            if m2:
+                try:
+                    objs.append(json.loads(m2.group(1)))
+                except Exception:
+                    pass
+    return objs
+
+
+def bench(fn, responses, repeat):
+    best = float("inf")
+    found = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        found = sum(len(fn(r)) for r in responses)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000 / len(responses), found
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    pages = load_pages()
+    responses = [HtmlResponse(f"https://www.seloger.com/{name}", body=html.encode("utf-8"), encoding="utf-8")
+                 for name, html in pages]
+    for r in responses:  # arbre lxml construit une fois (comme dans le spider), hors mesure
+        r.selector.root
+
+    size_kb = sum(len(r.body) for r in responses) / len(responses) / 1024
+    print(f"{len(responses)} pages, {size_kb:.0f} Ko/page en moyenne, backend orjson={'oui' if orjson else 'non'}")
+    before, n1 = bench(parse_json_blocks_legacy, responses, args.repeat)
+    after, n2 = bench(lambda r: json_blocks_from_root(r.selector.root), responses, args.repeat)
+    print(f"avant : {before:8.2f} ms/page  ({n1} objets JSON)")
+    print(f"après : {after:8.2f} ms/page  ({n2} objets JSON)  → x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
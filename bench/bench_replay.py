@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de débit hors-ligne sur le magasin HTTP enregistré (src/replay.py)
+    HTTP_STORE_MODE=record scrapy runspider src/spider.py -O data/raw_data.json   # une fois, en ligne
+    python bench/bench_replay.py [--store data/http_store] [--crawl]
+- par défaut : ms/page par étape d'extraction (chargement, JSON embarqué, champs, fallback HTML)
+- --crawl    : crawl Scrapy complet en mode replay (même chemin parse_detail), pages/s
+Sans magasin, des pages synthétiques sont utilisées (déterministe, sans réseau).
+"""
+
+import os
+import time
+import argparse
+
+from synthetic import ROOT, load_pages
+
+
+def stage_bench(store_dir):
+    from scrapy.http import HtmlResponse
+    from replay import HttpStore
+    from spider import parse_json_blocks, extract_from_jsonobjs, fallback_from_html
+
+    store = HttpStore(store_dir)
+    urls = store.urls()
+    if urls:
+        loaders = [(u, lambda u=u: store.get(u)) for u in urls]
+        source = f"magasin {store_dir}"
+    else:
+        pages = load_pages()
+        loaders = [(f"https://www.seloger.com/{n}", lambda n=n, h=h: HtmlResponse(
+            f"https://www.seloger.com/{n}", body=h.encode("utf-8"), encoding="utf-8")) for n, h in pages]
+        source = "pages synthétiques"
+
+    stages = {"chargement": 0.0, "arbre lxml": 0.0, "json embarqué": 0.0, "champs": 0.0, "fallback html": 0.0}
+    t_all = time.perf_counter()
+    for _, load in loaders:
+        t = time.perf_counter(); resp = load(); stages["chargement"] += time.perf_counter() - t
+        t = time.perf_counter(); resp.selector.root; stages["arbre lxml"] += time.perf_counter() - t
+        t = time.perf_counter(); objs = parse_json_blocks(resp); stages["json embarqué"] += time.perf_counter() - t
+        t = time.perf_counter(); extract_from_jsonobjs(objs); stages["champs"] += time.perf_counter() - t
+        t = time.perf_counter(); fallback_from_html(resp); stages["fallback html"] += time.perf_counter() - t
+    total = time.perf_counter() - t_all
+
+    n = len(loaders)
+    print(f"{n} pages ({source}) : {n / total:.1f} pages/s, {total * 1000 / n:.2f} ms/page")
+    for name, secs in stages.items():
+        print(f"  {name:<14} {secs * 1000 / n:8.2f} ms/page")
+
+
+def crawl_bench(store_dir):
+    os.environ["HTTP_STORE_MODE"] = "replay"
+    os.environ["HTTP_STORE_DIR"] = store_dir
+    # pas de flux brut : le FEEDS par défaut du spider écraserait data/raw_data.jsonl (custom_settings,
+    # prioritaires sur les réglages passés à CrawlerProcess)
+    os.environ["RAW_FEED"] = ""
+    from scrapy.crawler import CrawlerProcess
+    from spider import SelogerSpider
+
+    process = CrawlerProcess({"LOG_LEVEL": "WARNING", "TELNETCONSOLE_ENABLED": False})
+    crawler = process.create_crawler(SelogerSpider)
+    process.crawl(crawler)
+    t = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - t
+    pages = crawler.stats.get_value("replay/hit", 0)
+    print(f"crawl replay : {pages} pages en {elapsed:.2f}s → {pages / max(elapsed, 1e-9):.1f} pages/s "
+          f"({crawler.stats.get_value('item_scraped_count', 0)} items)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", default=str(ROOT / "data" / "http_store"))
+    ap.add_argument("--crawl", action="store_true")
+    args = ap.parse_args()
+    if args.crawl:
+        crawl_bench(args.store)
+    else:
+        stage_bench(args.store)
+
+
+if __name__ == "__main__":
+    main()
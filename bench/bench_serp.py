@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark du mode SERP du spider (requêtes par annonce)
+    python bench/bench_serp.py [--n 2000] [--per-page 25] [--change 0.05]
+Site SeLoger synthétique en mémoire (pages de résultats avec __NEXT_DATA__ paginé, pages détail) ;
+~10 % des cartes sans nombre de pièces. Le spider est exécuté tel quel (start_requests, callbacks,
+état SQLite temporaire), les réponses venant du site synthétique au lieu du téléchargeur :
+- avant : CRAWL_MODE=detail, une requête par annonce à chaque run
+- après : CRAWL_MODE=serp ; 1er run = pages de résultats + détail des annonces nouvelles,
+  runs suivants = pages de résultats + détail des seules cartes incomplètes
+Le second run de chaque mode suit un changement de prix sur --change des annonces.
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+from collections import deque
+
+from scrapy.http import Request, HtmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import Deferred
+
+from synthetic import CITIES
+import spider
+import serp
+
+BASE = "https://www.seloger.com"
+SEARCH = BASE + "/list.htm?projects=2&types=1&places=idf"
+
+
+def make_site(n, seed=11):
+    rnd = random.Random(seed)
+    listings = []
+    for i in range(n):
+        city, zipcode = rnd.choice(CITIES)
+        rooms = rnd.randint(1, 6)
+        listings.append({"id": 260_000_000 + i * 7, "city": city, "zipcode": zipcode, "rooms": rooms,
+                         "surface": rnd.randint(15, 25) * rooms, "price": rnd.randint(150, 900) * 1000,
+                         "card_rooms": rnd.random() > 0.1})
+    return listings
+
+
+def detail_url(l):
+    return f"{BASE}/annonces/achat/appartement/{l['zipcode']}/{l['id']}.htm"
+
+
+def serp_page(listings, page, per_page):
+    chunk = listings[(page - 1) * per_page: page * per_page]
+    cards = [{"id": l["id"], "url": detail_url(l) + "?serp_view=list", "title": f"Appartement {l['rooms']} pièces",
+              "pricing": {"price": l["price"]}, "photos": [{"id": k, "src": "p.jpg"} for k in range(4)],
+              "property": {"surface": l["surface"], **({"rooms": l["rooms"]} if l["card_rooms"] else {})},
+              "address": {"city": l["city"], "postalCode": l["zipcode"]}} for l in chunk]
+    data = {"props": {"pageProps": {"search": {"page": page, "total": len(listings), "classifieds": cards},
+                                    "widgets": [{"id": k, "label": f"bloc {k}"} for k in range(50)]}}}
+    return (f'<html><head><title>Recherche</title><script id="__NEXT_DATA__">window.__NEXT_DATA__ = '
+            f'{json.dumps(data)};</script></head><body><h1>Achat appartement</h1></body></html>')
+
+
+def detail_page(l):
+    ld = {"@context": "https://schema.org", "@type": "Product", "name": f"Appartement {l['rooms']} pièces",
+          "offers": {"@type": "Offer", "price": l["price"], "priceCurrency": "EUR"}}
+    classified = {"id": l["id"], "pricing": {"price": l["price"]},
+                  "property": {"surface": l["surface"], "rooms": l["rooms"]},
+                  "address": {"city": l["city"], "postalCode": l["zipcode"]},
+                  "geo": {"latitude": 48.85, "longitude": 2.35}}
+    return (f'<html><head><script type="application/ld+json">{json.dumps(ld)}</script>'
+            f'<script id="__NEXT_DATA__">window.__NEXT_DATA__ = '
+            f'{json.dumps({"props": {"pageProps": {"classified": classified}}})};</script></head>'
+            "<body>" + "<div><p>Lorem ipsum</p></div>" * 200 + "</body></html>")
+
+
+def fetch(site, per_page, url):
+    """(statut, html) du site synthétique ; au-delà de la dernière page, la dernière est resservie
+    (comportement courant des SERP, le spider doit s'arrêter seul)."""
+    if url.startswith(SEARCH):
+        last = max(1, -(-len(site["listings"]) // per_page))
+        return 200, serp_page(site["listings"], min(serp.page_number(url), last), per_page)
+    l = site["by_url"].get(url)
+    return (200, detail_page(l)) if l else (404, "<html></html>")
+
+
+def settled(out):
+    """Sortie d'un callback ; un Deferred (état de crawl local : déjà déclenché) est déballé comme
+    le ferait Scrapy."""
+    if isinstance(out, Deferred):
+        got = []
+        out.addCallback(got.extend)
+        return got
+    return out or []
+
+
+def crawl(site, per_page, mode, state_db):
+    """Exécute le spider : start_requests puis callbacks, file FIFO, filtre de doublons comme Scrapy."""
+    spider.CRAWL_MODE, spider.STATE_DB = mode, state_db
+    sp = spider.SelogerSpider.from_crawler(get_crawler(spider.SelogerSpider))
+    queue, seen = deque(sp.start_requests()), set()
+    n_req = n_items = 0
+    t = time.perf_counter()
+    while queue:
+        req = queue.popleft()
+        if not req.dont_filter:
+            if req.url in seen:
+                continue
+            seen.add(req.url)
+        n_req += 1
+        status, html = fetch(site, per_page, req.url)
+        resp = HtmlResponse(req.url, status=status, body=html.encode("utf-8"), encoding="utf-8", request=req)
+        for out in settled(req.callback(resp, **req.cb_kwargs)):
+            if isinstance(out, Request):
+                queue.append(out)
+            else:
+                n_items += 1
+    sp.closed("finished")
+    return {"requests": n_req, "items": n_items, "secs": time.perf_counter() - t}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000)
+    ap.add_argument("--per-page", type=int, default=25)
+    ap.add_argument("--change", type=float, default=0.05)
+    args = ap.parse_args()
+
+    listings = make_site(args.n)
+    site = {"listings": listings, "by_url": {detail_url(l): l for l in listings}}
+    with tempfile.TemporaryDirectory() as tmp:
+        seeds, searches = os.path.join(tmp, "urls.txt"), os.path.join(tmp, "search_urls.txt")
+        with open(seeds, "w") as f:
+            f.writelines(detail_url(l) + "\n" for l in listings)
+        with open(searches, "w") as f:
+            f.write(SEARCH + "\n")
+        spider.URLS_PATH, spider.SEARCH_URLS = seeds, searches
+        spider.SERP_MAX_PAGES = args.n // args.per_page + 10  # toutes les pages, arrêt par le spider
+
+        runs = {m: [crawl(site, args.per_page, m, os.path.join(tmp, f"{m}.sqlite"))] for m in ("detail", "serp")}
+        changed = random.Random(3).sample(listings, int(len(listings) * args.change))
+        for l in changed:
+            l["price"] += 5000
+        for m in runs:
+            runs[m].append(crawl(site, args.per_page, m, os.path.join(tmp, f"{m}.sqlite")))
+
+    print(f"{args.n} annonces, {args.per_page} par page de résultats, {len(changed)} prix modifiés avant le 2e run")
+    for label, m in (("avant (detail)", "detail"), ("après (serp)  ", "serp")):
+        for k, r in enumerate(runs[m], 1):
+            print(f"{label} run {k} : {r['requests']:5d} requêtes ({r['requests'] / args.n:.2f}/annonce) • "
+                  f"{r['items']:5d} annonces émises • {r['secs']:.1f} s")
+    d, s = runs["detail"][1]["requests"], runs["serp"][1]["requests"]
+    print(f"run incrémental : x{d / max(s, 1):.1f} moins de requêtes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Pages SeLoger synthétiques pour les benchmarks (quand data/html/ est vide)
+- Page détail « Next.js » : gros __NEXT_DATA__, JSON-LD, scripts inline bruités
+- Les pages réelles enregistrées dans data/html/ sont toujours préférées
+"""
+
+import os
+import sys
+import json
+import random
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+HTML_DIR = ROOT / "data" / "html"
+CITIES = [("Paris", "75011"), ("Versailles", "78000"), ("Montreuil", "93100"),
+          ("Boulogne-Billancourt", "92100"), ("Créteil", "94000"), ("Cergy", "95000")]
+
+
+def detail_page(i: int, payload_kb: int = 400) -> str:
+    rnd = random.Random(i)
+    city, zipcode = rnd.choice(CITIES)
+    price, surface, rooms = rnd.randint(150, 900) * 1000, rnd.randint(20, 120), rnd.randint(1, 6)
+    ld = {
+        "@context": "https://schema.org", "@type": "Product",
+        "name": f"Appartement {rooms} pièces {surface} m² {city}",
+        "offers": {"@type": "Offer", "price": price, "priceCurrency": "EUR"},
+    }
+    # gros état Next.js : beaucoup de bruit + l'annonce enfouie profondément
+    noise = [{"id": k, "label": f"bloc {k}", "values": list(range(20)), "meta": {"a": {"b": {"c": k}}}}
+             for k in range(payload_kb * 3)]
+    next_data = {"props": {"pageProps": {"widgets": noise, "classified": {
+        "id": 240000000 + i, "title": ld["name"],
+        "pricing": {"price": price},
+        "property": {"surface": surface, "rooms": rooms},
+        "address": {"city": city, "postalCode": zipcode},
+        "geo": {"latitude": 48.85 + rnd.random() / 10, "longitude": 2.35 + rnd.random() / 10},
+    }}}}
+    inline = "window.dataLayer = window.dataLayer || []; var cfg = {price: 'x', offers: 1};" * 50
+    return (
+        "<html><head><title>SeLoger</title>"
+        f'<script type="application/ld+json">{json.dumps(ld, ensure_ascii=False)}</script>'
+        f"<script>{inline}</script>"
+        f'<script id="__NEXT_DATA__">window.__NEXT_DATA__ = {json.dumps(next_data)};</script>'
+        "</head><body>" + "<div><p>Lorem ipsum</p></div>" * 500 +
+        f"<h1>{ld['name']}</h1><span>{price:,} €</span></body></html>".replace(",", " ")
+    )
+
+
+def load_pages(pattern=(".html", ".htm"), n_synth: int = 30, factory=detail_page):
+    """[(nom, html)] : pages enregistrées si présentes, sinon `n_synth` pages synthétiques."""
+    pages = []
+    if HTML_DIR.is_dir():
+        for name in sorted(os.listdir(HTML_DIR)):
+            if name.lower().endswith(pattern):
+                pages.append((name, (HTML_DIR / name).read_text(encoding="utf-8", errors="ignore")))
+    if not pages:
+        pages = [(f"synthetic-{i}.html", factory(i)) for i in range(n_synth)]
+    return pages
@@ -1,180 +1,110 @@
 # -*- coding: utf-8 -*-
-import math
-import hashlib
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
 import numpy as np
 import pandas as pd
 import streamlit as st
 import pydeck as pdk
-import pgeocode  # requis dans requirements
-from pathlib import Path
+
+from data_layer import (DATASET_PATH, data_source, departements, load_changes, load_index, load_market_stats,
+                        md_links)
+from map_clusters import MIN_ZOOM, POINT_LIMIT, fit_zoom, layer_data, pick_zoom
 
 st.set_page_config(page_title="Île-de-France • appartements (SeLoger)", layout="wide")
 st.title("🏙️ Île-de-France • appartements (SeLoger)")
 
-# ---------- chemin robuste vers data/cleaned_data.csv ----------
-BASE_DIR = Path(__file__).resolve().parent.parent  # remonte de src/ vers la racine
-DATA_PATH = BASE_DIR / "data" / "cleaned_data.csv"
-if not DATA_PATH.exists():
+# ---------- données : data/cleaned/ (Parquet) ou data/cleaned_data.csv ----------
+source = data_source()
+if source is None:
     st.warning("Pas encore de données. Lance le scraping puis `python src/cleaner.py`.")
     st.stop()
 
-# ------------------ Chargement & hygiène ------------------
-df = pd.read_csv(DATA_PATH)
-
-for col in ["price_eur", "surface_m2", "price_per_m2", "latitude", "longitude", "rooms"]:
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-# Zip code propre : 5 chiffres + une version str pour l'affichage
-if "zipcode" in df.columns:
-    z = df["zipcode"].astype(str).fillna("")
-    z = z.replace(r"\D", "", regex=True).str[:5]
-    z = z.where(z.str.len() == 5, np.nan)
-    df["zipcode"] = pd.to_numeric(z, errors="coerce")
-    df["zipcode_str"] = z
+# ------------------ Chargement (mis en cache par version des données) ------------------
+if source == DATASET_PATH:
+    # seules les partitions des départements choisis sont lues
+    depts = departements(source)
+    sel_depts = st.multiselect("Départements", depts, default=depts,
+                               format_func=lambda d: "sans CP" if d == "00" else d)
+    index = load_index(source, depts=sel_depts)
 else:
-    df["zipcode"] = np.nan
-    df["zipcode_str"] = np.nan
-
-# ------------------ Compléter lat/lon par code postal ------------------
-LAT_MIN, LAT_MAX = 48.0, 49.3
-LON_MIN, LON_MAX = 1.45, 3.57
-
-def in_idf(lat, lon):
-    try:
-        return (
-            (lat is not None)
-            and (lon is not None)
-            and (LAT_MIN <= float(lat) <= LAT_MAX)
-            and (LON_MIN <= float(lon) <= LON_MAX)
-        )
-    except Exception:
-        return False
-
-# on marque les lignes sans coordonnées AVANT remplissage (pour savoir lesquelles viennent du CP)
-mask_missing = df["latitude"].isna() | df["longitude"].isna()
-df["_from_zip"] = mask_missing.copy()
-
-cand = df.loc[mask_missing, "zipcode_str"].dropna().unique()
-if cand.size > 0:
-    nomi = pgeocode.Nominatim("fr")
-    geo = nomi.query_postal_code(list(cand))
-    mapping = {
-        str(pc): (lat, lon)
-        for pc, lat, lon in zip(
-            geo["postal_code"].astype(str),
-            geo["latitude"],
-            geo["longitude"],
-        )
-        if pd.notna(lat) and pd.notna(lon)
-    }
-
-    def fill_row(row):
-        if (pd.isna(row["latitude"]) or pd.isna(row["longitude"])) and pd.notna(row["zipcode_str"]):
-            key = str(row["zipcode_str"])
-            if key in mapping:
-                lat, lon = mapping[key]
-                if pd.notna(lat) and pd.notna(lon) and in_idf(lat, lon):
-                    row["latitude"]  = float(lat)
-                    row["longitude"] = float(lon)
-        return row
-
-    df = df.apply(fill_row, axis=1)
-
-# ------------------ JITTER STABLE pour éviter les superpositions ------------------
-def jitter_stable(lat, lon, key, meters=120):
-    """
-    Décale (lat, lon) d'un petit rayon <= meters de manière déterministe selon `key`.
-    1° lat ≈ 111_111 m ; 1° lon ≈ 111_111 * cos(lat) m
-    """
-    try:
-        h = int(hashlib.sha1(str(key).encode("utf-8")).hexdigest(), 16)
-        angle = (h % 3600) / 3600.0 * 2 * math.pi
-        # rayon en mètres : entre 0.3*meters et 1.0*meters (évite un vrai 0)
-        radius = ((h // 3600) % 1000) / 1000.0
-        r = 0.3 * meters + 0.7 * meters * radius
-        dlat = r / 111_111.0 * math.cos(angle)
-        dlon = r / (111_111.0 * math.cos(math.radians(lat))) * math.sin(angle)
-        return lat + dlat, lon + dlon
-    except Exception:
-        return lat, lon
-
-# ne jitter que si : (1) coordonnées issues du CP ET (2) il y a >1 annonce sur ce CP
-if "_from_zip" in df.columns:
-    counts = (
-        df.loc[df["_from_zip"] & df["zipcode_str"].notna(), "zipcode_str"]
-          .map(df["zipcode_str"].value_counts())
-    )
-    df["_jitter_me"] = df["_from_zip"] & df["zipcode_str"].notna() & (counts > 1)
+    index = load_index(source)
+df = index.df  # partagé entre les reruns : ne pas modifier
 
-    def add_jitter(row):
-        if bool(row.get("_jitter_me")) and pd.notna(row["latitude"]) and pd.notna(row["longitude"]):
-            key = row.get("url") or row.get("title") or row.name
-            row["latitude"], row["longitude"] = jitter_stable(row["latitude"], row["longitude"], key)
-        return row
-
-    df = df.apply(add_jitter, axis=1)
-
-# on nettoie les colonnes techniques
-df = df.drop(columns=["_from_zip", "_jitter_me"], errors="ignore")
-
-# ------------------ Filtres ------------------
+# ------------------ Filtres (index construit une fois par version des données) ------------------
 c1, c2, c3 = st.columns(3)
 
 with c1:
-    if "price_eur" in df and df["price_eur"].notna().any():
-        pmin, pmax = float(df["price_eur"].min()), float(df["price_eur"].max())
+    if index.price.bounds():
+        pmin, pmax = index.price.bounds()
         r = st.slider("Prix (€)", pmin, pmax, (pmin, pmax))
     else:
         r = (0.0, 1e12)
 
 with c2:
-    if "surface_m2" in df and df["surface_m2"].notna().any():
-        smin, smax = float(df["surface_m2"].min()), float(df["surface_m2"].max())
+    if index.surface.bounds():
+        smin, smax = index.surface.bounds()
         s = st.slider("Surface (m²)", smin, smax, (smin, smax))
     else:
         s = (0.0, 1e6)
 
 with c3:
-    cities = sorted([c for c in df.get("city", pd.Series()).dropna().unique().tolist() if isinstance(c, str)])
+    cities = index.cities
     sel = st.multiselect("Villes", cities, default=cities[: min(5, len(cities))])
 
-mask = df["price_eur"].between(*r) & df["surface_m2"].between(*s)
-if sel:
-    mask &= df["city"].isin(sel)
-
-fdf = df[mask].copy()
+rows = index.query(price=r, surface=s, cities=sel)  # requête mise en cache par paramètres
+if "dup_first" in df.columns and not df["dup_first"].all():
+    if st.checkbox("Une annonce par bien (masquer les re-publications)"):
+        # première annonce de chaque bien parmi les lignes filtrées (pas dans tout le jeu : une
+        # re-publication qui passe les filtres reste visible même si la première n'y passe pas)
+        cl = df["dup_cluster"].to_numpy("float64", na_value=np.nan)[rows]
+        keep = np.isnan(cl)
+        grouped = np.flatnonzero(~keep)
+        keep[grouped[np.unique(cl[grouped], return_index=True)[1]]] = True
+        rows = rows[keep]
+fdf = df.iloc[rows]
 
 # ------------------ Carte ------------------
 st.subheader("🗺️ Carte")
 
-gdf = (
-    fdf.dropna(subset=["latitude", "longitude"])
-       .loc[lambda d: d.apply(lambda r: in_idf(r["latitude"], r["longitude"]), axis=1)]
-       .copy()
-)
-
-def fmt_k(v):
-    try:
-        return f"{int(round(float(v)/1000.0))}k€"
-    except Exception:
-        return ""
-
-gdf["price_label"] = gdf["price_eur"].apply(fmt_k)
+gdf = fdf[fdf["in_idf"]]
 
 st.caption(f"Annonces après filtres : {len(fdf)} • avec coordonnées en IDF : {len(gdf)}")
 
 if not gdf.empty:
+    # Au-delà de POINT_LIMIT annonces : cellules agrégées côté serveur (effectif + médiane €/m²),
+    # le zoom choisi fixe à la fois la vue et la taille des cellules
+    zoom = 10
+    if len(gdf) > POINT_LIMIT:
+        # zooms proposés : jusqu'au plus fin qui garde <= MAX_CELLS cellules
+        finest = pick_zoom(gdf["qx"], gdf["qy"])
+        zoom = st.select_slider("Niveau de détail (zoom)", options=list(range(MIN_ZOOM, finest + 1)),
+                                value=min(fit_zoom(gdf["latitude"], gdf["longitude"]), finest))
+    points, cells = layer_data(gdf, zoom)
+    if not cells.empty:
+        st.caption(f"{len(cells)} cellules agrégées • {len(points)} annonces isolées affichées en points")
+
     view = pdk.ViewState(
         latitude=float(gdf["latitude"].mean()),
         longitude=float(gdf["longitude"].mean()),
-        zoom=10,
+        zoom=zoom,
         pitch=0,
     )
 
+    cell_layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=cells,
+        get_position="[longitude, latitude]",
+        get_radius="radius",
+        radius_scale=40 * 2 ** (12 - zoom),  # rayon en mètres ~ constant à l'écran pour ce zoom
+        radius_min_pixels=6,
+        radius_max_pixels=40,
+        get_fill_color=[60, 140, 255, 160],
+        pickable=True,
+    )
+
     point_layer = pdk.Layer(
         "ScatterplotLayer",
-        data=gdf,
+        data=points,
         get_position="[longitude, latitude]",
         get_radius=70,
         radius_min_pixels=4,
@@ -186,7 +116,8 @@ if not gdf.empty:
     # IMPORTANT: deck.gl attend des constantes sous forme de chaînes JSON
     text_layer = pdk.Layer(
         "TextLayer",
-        data=gdf,
+        data=pd.concat([points[["longitude", "latitude", "price_label"]],
+                        cells[["longitude", "latitude", "price_label"]]], ignore_index=True),
         get_position="[longitude, latitude]",
         get_text="price_label",
         get_color=[255, 255, 255, 220],
@@ -200,28 +131,49 @@ if not gdf.empty:
         pdk.Deck(
             map_style="mapbox://styles/mapbox/dark-v11",
             initial_view_state=view,
-            layers=[point_layer, text_layer],
-            tooltip={"text": "{title}\n{price_eur} €  {surface_m2} m²\n{city} {zipcode_str}"},
+            layers=[cell_layer, point_layer, text_layer],
+            tooltip={"text": "{title}\n{detail}"},
         )
     )
 else:
     st.info("Aucun point avec coordonnées (latitude/longitude) en Île-de-France.")
 
-# ------------------ Tableau (numéroté à partir de 1) ------------------
+# ------------------ Tableau (paginé côté serveur, numéroté à partir de 1) ------------------
 st.subheader("📋 Tableau")
 
 cols_order = [
-    "title", "price_eur", "surface_m2", "price_per_m2",
-    "rooms", "city", "zipcode", "latitude", "longitude", "url"
+    "listing_id", "title", "price_eur", "surface_m2", "price_per_m2",
+    "rooms", "city", "zipcode", "latitude", "longitude", "url", "dup_cluster"
 ]
-show = fdf[[c for c in cols_order if c in fdf.columns]].reset_index(drop=True).copy()
-show.insert(0, "N°", range(1, len(show) + 1))
+cols = [c for c in cols_order if c in df.columns]
+SORT_LABELS = {"price_eur": "prix", "surface_m2": "surface", "price_per_m2": "€/m²",
+               "rooms": "pièces", "city": "ville", "zipcode": "code postal", "title": "titre"}
+
+p1, p2, p3, p4 = st.columns([2, 1, 1, 1])
+with p1:
+    sort = st.selectbox("Trier par", [None] + [c for c in SORT_LABELS if c in cols],
+                        format_func=lambda c: "ordre des annonces" if c is None else SORT_LABELS[c])
+with p2:
+    ascending = st.radio("Ordre", ["croissant", "décroissant"], horizontal=True) == "croissant"
+with p3:
+    page_size = st.selectbox("Lignes par page", [25, 50, 100, 200], index=1)
+n_pages = max(1, -(-len(rows) // page_size))
+with p4:
+    page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+
+# seules les lignes de la page sont triées/extraites et envoyées au navigateur
+page_rows = index.page(rows, sort=sort, ascending=ascending, page=int(page) - 1, size=page_size)
+first = (int(page) - 1) * page_size
+show = df.iloc[page_rows][cols].reset_index(drop=True)
+show.insert(0, "N°", range(first + 1, first + len(show) + 1))
+st.caption(f"Annonces {first + 1 if len(show) else 0}–{first + len(show)} sur {len(rows)}")
 
 st.dataframe(
     show,
     use_container_width=True,
     hide_index=True,
     column_config={
+        "listing_id":    st.column_config.NumberColumn("id",           format="%d"),
         "price_eur":     st.column_config.NumberColumn("prix (€)",     format="%.0f"),
         "surface_m2":    st.column_config.NumberColumn("surface (m²)", format="%.2f"),
         "price_per_m2":  st.column_config.NumberColumn("€/m²",         format="%.0f"),
@@ -229,11 +181,71 @@ st.dataframe(
         "zipcode":       st.column_config.NumberColumn("zipcode",      format="%.0f", step=1),
         "latitude":      st.column_config.NumberColumn("latitude",     format="%.5f"),
         "longitude":     st.column_config.NumberColumn("longitude",    format="%.5f"),
+        "dup_cluster":   st.column_config.NumberColumn("bien",         format="%d"),
     },
 )
 
-with st.expander("🔗 Ouvrir les annonces sélectionnées"):
-    for _, r in fdf.iterrows():
-        url = r.get("url")
-        if isinstance(url, str) and url.strip():
-            st.write(f"- [{r.get('title','Annonce')}]({url})")
\ No newline at end of file
+with st.expander("🔗 Ouvrir les annonces de la page"):
+    # un seul bloc markdown par page (au lieu d'un st.write par annonce)
+    st.markdown(md_links(show) or "_Aucun lien sur cette page._")
+
+# ------------------ Indicateurs de marché (esquisses incrémentales du cleaner) ------------------
+st.subheader("📈 Indicateurs de marché (€/m²)")
+
+stats = load_market_stats()
+if stats is None or stats.empty:
+    st.info("Pas encore d'indicateurs : ils sont produits par `python src/cleaner.py`.")
+else:
+    level = st.radio("Par", ["zipcode", "city"], horizontal=True,
+                     format_func=lambda v: "code postal" if v == "zipcode" else "commune")
+    lvl = stats[stats["level"] == level]
+    overall = lvl[lvl["period"] == "all"].sort_values("count", ascending=False)
+    st.dataframe(
+        overall[["key", "count", "p10", "median", "p90"]],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "key":    st.column_config.TextColumn("code postal" if level == "zipcode" else "commune"),
+            "count":  st.column_config.NumberColumn("annonces", format="%d",
+                                                    help="une fois par annonce, à sa dernière version"),
+            "p10":    st.column_config.NumberColumn("p10 €/m²",     format="%.0f"),
+            "median": st.column_config.NumberColumn("médiane €/m²", format="%.0f"),
+            "p90":    st.column_config.NumberColumn("p90 €/m²",     format="%.0f"),
+        },
+    )
+    keys = overall["key"].tolist()
+    picked = st.multiselect("Tendance (médiane par mois)", keys, default=keys[: min(5, len(keys))])
+    trend = lvl[(lvl["period"] != "all") & lvl["key"].isin(picked)]
+    if not trend.empty:
+        st.line_chart(trend.pivot(index="period", columns="key", values="median").sort_index())
+
+# ------------------ Changements récents (historique des annonces) ------------------
+st.subheader("🔔 Changements récents")
+
+KINDS = {"new": "nouvelle", "price_drop": "baisse de prix", "price_rise": "hausse de prix",
+         "delisted": "retirée", "relisted": "remise en ligne"}
+h1, h2 = st.columns([1, 3])
+with h1:
+    since_day = st.date_input("Depuis le", value=date.today() - timedelta(days=7))
+with h2:
+    kinds = st.multiselect("Types", list(KINDS), default=["price_drop", "delisted"], format_func=KINDS.get)
+since = datetime.combine(since_day, dtime.min, tzinfo=timezone.utc).timestamp()
+changes = load_changes(since, kinds)  # requête indexée par date, 500 lignes max
+if changes is None:
+    st.info("Pas encore d'historique : il est alimenté à chaque `python src/cleaner.py`.")
+elif changes.empty:
+    st.caption("Aucun changement sur la période.")
+else:
+    changes = changes.assign(kind=changes["kind"].map(KINDS))
+    st.dataframe(
+        changes[["at", "kind", "old_price", "new_price", "title", "city", "zipcode", "url"]],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "at":        st.column_config.DatetimeColumn("date", format="YYYY-MM-DD HH:mm"),
+            "kind":      "changement",
+            "old_price": st.column_config.NumberColumn("ancien prix (€)", format="%.0f"),
+            "new_price": st.column_config.NumberColumn("nouveau prix (€)", format="%.0f"),
+            "url":       st.column_config.LinkColumn("annonce"),
+        },
+    )
@@ -1,8 +1,30 @@
 # -*- coding: utf-8 -*-
-import os, json, pandas as pd, re
+import os, json, pandas as pd
 
-RAW = "data/raw_data.json"
-OUT = "data/cleaned_data.csv"
+try:  # décodage JSON plus rapide si disponible
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+import dataset
+import market_stats
+import near_dup
+from crawl_state import gone_ids
+from listing_history import HISTORY_DB, ListingHistory, require_history
+from listing_key import canonical_columns, with_keys
+from geoindex import geocode_zips
+
+RAW = "data/raw_data.jsonl"          # sortie par défaut du spider (JSON Lines)
+RAW_LEGACY = "data/raw_data.json"    # ancien format (liste JSON), toujours accepté
+OUT = "data/cleaned_data.csv"        # export CSV optionnel (EXPORT_CSV=1)
+OUT_DATASET = dataset.DATASET_DIR    # sortie principale : Parquet partitionné par département
+EXPORT_CSV = os.getenv("EXPORT_CSV", "0") == "1"
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "50000"))  # annonces par lot de nettoyage
+# Crawl incrémental : raw_data ne contient que les annonces nouvelles/modifiées,
+# on les fusionne dans la sortie existante au lieu de tout retraiter
+INCREMENTAL = os.getenv("INCREMENTAL", "1") == "1"
+STATE_DB = os.getenv("STATE_DB", "data/crawl_state.sqlite")  # retraits (404/410) vus par le spider
 
 LAT_MIN, LAT_MAX = 48.0, 49.3
 LON_MIN, LON_MAX = 1.45, 3.57
@@ -16,8 +38,83 @@ def in_idf(lat, lon):
         return False
 
 
+def raw_path():
+    """Fichier brut à lire : RAW (env) sinon JSONL, sinon l'ancien raw_data.json."""
+    if os.getenv("RAW"):
+        return os.getenv("RAW")
+    return RAW if os.path.exists(RAW) or not os.path.exists(RAW_LEGACY) else RAW_LEGACY
+
+
+def _records_in_line(line):
+    """Annonces (dicts) contenues dans une ligne : objet, liste, ou blocs collés {..}{..}."""
+    try:  # cas courant : une annonce JSON Lines
+        obj = _loads(line)
+        if type(obj) is dict and not isinstance(obj.get("items"), list):
+            return (obj,)
+    except ValueError:
+        pass
+    line = line.strip().rstrip(",")
+    if not line or line in ("[", "]"):
+        return []
+    try:
+        objs = [_loads(line)]
+    except ValueError:
+        # blocs concaténés sur une même ligne
+        objs, pos, dec = [], 0, json.JSONDecoder()
+        while pos < len(line):
+            try:
+                obj, pos = dec.raw_decode(line, pos)
+            except ValueError:
+                return None
+            objs.append(obj)
+            while pos < len(line) and line[pos] in " ,\t":
+                pos += 1
+    out = []
+    for obj in objs:
+        if isinstance(obj, dict) and isinstance(obj.get("items"), list):
+            obj = obj["items"]
+        if isinstance(obj, list):
+            out.extend(o for o in obj if isinstance(o, dict))
+        elif isinstance(obj, dict):
+            out.append(obj)
+        else:
+            return None
+    return out
+
+
 def load_raw(path):
-    """Charge raw_data en gérant:
+    """Générateur d'annonces, ligne par ligne (mémoire constante) :
+       - JSON Lines (sortie par défaut du spider)
+       - JSON liste écrit par Scrapy (-O x.json : une annonce par ligne)
+    Si aucune ligne n'est lisible (JSON indenté, blocs multi-lignes...), on
+    bascule sur l'ancien chargement complet load_raw_legacy."""
+    if not os.path.exists(path):
+        return
+    n = 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            recs = _records_in_line(line)
+            if recs:
+                n += len(recs)
+                yield from recs
+    if n == 0:
+        yield from load_raw_legacy(path)
+
+
+def iter_batches(records, size=BATCH_SIZE):
+    """Regroupe un flux d'annonces en lots de `size`."""
+    batch = []
+    for r in records:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_raw_legacy(path):
+    """Chargement complet en mémoire (chemin de secours) en gérant:
        - JSON liste standard
        - JSON Lines (une annonce par ligne)
        - Plusieurs blocs JSON concaténés par erreur"""
@@ -59,95 +156,212 @@ def load_raw(path):
             return data
     except Exception:
         pass
-    raise SystemExit("Impossible de parser data/raw_data.json (format corrompu). Supprime-le et relance le spider avec -O.")
+    raise SystemExit(f"Impossible de parser {path} (format corrompu). Supprime-le et relance le spider avec -O.")
 
 
-def main():
-    data = load_raw(RAW)
+def load_previous(path=OUT_DATASET, csv_path=OUT):
+    """Dernière sortie du cleaner : jeu Parquet, sinon ancien CSV, sinon None.
+    Les sorties d'avant les ids canoniques reçoivent listing_id et des URLs propres."""
+    if dataset.exists(path):
+        return with_keys(dataset.read_all(path))
+    if os.path.exists(csv_path) and os.path.getsize(csv_path) > 0:
+        return with_keys(pd.read_csv(csv_path, dtype={"zipcode": "string"}))
+    return None
 
-    rows = []
-    for d in data:
-        price = d.get("price")
-        surface = d.get("surface_m2")
-        lat = d.get("latitude"); lon = d.get("longitude")
 
-        # prix/surface minimums requis
-        if price is None or surface in (None, 0, "", "0"):
-            continue
+def drop_gone(old, gone):
+    """Sortie précédente sans les annonces retirées (`gone` : ids texte, cf. crawl_state.gone_ids)."""
+    if old is None or old.empty or not gone or "listing_id" not in old:
+        return old
+    ids = pd.to_numeric(old["listing_id"], errors="coerce").astype("Int64").astype("string")
+    out = old[~ids.isin(gone).fillna(False).to_numpy()]
+    if len(out) < len(old):
+        print(f"Retraits : {len(old) - len(out)} annonces retirées (404/410) sorties du jeu.")
+    return out
 
-        try:
-            price = float(str(price).replace(" ", "").replace(",", ".").replace("€", ""))
-            surface = float(str(surface).replace(",", "."))
-            if surface <= 0:
-                continue
-        except Exception:
-            continue
 
-        # --- ZIP: ne garder que les chiffres, forcer 5 caractères ---
-        zip_raw = str(d.get("zipcode") or "")
-        zip_digits = re.sub(r"\D", "", zip_raw)  # enlève virgules, espaces, etc.
-        zipcode = zip_digits[:5] if len(zip_digits) >= 5 else None  # string propre
-
-        # coordonnées présentes et dans l'IDF ?
-        ok_geo = lat not in (None, "") and lon not in (None, "") and in_idf(lat, lon)
-
-        rows.append({
-            "title": d.get("title"),
-            "price_eur": round(price, 2),
-            "surface_m2": round(surface, 2),
-            "price_per_m2": round(price / surface, 2) if surface else None,
-            "rooms": d.get("rooms"),
-            "city": d.get("city"),
-            "zipcode": zipcode,  # string sans virgule/point
-            "latitude": float(lat) if ok_geo else None,
-            "longitude": float(lon) if ok_geo else None,
-            "url": d.get("url"),
-        })
-
-    df = pd.DataFrame(rows)
+def merge_previous(df, old, gone=()):
+    """Remplace dans la sortie précédente les annonces présentes dans `df` (même listing_id) et
+    retire celles que le spider a vues répondre 404/410 (`gone`)."""
+    old = drop_gone(old, gone)
+    if old is None or old.empty or "listing_id" not in old:
+        return df
+    new_ids = df["listing_id"].dropna().unique() if not df.empty else []
+    keep = old[~old["listing_id"].isin(new_ids)]
+    print(f"Incrémental : {len(df)} lignes nouvelles/modifiées, {len(keep)} reprises de la sortie existante.")
+    return pd.concat([keep, df], ignore_index=True) if not df.empty else keep
+
+
+def drop_duplicate_listings(df):
+    """Une ligne par listing_id (la dernière, donc la plus récente) ; (url, title) pour les lignes sans id."""
+    if df.empty:
+        return df
+    has_id = df["listing_id"].notna()
+    dup = (has_id & df.duplicated("listing_id", keep="last")) | (~has_id & df.duplicated(["url", "title"]))
+    return df[~dup].reset_index(drop=True)
+
+
+RAW_FIELDS = ["title", "price", "surface_m2", "rooms", "city", "zipcode", "latitude", "longitude", "url"]
+OUT_COLUMNS = ["listing_id", "title", "price_eur", "surface_m2", "price_per_m2", "rooms", "city", "zipcode",
+               "latitude", "longitude", "url"]
+
+
+def to_float(s, strip=()):
+    """Colonne -> float64 (NaN si illisible). Les valeurs déjà numériques passent par
+    to_numeric ; seules les chaînes restantes sont nettoyées (caractères `strip`, ',' -> '.')."""
+    num = pd.to_numeric(s, errors="coerce")
+    todo = num.isna() & s.notna()
+    if todo.any():
+        txt = s[todo].astype(str)
+        for ch in strip:
+            txt = txt.str.replace(ch, "", regex=False)
+        num[todo] = pd.to_numeric(txt.str.replace(",", ".", regex=False), errors="coerce")
+    return num.astype("float64")
+
+
+def clean_zip(s):
+    """Ne garder que les chiffres, 5 premiers caractères ; None si moins de 5 chiffres.
+    Peu de valeurs distinctes : on nettoie les modalités (factorize) puis on redistribue."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    u = pd.Series(uniques, dtype=object)
+    u = u.where(u.notna() & (u != "") & (u != 0), "").astype(str).str.replace(r"\D", "", regex=True)
+    u = u.str[:5].where(u.str.len() >= 5).astype("string")
+    out = u.take(codes.clip(min=0)).where(codes >= 0) if len(u) else pd.Series(pd.NA, index=s.index)
+    return pd.Series(out.to_numpy(), index=s.index, dtype="string")
+
+
+def idf_mask(lat, lon):
+    """Masque booléen « dans la bbox Île-de-France » (NaN -> False)."""
+    return lat.between(LAT_MIN, LAT_MAX) & lon.between(LON_MIN, LON_MAX)
+
+
+def clean_records(records):
+    """Nettoie un lot d'annonces brutes -> DataFrame (une ligne par annonce valide).
+    Opérations colonne par colonne : pas de boucle Python par annonce."""
+    records = list(records)
+    raw = pd.DataFrame({k: [d.get(k) for d in records] for k in RAW_FIELDS}, dtype=object)
+    if raw.empty:
+        return pd.DataFrame(columns=OUT_COLUMNS)
+
+    price = to_float(raw["price"], strip=(" ", "€"))
+    surface = to_float(raw["surface_m2"])
+    # prix/surface minimums requis
+    keep = price.notna() & (surface > 0)
+    raw, price, surface = raw[keep], price[keep], surface[keep]
+
+    # coordonnées présentes et dans l'IDF ?
+    lat, lon = to_float(raw["latitude"]), to_float(raw["longitude"])
+    ok_geo = idf_mask(lat, lon)
+
+    ids, urls = canonical_columns(raw["url"])  # clé de l'annonce (id SeLoger) + URL sans query de tracking
+    df = pd.DataFrame({
+        "listing_id": ids,
+        "title": raw["title"],
+        "price_eur": price.round(2),
+        "surface_m2": surface.round(2),
+        "price_per_m2": (price / surface).round(2),
+        "rooms": raw["rooms"],
+        "city": raw["city"],
+        "zipcode": clean_zip(raw["zipcode"]),  # string sans virgule/point
+        "latitude": lat.where(ok_geo),
+        "longitude": lon.where(ok_geo),
+        "url": urls,
+    })
+    return df.reset_index(drop=True)
+
+
+def normalize(df):
+    """Types, géocodage par code postal et filtre ÎDF d'un lot nettoyé (cleaner et pipeline en flux)."""
+    if df.empty:
+        return df
 
     # Normalisation des types
+    # zipcode en string
+    df["zipcode"] = df["zipcode"].astype("string")
+    # prix/surface/€/m² numériques
+    for col in ["price_eur", "surface_m2", "price_per_m2"]:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    # -------------------------------------------------------------
+    # Géocodage par code postal (index local src/geoindex.py, sinon pgeocode)
+    # -------------------------------------------------------------
+    try:
+        # On ne géocode que les lignes sans coords
+        need_geo = df["latitude"].isna() | df["longitude"].isna()
+        if need_geo.any():
+            lat, lon = geocode_zips(df.loc[need_geo, "zipcode"].fillna(""))
+            # Convertir colonnes lat/lon en numérique
+            df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
+            df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
+            # Remplir les NA par le géocodage
+            df.loc[need_geo, "latitude"] = df.loc[need_geo, "latitude"].fillna(pd.Series(lat, index=df.index[need_geo]))
+            df.loc[need_geo, "longitude"] = df.loc[need_geo, "longitude"].fillna(pd.Series(lon, index=df.index[need_geo]))
+    except Exception as e:
+        print("Géocodage ignoré (erreur):", e)
+
+    # Filtrer les coordonnées hors IDF (on les met à NaN)
+    if "latitude" in df and "longitude" in df:
+        lat = pd.to_numeric(df["latitude"], errors="coerce")
+        lon = pd.to_numeric(df["longitude"], errors="coerce")
+        mask_idf = idf_mask(lat, lon)
+        df["latitude"], df["longitude"] = lat.where(mask_idf), lon.where(mask_idf)
+    return df
+
+
+def publish(df):
+    """Sortie finale : dédoublonnage, re-publications, Parquet partitionné + CSV optionnel."""
+    # Drop final (anciennes sorties : une annonce a pu y être enregistrée sous plusieurs URLs)
+    df = drop_duplicate_listings(df)
+
+    # Re-publications (même bien sous plusieurs listing_id) : grappes sur tout le jeu, blocage + MinHash/LSH
     if not df.empty:
-        # zipcode en string
-        df["zipcode"] = df["zipcode"].astype("string")
-        # prix/surface/€/m² numériques
-        for col in ["price_eur", "surface_m2", "price_per_m2"]:
-            if col in df:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # -------------------------------
-    # Géocodage via pgeocode (France)
-    # -------------------------------
-    if not df.empty:
+        df["dup_cluster"] = near_dup.dup_clusters(df)
+        print(f"Re-publications : {len(df)} annonces, {df['dup_cluster'].nunique()} biens distincts.")
+
+    # Export Parquet (schéma typé, une partition par département) + CSV optionnel
+    dataset.write(df, OUT_DATASET)
+    print(f"Wrote {OUT_DATASET}/ with {len(df)} rows ({len(dataset.departements(OUT_DATASET))} départements).")
+    if EXPORT_CSV:
+        df.to_csv(OUT, index=False, encoding="utf-8")
+        print(f"Wrote {OUT} with {len(df)} rows.")
+    return df
+
+
+def main():
+    require_history(HISTORY_DB, STATE_DB)
+    # lecture en flux, nettoyage par lots de BATCH_SIZE annonces
+    frames = [clean_records(batch) for batch in iter_batches(load_raw(raw_path()))]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    # avant indicateurs et historique : une annonce vue via plusieurs recherches ne compte qu'une fois
+    df = normalize(drop_duplicate_listings(df))
+
+    # Historique : upsert des annonces du run + retraits vus par le spider (404/410) ; les indicateurs
+    # de marché (comptés par annonce) lisent d'abord la version précédente des annonces du run
+    if HISTORY_DB:
         try:
-            import pgeocode
-            # On ne géocode que les lignes sans coords
-            need_geo = df["latitude"].isna() | df["longitude"].isna()
-            if need_geo.any():
-                nomi = pgeocode.Nominatim("fr")
-                z = df.loc[need_geo, "zipcode"].fillna("").astype(str)
-                if len(z):
-                    geo = nomi.query_postal_code(z)
-                    # Convertir colonnes lat/lon en numérique
-                    df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
-                    df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
-                    # Remplir les NA par le géocodage
-                    df.loc[need_geo, "latitude"] = df.loc[need_geo, "latitude"].fillna(geo["latitude"].values)
-                    df.loc[need_geo, "longitude"] = df.loc[need_geo, "longitude"].fillna(geo["longitude"].values)
+            history = ListingHistory(HISTORY_DB)
+            if not df.empty:
+                try:
+                    previous = history.previous(df["listing_id"])
+                    market_stats.update(df, previous, source=market_stats.file_fingerprint(raw_path()))
+                except Exception as e:
+                    print("Indicateurs de marché ignorés (erreur):", e)
+            counts = history.upsert(df)
+            counts["delisted"] = history.sync_gone(STATE_DB)
+            history.close()
+            print("Historique :", ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
         except Exception as e:
-            print("Géocodage pgeocode ignoré (erreur):", e)
-
-    # Filtrer les coordonnées hors IDF (on les met à NaN)
-    if not df.empty and "latitude" in df and "longitude" in df:
-        mask_idf = df.apply(lambda r: in_idf(r["latitude"], r["longitude"]), axis=1)
-        df.loc[~mask_idf, ["latitude", "longitude"]] = pd.NA
+            print("Historique ignoré (erreur):", e)
+    else:
+        print("Indicateurs de marché ignorés : comptés par annonce, ils demandent l'historique (HISTORY_DB).")
 
-    # Drop/tri final
-    df = df.drop_duplicates(subset=["url", "title"])
+    # Fusion incrémentale : les anciennes lignes non modifiées sont reprises telles quelles,
+    # sauf les annonces retirées
+    if INCREMENTAL:
+        df = merge_previous(df, load_previous(), gone_ids(STATE_DB))
 
-    # Export CSV
-    df.to_csv(OUT, index=False, encoding="utf-8")
-    print(f"Wrote {OUT} with {len(df)} rows.")
+    publish(df)
 
 
 if __name__ == "__main__":
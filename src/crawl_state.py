@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+État de crawl persistant (SQLite) pour le crawl incrémental
+- Une ligne par annonce, clé = id SeLoger canonique (listing_key.listing_id, en texte)
+- Mémorise : dernier fetch, ETag / Last-Modified, empreinte du contenu extrait
+- Sert au spider pour les requêtes conditionnelles et pour sauter les annonces inchangées
+- État partagé entre workers (shared=True) : écritures appelables depuis un thread (le spider les passe
+  au pool de Twisted), une transaction par lot ; lectures du reactor sur une connexion à part, qui
+  n'attend jamais le verrou d'écriture d'un autre worker
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+
+from listing_key import LISTING_ID_RE, listing_id  # noqa: F401  (ré-export)
+
+GONE_STATUSES = (404, 410)  # annonce retirée
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id    TEXT PRIMARY KEY,
+    url           TEXT,
+    last_fetch    REAL,
+    last_status   INTEGER,
+    etag          TEXT,
+    last_modified TEXT,
+    content_hash  TEXT,
+    changed_at    REAL
+)
+"""
+
+
+def listing_id_from_url(url: str):
+    """Clé texte de l'annonce (id canonique, cf. listing_key), None sans URL."""
+    lid = listing_id(url)
+    return None if lid is None else str(lid)
+
+
+def content_hash(item: dict) -> str:
+    """Empreinte des champs extraits (hors URL et id, dérivés de l'adresse de la page)."""
+    payload = {k: v for k, v in item.items() if k not in ("url", "listing_id")}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def gone_ids(path: str) -> set:
+    """Ids (texte) des annonces dont le dernier fetch a répondu 404/410 ; vide sans état de crawl."""
+    if not path or not os.path.exists(path):
+        return set()
+    src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return {r[0] for r in src.execute(
+            f"SELECT listing_id FROM listings WHERE last_status IN ({', '.join('?' for _ in GONE_STATUSES)})",
+            GONE_STATUSES)}
+    except sqlite3.OperationalError:  # état vide / sans table
+        return set()
+    finally:
+        src.close()
+
+
+def _serialized(method):
+    """Méthode d'écriture appelable depuis n'importe quel thread : une à la fois sur la connexion."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class CrawlState:
+    def __init__(self, path: str, commit_every: int = 200, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        # partagé : attente du verrou d'écriture (autres workers) dans un thread, jamais sur le reactor
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+        # lectures du reactor : en WAL, une connexion de lecture voit le dernier état validé sans attendre
+        self.reader = sqlite3.connect(path, check_same_thread=False) if shared else self.conn
+        self.commit_every = commit_every
+        self._pending = 0
+
+    def get(self, listing_id: str):
+        return self._get(self.reader, listing_id)
+
+    @staticmethod
+    def _get(conn, listing_id: str):
+        row = conn.execute(
+            "SELECT url, last_fetch, last_status, etag, last_modified, content_hash, changed_at "
+            "FROM listings WHERE listing_id = ?", (listing_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("url", "last_fetch", "last_status", "etag", "last_modified", "content_hash", "changed_at")
+        return dict(zip(keys, row))
+
+    def conditional_headers(self, row) -> dict:
+        headers = {}
+        if row and row.get("etag"):
+            headers["If-None-Match"] = row["etag"]
+        if row and row.get("last_modified"):
+            headers["If-Modified-Since"] = row["last_modified"]
+        return headers
+
+    @_serialized
+    def record(self, listing_id, url, status, etag=None, last_modified=None, chash=None):
+        """Enregistre un fetch. Renvoie True si le contenu a changé (ou est nouveau), ou si l'annonce
+        revient après un 404/410 : même inchangée, elle doit repasser par l'historique (remise en ligne)."""
+        changed = self._record(listing_id, url, status, etag, last_modified, chash)
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+        return changed
+
+    @_serialized
+    def record_many(self, rows) -> list:
+        """record() de chaque ligne (listing_id, url, status, etag, last_modified, chash) ; une seule
+        validation pour le lot au plus. Renvoie les indicateurs de changement, dans l'ordre."""
+        changed = [self._record(*row) for row in rows]
+        self._pending += len(changed)
+        if self._pending >= self.commit_every:
+            self.commit()
+        return changed
+
+    def _record(self, listing_id, url, status, etag=None, last_modified=None, chash=None):
+        now = time.time()
+        row = self._get(self.conn, listing_id)
+        back = row is not None and row.get("last_status") in GONE_STATUSES and status not in GONE_STATUSES
+        changed = chash is not None and (row is None or back or row.get("content_hash") != chash)
+        if status in GONE_STATUSES:
+            # annonce retirée : plus de validateurs ni d'empreinte, son retour sera vu comme un changement
+            self.conn.execute(
+                "UPDATE listings SET etag = NULL, last_modified = NULL, content_hash = NULL WHERE listing_id = ?",
+                (listing_id,))
+        if row is None:
+            self.conn.execute(
+                "INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (listing_id, url, now, status, etag, last_modified, chash, now if changed else None),
+            )
+        else:
+            self.conn.execute(
+                "UPDATE listings SET url = ?, last_fetch = ?, last_status = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), "
+                "content_hash = COALESCE(?, content_hash), "
+                "changed_at = CASE WHEN ? THEN ? ELSE changed_at END "
+                "WHERE listing_id = ?",
+                (url, now, status, etag, last_modified, chash, changed, now, listing_id),
+            )
+        return changed
+
+    @_serialized
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    @_serialized
+    def close(self):
+        self.commit()
+        if self.reader is not self.conn:
+            self.reader.close()
+        self.conn.close()
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Couche données du dashboard Streamlit
+- Source : jeu Parquet data/cleaned/ (colonnes projetées, départements choisis seulement),
+  sinon l'export CSV data/cleaned_data.csv
+- Chargement + hygiène + géocodage CP + jitter, faits une fois par version des données
+- Version = (mtime, taille, empreinte des fichiers) : le cache Streamlit est invalidé
+  dès que le cleaner réécrit ses sorties, et seulement dans ce cas
+- Les reruns (slider, multiselect...) ne paient plus que le filtrage, via un index
+  (filter_index.FilterIndex) construit une fois par version et partagé sans copie
+- Index spatial de la carte (qx, qy : tuiles Web Mercator) calculé ici, une fois
+"""
+
+import os
+import math
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import dataset
+from listing_key import with_keys
+from filter_index import FilterIndex
+from geoindex import geocode_zips
+from listing_history import ListingHistory
+from map_clusters import quad_xy
+
+BASE_DIR = Path(__file__).resolve().parent.parent  # remonte de src/ vers la racine
+DATASET_PATH = BASE_DIR / dataset.DATASET_DIR
+DATA_PATH = BASE_DIR / "data" / "cleaned_data.csv"
+STATS_PATH = BASE_DIR / "data" / "market_stats.csv"  # indicateurs de marché (market_stats)
+HISTORY_PATH = BASE_DIR / "data" / "listing_history.sqlite"  # historique des annonces (listing_history)
+# colonnes lues par l'app (projection au scan Parquet)
+APP_COLUMNS = ["listing_id", "title", "price_eur", "surface_m2", "price_per_m2", "rooms", "city", "zipcode",
+               "latitude", "longitude", "url", "dup_cluster"]
+
+LAT_MIN, LAT_MAX = 48.0, 49.3
+LON_MIN, LON_MAX = 1.45, 3.57
+
+
+# ---------- Version des données ----------
+@lru_cache(maxsize=16)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    """Empreinte du fichier, recalculée seulement si mtime/taille changent."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def data_version(path=DATA_PATH) -> str:
+    """Version d'un fichier ou d'un dossier Parquet (tous ses fichiers)."""
+    paths = dataset.files(path) if os.path.isdir(path) else [path]
+    parts = []
+    for p in paths:
+        st_ = os.stat(p)
+        parts.append(f"{p}:{st_.st_mtime_ns}-{st_.st_size}-{_file_hash(str(p), st_.st_mtime_ns, st_.st_size)}")
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def data_source():
+    """Source à afficher : jeu Parquet si présent, sinon CSV, sinon None."""
+    if dataset.exists(DATASET_PATH):
+        return DATASET_PATH
+    if DATA_PATH.exists():
+        return DATA_PATH
+    return None
+
+
+def departements(path=DATASET_PATH):
+    return dataset.departements(path)
+
+
+# ---------- Helpers ----------
+def in_idf(lat, lon):
+    try:
+        return (
+            (lat is not None)
+            and (lon is not None)
+            and (LAT_MIN <= float(lat) <= LAT_MAX)
+            and (LON_MIN <= float(lon) <= LON_MAX)
+        )
+    except Exception:
+        return False
+
+
+def jitter_stable(lat, lon, key, meters=120):
+    """
+    Décale (lat, lon) d'un petit rayon <= meters de manière déterministe selon `key`.
+    1° lat ≈ 111_111 m ; 1° lon ≈ 111_111 * cos(lat) m
+    """
+    try:
+        h = int(hashlib.sha1(str(key).encode("utf-8")).hexdigest(), 16)
+        angle = (h % 3600) / 3600.0 * 2 * math.pi
+        # rayon en mètres : entre 0.3*meters et 1.0*meters (évite un vrai 0)
+        radius = ((h // 3600) % 1000) / 1000.0
+        r = 0.3 * meters + 0.7 * meters * radius
+        dlat = r / 111_111.0 * math.cos(angle)
+        dlon = r / (111_111.0 * math.cos(math.radians(lat))) * math.sin(angle)
+        return lat + dlat, lon + dlon
+    except Exception:
+        return lat, lon
+
+
+# sha1(clé) mod 3_600_000 suffit : angle = h % 3600, rayon = (h // 3600) % 1000
+_JITTER_MOD = 3600 * 1000
+# cos/sin des 3600 angles possibles, calculés par `math` comme jitter_stable (mêmes bits)
+_ANGLES = [k / 3600.0 * 2 * math.pi for k in range(3600)]
+_COS = np.array([math.cos(a) for a in _ANGLES])
+_SIN = np.array([math.sin(a) for a in _ANGLES])
+
+
+def jitter_keys(df: pd.DataFrame) -> np.ndarray:
+    """Clé de jitter par ligne : url, sinon titre, sinon index (même règle « or » que l'ancien apply)."""
+    n = len(df)
+    urls = df["url"].tolist() if "url" in df.columns else [None] * n
+    titles = df["title"].tolist() if "title" in df.columns else [None] * n
+    return np.array([u or t or i for u, t, i in zip(urls, titles, df.index)], dtype=object)
+
+
+def jitter_stable_many(lat, lon, keys, meters=120):
+    """Version tableaux de jitter_stable : mêmes décalages au bit près pour les mêmes clés.
+    Seul le SHA-1 reste par clé (hashlib, en C) ; le grand entier est remplacé par un
+    modulo de Horner sur les 20 octets du condensat."""
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    digests = b"".join(hashlib.sha1(str(k).encode("utf-8")).digest() for k in keys)
+    octets = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 20).astype(np.int64)
+    h = np.zeros(len(octets), dtype=np.int64)
+    for col in octets.T:
+        h = (h * 256 + col) % _JITTER_MOD
+
+    a = h % 3600
+    radius = ((h // 3600) % 1000) / 1000.0
+    r = 0.3 * meters + 0.7 * meters * radius
+    # cos(lat) via math sur les latitudes distinctes (peu nombreuses : centres de CP)
+    ulat, inv = np.unique(lat, return_inverse=True)
+    cos_lat = np.array([math.cos(math.radians(v)) for v in ulat])[inv]
+    dlat = r / 111_111.0 * _COS[a]
+    dlon = r / (111_111.0 * cos_lat) * _SIN[a]
+    return lat + dlat, lon + dlon
+
+
+def idf_mask(lat, lon) -> np.ndarray:
+    """Version tableaux de in_idf (NaN -> False)."""
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    return (lat >= LAT_MIN) & (lat <= LAT_MAX) & (lon >= LON_MIN) & (lon <= LON_MAX)
+
+
+def fmt_k(prices: pd.Series) -> pd.Series:
+    """Étiquette « 350k€ » (chaîne vide si prix absent)."""
+    k = (prices / 1000.0).round()
+    return k.map(lambda v: f"{int(v)}k€" if pd.notna(v) else "")
+
+
+_MD_ESCAPE = str.maketrans({"[": r"\[", "]": r"\]"})
+
+
+def md_links(df: pd.DataFrame) -> str:
+    """Liste markdown « - [titre](url) » des lignes qui ont une URL (crochets du titre échappés)."""
+    n = len(df)
+    titles = df["title"].tolist() if "title" in df.columns else [None] * n
+    urls = df["url"].tolist() if "url" in df.columns else [None] * n
+    lines = []
+    for t, u in zip(titles, urls):
+        if isinstance(u, str) and u.strip():
+            t = t if isinstance(t, str) and t else "Annonce"
+            lines.append(f"- [{t.translate(_MD_ESCAPE)}]({u})")
+    return "\n".join(lines)
+
+
+# ---------- Préparation ----------
+def prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Hygiène des colonnes, coordonnées par code postal, jitter des points superposés."""
+    for col in ["price_eur", "surface_m2", "price_per_m2", "latitude", "longitude", "rooms"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    for col in ["latitude", "longitude"]:  # float32 côté Parquet -> calculs en float64
+        df[col] = df[col].astype("float64")
+
+    # Zip code propre : 5 chiffres + une version str pour l'affichage
+    # (peu de codes distincts : regex sur les modalités seulement)
+    if "zipcode" in df.columns:
+        codes, uniques = pd.factorize(df["zipcode"])
+        u = pd.Series(np.asarray(uniques, dtype=object)).astype(str)
+        u = u.replace(r"\D", "", regex=True).str[:5]
+        u = u.where(u.str.len() == 5, np.nan)
+        z = pd.Series(u.to_numpy(dtype=object)[codes], index=df.index).where(codes >= 0, np.nan)
+        df["zipcode"] = pd.to_numeric(z, errors="coerce")
+        df["zipcode_str"] = z
+    else:
+        df["zipcode"] = np.nan
+        df["zipcode_str"] = np.nan
+
+    # on marque les lignes sans coordonnées AVANT remplissage (pour savoir lesquelles viennent du CP)
+    mask_missing = df["latitude"].isna() | df["longitude"].isna()
+    df["_from_zip"] = mask_missing.copy()
+
+    cand = df.loc[mask_missing, "zipcode_str"].dropna().unique()
+    if cand.size > 0:
+        geo_lat, geo_lon = geocode_zips(cand)
+        ok = idf_mask(geo_lat, geo_lon)  # CP inconnu (NaN) ou hors IDF -> pas de remplissage
+        zlat = pd.Series(np.asarray(geo_lat, dtype="float64")[ok], index=cand[ok])
+        zlon = pd.Series(np.asarray(geo_lon, dtype="float64")[ok], index=cand[ok])
+        fill = mask_missing & df["zipcode_str"].isin(zlat.index)
+        df.loc[fill, "latitude"] = df.loc[fill, "zipcode_str"].map(zlat)
+        df.loc[fill, "longitude"] = df.loc[fill, "zipcode_str"].map(zlon)
+
+    # ne jitter que si : (1) coordonnées issues du CP ET (2) il y a >1 annonce sur ce CP
+    counts = df["zipcode_str"].map(df["zipcode_str"].value_counts())
+    jit = (df["_from_zip"] & df["zipcode_str"].notna() & (counts > 1)
+           & df["latitude"].notna() & df["longitude"].notna()).to_numpy()
+    if jit.any():
+        keys = jitter_keys(df)[jit]
+        lat = df["latitude"].to_numpy("float64")
+        lon = df["longitude"].to_numpy("float64")
+        lat[jit], lon[jit] = jitter_stable_many(lat[jit], lon[jit], keys)
+        df["latitude"], df["longitude"] = lat, lon
+
+    # colonnes dérivées pour la carte, calculées une fois ici plutôt qu'à chaque rerun
+    lat, lon = df["latitude"], df["longitude"]
+    df["in_idf"] = idf_mask(lat, lon)
+    df["price_label"] = fmt_k(df["price_eur"]) if "price_eur" in df.columns else ""
+    df["qx"], df["qy"] = quad_xy(lat, lon)  # index d'agrégation de la carte (map_clusters)
+    if "dup_cluster" in df.columns:  # première annonce de chaque bien (re-publications, near_dup)
+        df["dup_first"] = df["dup_cluster"].isna() | ~df["dup_cluster"].duplicated()
+
+    # on nettoie les colonnes techniques
+    return df.drop(columns=["_from_zip"], errors="ignore")
+
+
+def read_source(path, depts=None) -> pd.DataFrame:
+    if os.path.isdir(path):
+        df = dataset.read(path, columns=APP_COLUMNS, depts=depts)
+    else:
+        df = pd.read_csv(path, dtype={"zipcode": "string"})
+    # sorties d'avant les ids canoniques : listing_id + URL propre, CP/ville en catégories
+    if "listing_id" not in df.columns:
+        df = with_keys(df)
+    # crawl en flux en cours (stream_pipeline) : une annonce mise à jour est en double jusqu'à la compaction
+    dup = df["listing_id"].notna() & df["listing_id"].duplicated(keep="last")
+    if dup.any():
+        df = df[~dup].reset_index(drop=True)
+    for col in ("city", "zipcode"):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+@st.cache_data(show_spinner="Préparation des données…", max_entries=4)
+def _load_prepared(path: str, version: str, depts) -> pd.DataFrame:
+    # `version` ne sert qu'à la clé de cache : nouvelles données -> nouvelle entrée
+    return prepare(read_source(path, depts))
+
+
+def load_data(path=DATA_PATH, depts=None) -> pd.DataFrame:
+    """DataFrame enrichi, reconstruit seulement quand les données (ou les départements) changent."""
+    depts = None if depts is None else tuple(sorted(depts))
+    return _load_prepared(str(path), data_version(path), depts)
+
+
+@st.cache_resource(show_spinner="Indexation des données…", max_entries=2)
+def _load_index(path: str, version: str, depts) -> FilterIndex:
+    # ressource partagée (pas de copie par rerun) : l'app ne modifie jamais index.df
+    return FilterIndex(_load_prepared(path, version, depts))
+
+
+def load_index(path=DATA_PATH, depts=None) -> FilterIndex:
+    """Index de filtrage sur le DataFrame enrichi, reconstruit seulement quand les données changent."""
+    depts = None if depts is None else tuple(sorted(depts))
+    return _load_index(str(path), data_version(path), depts)
+
+
+@st.cache_data(max_entries=2)
+def _load_stats(path: str, version: str) -> pd.DataFrame:
+    return pd.read_csv(path, dtype={"key": "string", "period": "string"})
+
+
+def load_market_stats(path=STATS_PATH):
+    """Indicateurs de marché (effectif, p10/médiane/p90 €/m²) ; None tant que le cleaner ne les a pas produits."""
+    if not os.path.exists(path):
+        return None
+    return _load_stats(str(path), data_version(path))
+
+
+@st.cache_data(max_entries=16)
+def _load_changes(path: str, version: str, since: float, kinds, limit: int) -> pd.DataFrame:
+    history = ListingHistory(path)
+    try:
+        return history.changes_since(since, kinds=kinds, limit=limit)
+    finally:
+        history.close()
+
+
+def load_changes(since: float, kinds=None, limit: int = 500, path=HISTORY_PATH):
+    """Changements (nouveautés, prix, retraits) depuis `since` ; None tant que l'historique n'existe pas."""
+    if not os.path.exists(path):
+        return None
+    kinds = None if not kinds else tuple(sorted(kinds))
+    return _load_changes(str(path), data_version(path), float(since), kinds, limit)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Jeu de données nettoyé au format Parquet, partitionné par département
+- data/cleaned/dept=75/part-0.parquet, dept=92/..., etc. (partitionnement « hive »)
+- Schéma explicite : id d'annonce int64 (listing_key), CP et ville en dictionnaire (catégories),
+  prix / surface / €/m² et coordonnées float32, pièces entières, URL propre (sans tracking)
+- Lecture avec projection de colonnes et élagage des partitions (seuls les départements
+  demandés sont ouverts), sans reparsing ni recoercition des types côté app
+Le CSV data/cleaned_data.csv reste disponible comme export optionnel (EXPORT_CSV=1).
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+DATASET_DIR = "data/cleaned"
+PARTITION = "dept"  # 2 premiers chiffres du CP
+NO_DEPT = "00"      # annonces sans CP exploitable
+
+SCHEMA = pa.schema([
+    ("listing_id", pa.int64()),
+    ("title", pa.string()),
+    ("price_eur", pa.float32()),
+    ("surface_m2", pa.float32()),
+    ("price_per_m2", pa.float32()),
+    ("rooms", pa.int16()),
+    ("city", pa.dictionary(pa.int32(), pa.string())),
+    ("zipcode", pa.dictionary(pa.int32(), pa.string())),
+    ("latitude", pa.float32()),
+    ("longitude", pa.float32()),
+    ("url", pa.string()),
+    ("dup_cluster", pa.int64()),  # re-publications d'un même bien (near_dup)
+])
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION, pa.string())]), flavor="hive")
+
+# entiers nullables (pièces, id) -> Int16 / Int64 pandas plutôt que float64
+_PANDAS_TYPES = {pa.int16(): pd.Int16Dtype(), pa.int64(): pd.Int64Dtype()}
+
+
+# ---------- Écriture ----------
+def to_table(df: pd.DataFrame) -> pa.Table:
+    """DataFrame nettoyé -> table Arrow au schéma SCHEMA (+ colonne de partition)."""
+    cols = {}
+    for field in SCHEMA:
+        s = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if pa.types.is_integer(field.type):
+            s = pd.to_numeric(s, errors="coerce").round().astype(_PANDAS_TYPES[field.type])
+        elif pa.types.is_floating(field.type):
+            s = pd.to_numeric(s, errors="coerce")
+        else:
+            s = s.astype("string")
+        cols[field.name] = s
+    t = pa.Table.from_pandas(pd.DataFrame(cols), preserve_index=False)
+    t = t.cast(pa.schema([(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type)
+                          for f in SCHEMA])).cast(SCHEMA)
+    dept = cols["zipcode"].str[:2].fillna(NO_DEPT)
+    return t.append_column(PARTITION, pa.array(dept.to_numpy(dtype=object), pa.string()))
+
+
+def write(df: pd.DataFrame, root: str = DATASET_DIR):
+    """Réécrit tout le jeu de données (dossier temporaire puis échange, jamais de lecture à moitié écrite)."""
+    tmp, old = root + ".tmp", root + ".old"
+    shutil.rmtree(tmp, ignore_errors=True)
+    ds.write_dataset(
+        to_table(df), tmp, format="parquet", partitioning=PARTITIONING,
+        basename_template="part-{i}.parquet", existing_data_behavior="overwrite_or_ignore",
+    )
+    os.makedirs(tmp, exist_ok=True)  # table vide : write_dataset ne crée rien
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(root):
+        os.replace(root, old)
+    os.replace(tmp, root)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def append(df: pd.DataFrame, name: str, root: str = DATASET_DIR):
+    """Ajoute `df` en nouveaux fichiers `<name>-<i>.parquet` dans les partitions existantes, sans réécrire
+    le reste (pipeline en flux). Chaque fichier est écrit à côté puis déplacé : jamais lu à moitié écrit.
+    Les lignes ajoutées passent après les anciennes dans l'ordre des fichiers (noms triés)."""
+    if df.empty:
+        return
+    tmp = f"{root}.{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    ds.write_dataset(
+        to_table(df), tmp, format="parquet", partitioning=PARTITIONING,
+        basename_template=name + "-{i}.parquet", existing_data_behavior="overwrite_or_ignore",
+    )
+    for d, _, names in os.walk(tmp):
+        dest = os.path.join(root, os.path.relpath(d, tmp))
+        os.makedirs(dest, exist_ok=True)
+        for n in names:
+            os.replace(os.path.join(d, n), os.path.join(dest, n))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ---------- Lecture ----------
+def exists(root: str = DATASET_DIR) -> bool:
+    return os.path.isdir(root) and any(files(root))
+
+
+def files(root: str = DATASET_DIR):
+    """Fichiers Parquet du jeu de données, ordre stable."""
+    out = []
+    for d, _, names in os.walk(root):
+        out += [os.path.join(d, n) for n in names if n.endswith(".parquet")]
+    return sorted(out)
+
+
+def departements(root: str = DATASET_DIR):
+    """Départements présents, d'après les noms de dossiers (aucun fichier ouvert)."""
+    if not os.path.isdir(root):
+        return []
+    prefix = PARTITION + "="
+    return sorted(n[len(prefix):] for n in os.listdir(root)
+                  if n.startswith(prefix) and os.path.isdir(os.path.join(root, n)))
+
+
+def read(root: str = DATASET_DIR, columns=None, depts=None) -> pd.DataFrame:
+    """Lecture projetée : `columns` (None = toutes) et `depts` (None = tous) poussés au scan."""
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    flt = None if depts is None else ds.field(PARTITION).isin(pa.array(list(depts), pa.string()))
+    table = dataset.to_table(columns=columns, filter=flt)
+    return table.to_pandas(types_mapper=_PANDAS_TYPES.get)
+
+
+def read_all(root: str = DATASET_DIR) -> pd.DataFrame:
+    """Tout le jeu de données en types « simples » (chaînes, float64), comme le CSV."""
+    df = read(root, columns=SCHEMA.names)
+    for name in ("city", "zipcode"):
+        df[name] = df[name].astype("string")
+    for name in ("price_eur", "surface_m2", "price_per_m2"):  # float32 stocké -> arrondi au centime
+        df[name] = df[name].astype("float64").round(2)
+    for name in ("latitude", "longitude"):  # float32 stocké -> arrondi à 1e-6° comme geoindex
+        df[name] = df[name].astype("float64").round(6)
+    return df
+
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction des champs d'annonce depuis les objets JSON d'une page
+- Table déclarative : champ -> chemins « dot » essayés dans l'ordre
+- Compilée une fois en index (première clé -> chemins), un seul parcours de l'arbre
+- Arrêt dès que tous les champs sont trouvés ; aucune exception pour le contrôle de flux
+Sémantique identique à l'ancien couple walk_json + deep_get : le premier dict (ordre
+préfixe) qui fournit une valeur gagne ; à priorité égale, l'ordre des chemins compte.
+Seules différences : on n'accepte que des valeurs scalaires (plus de {"value": 60} pris
+pour une surface) et les objets ne sont parcourus qu'une fois.
+"""
+
+# champ -> chemins, par ordre de préférence (mêmes chemins que l'ancien extract_from_jsonobjs)
+FIELD_SPECS = {
+    "url": ["url", "mainEntityOfPage.@id"],
+    "title": ["name", "headline", "title"],
+    "price": ["price", "offers.price", "offers.0.price", "price.value", "pricing.price", "ad.price.value"],
+    "surface": ["floorSize", "area", "livingArea", "floorSize.value", "surface.value",
+                "property.surface", "habitableSurface"],
+    "rooms": ["numberOfRooms", "rooms", "ad.rooms", "property.rooms"],
+    "city": ["address.addressLocality", "address.locality", "location.city", "city"],
+    "zipcode": ["address.postalCode", "address.zipCode", "postalCode"],
+    "lat": ["geo.latitude", "latitude"],
+    "lon": ["geo.longitude", "longitude"],
+}
+
+_CONTAINERS = (dict, list)
+
+
+def _usable(v):
+    return v is not None and v != "" and not isinstance(v, _CONTAINERS)
+
+
+def _resolve(cur, keys):
+    """Suit `keys` depuis `cur` (même règle de liste que l'ancien deep_get :
+    dans une liste on prend le 1er dict portant la clé, sinon le 1er élément)."""
+    for key in keys:
+        if isinstance(cur, dict):
+            if key not in cur:
+                return None
+            cur = cur[key]
+        elif isinstance(cur, list):
+            nxt = None
+            for it in cur:
+                if isinstance(it, dict) and key in it:
+                    nxt = it[key]
+                    break
+            cur = nxt if nxt is not None else (cur[0] if cur else None)
+        else:
+            return None
+    return cur
+
+
+class FieldMatcher:
+    """Table de champs compilée : index première clé -> [(n° champ, priorité, reste du chemin)]."""
+
+    def __init__(self, specs: dict):
+        self.fields = list(specs)
+        self.index = {}
+        for fi, name in enumerate(self.fields):
+            for prio, path in enumerate(specs[name]):
+                head, *rest = path.split(".")
+                self.index.setdefault(head, []).append((fi, prio, tuple(rest)))
+
+    def _active_index(self, done):
+        idx = {}
+        for head, entries in self.index.items():
+            keep = [e for e in entries if not done[e[0]]]
+            if keep:
+                idx[head] = keep
+        return idx
+
+    def extract(self, objs) -> dict:
+        n = len(self.fields)
+        values = [None] * n
+        done = [False] * n
+        remaining = n
+        index = self.index
+
+        # parcours préfixe itératif (même ordre que walk_json)
+        stack = list(reversed(objs))
+        while stack and remaining:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+                continue
+            if not isinstance(node, dict):
+                continue
+
+            best = None
+            heads = node if len(node) < len(index) else index
+            for head in heads:
+                entries = index.get(head)
+                if entries is None or head not in node:
+                    continue
+                val = node[head]
+                for fi, prio, rest in entries:
+                    if best and fi in best and best[fi][0] <= prio:
+                        continue
+                    v = _resolve(val, rest) if rest else val
+                    if _usable(v):
+                        if best is None:
+                            best = {}
+                        best[fi] = (prio, v)
+            if best:
+                for fi, (_, v) in best.items():
+                    values[fi] = v
+                    done[fi] = True
+                remaining = n - sum(done)
+                index = self._active_index(done)
+
+            children = [v for v in node.values() if isinstance(v, _CONTAINERS)]
+            stack.extend(reversed(children))
+
+        return dict(zip(self.fields, values))
+
+
+MATCHER = FieldMatcher(FIELD_SPECS)
+
+
+def extract_fields(objs) -> dict:
+    return MATCHER.extract(objs)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Index de filtrage du dashboard (prix, surface, villes), construit une fois par version des données
+- Prix et surface : positions des lignes triées par valeur, un filtre d'intervalle = 2 searchsorted
+- Villes : code catégoriel par ligne + liste triée des lignes de chaque ville (postings)
+- Requête : on part du plus petit ensemble candidat (intervalle ou villes) et on vérifie
+  les deux autres critères sur ces lignes seulement ; résultats mis en cache par paramètres
+- Pagination du tableau : ordre de tri global par colonne (calculé à la première demande),
+  restreint aux lignes filtrées puis découpé en pages, sans trier le résultat à chaque rerun
+  (cache par empreinte du contenu des lignes : un même filtre recalculé à chaque rerun, p. ex.
+  dédoublonnage de l'app, retombe sur la même entrée)
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+SORTED_CACHE = 32  # tris de lignes filtrées gardés par version des données
+
+
+class RangeIndex:
+    """Valeurs non manquantes triées + positions des lignes correspondantes."""
+
+    def __init__(self, values):
+        values = pd.to_numeric(values, errors="coerce").to_numpy("float64", na_value=np.nan)
+        valid = np.flatnonzero(~np.isnan(values))
+        order = np.argsort(values[valid], kind="stable")
+        self.values = values                  # par ligne (NaN compris), pour les vérifications
+        self.sorted = values[valid][order]
+        self.rows = valid[order].astype(np.int64)
+
+    def bounds(self):
+        return (float(self.sorted[0]), float(self.sorted[-1])) if self.sorted.size else None
+
+    def span(self, lo, hi):
+        """Tranche [i, j) de self.rows dont la valeur est dans [lo, hi] (comme Series.between)."""
+        return np.searchsorted(self.sorted, lo, "left"), np.searchsorted(self.sorted, hi, "right")
+
+    def contains(self, rows, lo, hi):
+        v = self.values[rows]
+        return (v >= lo) & (v <= hi)
+
+
+class FilterIndex:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+        self.price = RangeIndex(df["price_eur"] if "price_eur" in df else pd.Series(np.nan, index=df.index))
+        self.surface = RangeIndex(df["surface_m2"] if "surface_m2" in df else pd.Series(np.nan, index=df.index))
+
+        # villes : seules les chaînes comptent (comme l'ancienne liste de l'app)
+        city = df["city"] if "city" in df else pd.Series(None, index=df.index, dtype=object)
+        raw_codes, uniques = pd.factorize(city.astype(object))
+        self.cities = sorted(u for u in uniques if isinstance(u, str))
+        self._city_pos = {c: k for k, c in enumerate(self.cities)}
+        remap = np.array([self._city_pos.get(u, -1) if isinstance(u, str) else -1 for u in uniques] + [-1],
+                         dtype=np.int64)
+        codes = remap[raw_codes]  # raw_codes == -1 (NaN) -> dernière case -> -1
+        self.city_codes = codes  # -1 : pas de ville
+        order = np.argsort(codes, kind="stable")
+        starts = np.searchsorted(codes[order], np.arange(len(self.cities) + 1), "left")
+        self._city_rows = order.astype(np.int64)
+        self._city_starts = starts
+        self._cached_query = lru_cache(maxsize=128)(self._query)  # cache propre à cette version
+        self._sorted = OrderedDict()  # (empreinte des lignes, colonne, sens) -> lignes triées (LRU)
+        self._sorted_lock = threading.Lock()  # reruns Streamlit concurrents sur le même index
+        self._orders = {}
+
+    def city_rows(self, city):
+        k = self._city_pos.get(city)
+        if k is None:
+            return np.empty(0, dtype=np.int64)
+        return self._city_rows[self._city_starts[k]:self._city_starts[k + 1]]
+
+    def query(self, price=None, surface=None, cities=()):
+        """Positions (triées) des lignes qui passent les filtres ; `cities` vide = toutes les villes."""
+        return self._cached_query(_key(price), _key(surface), tuple(sorted(cities)))
+
+    def _query(self, price, surface, cities):
+        # ensembles candidats : (taille, fabrique des lignes)
+        cands = []
+        if price is not None:
+            i, j = self.price.span(*price)
+            cands.append((j - i, lambda i=i, j=j: self.price.rows[i:j]))
+        if surface is not None:
+            i, j = self.surface.span(*surface)
+            cands.append((j - i, lambda i=i, j=j: self.surface.rows[i:j]))
+        if cities:
+            size = sum(len(self.city_rows(c)) for c in cities)
+            cands.append((size, lambda: np.concatenate([self.city_rows(c) for c in cities])))
+        if not cands:
+            rows = np.arange(self.n, dtype=np.int64)
+        else:
+            rows = min(cands, key=lambda c: c[0])[1]()
+
+        # vérification des autres critères sur les seules lignes candidates
+        keep = np.ones(len(rows), dtype=bool)
+        if price is not None:
+            keep &= self.price.contains(rows, *price)
+        if surface is not None:
+            keep &= self.surface.contains(rows, *surface)
+        if cities:
+            selected = np.zeros(len(self.cities) + 1, dtype=bool)  # dernière case : code -1
+            selected[[self._city_pos[c] for c in cities if c in self._city_pos]] = True
+            keep &= selected[self.city_codes[rows]]
+        rows = np.sort(rows[keep])
+        rows.flags.writeable = False  # partagé par le cache
+        return rows
+
+    def filter(self, price=None, surface=None, cities=()) -> pd.DataFrame:
+        """Vue filtrée du DataFrame, dans l'ordre d'origine des lignes."""
+        return self.df.iloc[self.query(price, surface, cities)]
+
+    # ---------- Tri + pagination ----------
+    def sort_order(self, column, ascending=True):
+        """(positions de toutes les lignes triées par `column`, rang de chaque ligne) ;
+        valeurs manquantes en dernier."""
+        key = (column, ascending)
+        if key not in self._orders:
+            v = self.df[column]
+            if pd.api.types.is_numeric_dtype(v) or pd.api.types.is_bool_dtype(v):
+                v = pd.to_numeric(v, errors="coerce").to_numpy("float64", na_value=np.nan)
+                codes = np.where(np.isnan(v), np.inf, v)
+                missing = np.isnan(v)
+            else:  # texte : codes de l'ordre lexicographique
+                codes, _ = pd.factorize(v.astype(object), sort=True)
+                missing = codes < 0
+            valid = np.flatnonzero(~missing)
+            # décroissant : clé opposée plutôt qu'ordre inversé, les ex aequo restent dans l'ordre
+            # d'origine (comme sort_values(ascending=False))
+            k = codes[valid] if ascending else -codes[valid]
+            order = valid[np.argsort(k, kind="stable")]
+            order = np.concatenate([order, np.flatnonzero(missing)]).astype(np.int64)
+            rank = np.empty(self.n, dtype=np.int64)
+            rank[order] = np.arange(self.n)
+            self._orders[key] = order, rank
+        return self._orders[key]
+
+    def _sorted_rows(self, rows, column, ascending):
+        order, rank = self.sort_order(column, ascending)
+        if len(rows) < self.n // 16:  # peu de lignes : tri de leurs rangs
+            return rows[np.argsort(rank[rows], kind="stable")]
+        member = np.zeros(self.n, dtype=bool)  # beaucoup : parcours de l'ordre global
+        member[rows] = True
+        return order[member[order]]
+
+    def page(self, rows, sort=None, ascending=True, page=0, size=50):
+        """Lignes de la page `page` (0 = première) parmi `rows` triées par `sort` (None = ordre d'origine).
+        Le tri des lignes filtrées est mis en cache : changer de page ne coûte qu'une tranche."""
+        start = page * size
+        if sort is None:
+            return rows[start:start + size]
+        key = (_digest(rows), sort, bool(ascending))
+        with self._sorted_lock:
+            ordered = self._sorted.get(key)
+            if ordered is not None:
+                self._sorted.move_to_end(key)
+        if ordered is None:
+            ordered = self._sorted_rows(np.asarray(rows, dtype=np.int64), sort, bool(ascending))
+            ordered.flags.writeable = False  # partagé par le cache
+            with self._sorted_lock:
+                self._sorted[key] = ordered
+                while len(self._sorted) > SORTED_CACHE:
+                    self._sorted.popitem(last=False)
+        return ordered[start:start + size]
+
+
+def _key(bounds):
+    return None if bounds is None else (float(bounds[0]), float(bounds[1]))
+
+
+def _digest(rows) -> bytes:
+    """Empreinte du contenu d'un tableau de lignes (clé de cache sans garder le tableau en vie)."""
+    rows = np.ascontiguousarray(rows, dtype=np.int64)
+    return hashlib.blake2b(memoryview(rows).cast("B"), digest_size=16).digest()
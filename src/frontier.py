@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+Frontière de crawl persistante (SQLite) : crawl reprenable, réparti sur N processus
+- Une ligne par URL (clé unique) : à faire -> en cours (bail) -> faite / en échec
+- Réservation par bail : un worker réclame CLAIM_BATCH URLs pour LEASE_SECONDS, renouvelle ses baux
+  tant qu'il vit ; le bail d'un worker mort expire et ses URLs repartent chez les autres
+- Les requêtes découvertes en cours de crawl (pages de résultats suivantes, pages détail du mode
+  serp) passent par la frontière (FrontierMiddleware) : travail disjoint et rien de perdu au crash
+- Point de reprise : une page n'est marquée faite qu'après écriture de ses annonces (JSONL par
+  worker, flush à chaque annonce) ; relancer reprend là où le crawl s'était arrêté
+- Politesse : seaux à jetons communs dans la même base (throttle.SharedBuckets), budget par hôte global
+- Sous Scrapy, les appels à la base (réservation, battement de cœur, page faite) passent par le pool
+  de threads de Twisted (Frontier.call) : une base chargée ne bloque jamais le reactor
+    python src/frontier.py crawl -n 4        # seeds si nouvelle frontière, N workers, fusion en fin de crawl
+    python src/frontier.py worker            # un worker de plus (autre terminal, autre machine)
+    python src/frontier.py status | seed [--fresh] | merge
+Plusieurs machines : même dossier data/ partagé ; SQLite sur disque réseau demande un verrouillage
+fiable (NFS déconseillé), à défaut un worker par machine sur sa propre frontière.
+"""
+
+import os
+import sys
+import glob
+import time
+import json
+import pickle
+import socket
+import sqlite3
+import argparse
+import functools
+import threading
+import subprocess
+from contextlib import contextmanager
+
+from scrapy import Request
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.threads import deferToThread
+
+FRONTIER_DB = os.getenv("FRONTIER_DB", "data/frontier.sqlite")
+SHARD_DIR = os.getenv("SHARD_DIR", "data/raw_shards")  # sorties JSONL par worker
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "300"))
+CLAIM_BATCH = int(os.getenv("CLAIM_BATCH", "50"))      # URLs réclamées à la fois
+MAX_ATTEMPTS = int(os.getenv("FRONTIER_MAX_ATTEMPTS", "3"))
+ADD_CHUNK = 10_000                                     # URLs par transaction au remplissage
+
+TODO, LEASED, DONE, FAILED = "todo", "leased", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    id          INTEGER PRIMARY KEY,
+    url         TEXT UNIQUE NOT NULL,
+    kind        TEXT NOT NULL,
+    request     BLOB,
+    status      TEXT NOT NULL DEFAULT 'todo',
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    updated     REAL
+);
+CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status, id);
+CREATE INDEX IF NOT EXISTS frontier_lease ON frontier (status, lease_until);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _serialized(method):
+    """Méthode de Frontier appelable depuis n'importe quel thread : une à la fois sur la connexion."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Frontier:
+    """kind : "detail" (URL d'annonce), "serp" (URL de recherche) ou "request" (requête Scrapy
+    sérialisée dans `request`, découverte pendant le crawl)."""
+
+    threaded = True  # call() dans le pool de threads de Twisted ; False = appel direct (boucle hors reactor)
+
+    def __init__(self, path: str = FRONTIER_DB, lease: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # autocommit : chaque écriture est courte, les réservations ouvrent leur propre transaction
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def call(self, fn, *args):
+        """Deferred du résultat de fn(*args), exécuté hors du thread du reactor (transactions IMMEDIATE
+        jusqu'à 30 s d'attente du verrou quand les workers sont nombreux)."""
+        return deferToThread(fn, *args) if self.threaded else maybeDeferred(fn, *args)
+
+    @contextmanager
+    def _immediate(self):
+        """Transaction d'écriture exclusive (BEGIN IMMEDIATE) : deux workers ne réclament jamais
+        la même URL."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # ---------- Remplissage ----------
+    @_serialized
+    def add(self, urls, kind: str) -> int:
+        """Ajoute des URLs (doublons ignorés) ; renvoie le nombre de nouvelles lignes."""
+        n, chunk, now = 0, [], time.time()
+        for url in urls:
+            if url:
+                chunk.append((url, kind, now))
+            if len(chunk) >= ADD_CHUNK:
+                n += self._insert(chunk)
+                chunk = []
+        return n + self._insert(chunk) if chunk else n
+
+    @staticmethod
+    def request_rows(requests, spider) -> list:
+        """Lignes des requêtes Scrapy découvertes (callback, cb_kwargs, meta, en-têtes conservés) ;
+        sérialisation dans le thread appelant, le spider n'est pas partagé entre threads."""
+        return [(r.url, "request", pickle.dumps(r.to_dict(spider=spider)), time.time()) for r in requests]
+
+    def add_requests(self, requests, spider) -> int:
+        return self.complete(None, self.request_rows(requests, spider))
+
+    @_serialized
+    def complete(self, url, rows=()) -> int:
+        """Page `url` traitée : requêtes découvertes (request_rows) ajoutées et page marquée faite dans
+        une même transaction ; renvoie le nombre de nouvelles lignes."""
+        if not rows and url is None:
+            return 0
+        with self._immediate() as c:
+            before = c.total_changes
+            if rows:
+                c.executemany("INSERT OR IGNORE INTO frontier (url, kind, request, updated) VALUES (?, ?, ?, ?)",
+                              rows)
+            added = c.total_changes - before
+            if url is not None:
+                c.execute("UPDATE frontier SET status = 'done', worker = NULL, lease_until = NULL, updated = ? "
+                          "WHERE url = ?", (time.time(), url))
+        return added
+
+    def _insert(self, rows) -> int:
+        with self._immediate() as c:
+            before = c.total_changes
+            c.executemany("INSERT OR IGNORE INTO frontier (url, kind, updated) VALUES (?, ?, ?)", rows)
+            return c.total_changes - before
+
+    @_serialized
+    def reset(self):
+        self.conn.execute("DELETE FROM frontier")
+
+    # ---------- Réservation ----------
+    @_serialized
+    def claim(self, worker: str, n: int = CLAIM_BATCH):
+        """Réserve jusqu'à `n` URLs pour `worker` : baux expirés d'abord (worker mort), puis URLs à
+        faire dans l'ordre d'ajout. Une URL réclamée MAX_ATTEMPTS fois passe en échec.
+        Renvoie [(url, kind, requête sérialisée ou None)]."""
+        now = time.time()
+        with self._immediate() as c:
+            rows = c.execute(
+                "SELECT id, url, kind, request, attempts FROM frontier "
+                "WHERE status = ? AND lease_until < ? LIMIT ?", (LEASED, now, n)).fetchall()
+            dead = [(now, r[0]) for r in rows if r[4] >= self.max_attempts]
+            if dead:
+                c.executemany("UPDATE frontier SET status = 'failed', worker = NULL, updated = ? WHERE id = ?", dead)
+                rows = [r for r in rows if r[4] < self.max_attempts]
+            if len(rows) < n:
+                rows += c.execute("SELECT id, url, kind, request, attempts FROM frontier "
+                                  "WHERE status = ? ORDER BY id LIMIT ?", (TODO, n - len(rows))).fetchall()
+            c.executemany(
+                "UPDATE frontier SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = ?", [(worker, now + self.lease, now, r[0]) for r in rows])
+        return [(r[1], r[2], r[3]) for r in rows]
+
+    @_serialized
+    def renew(self, worker: str) -> int:
+        """Prolonge les baux de `worker` (battement de cœur)."""
+        now = time.time()
+        return self.conn.execute("UPDATE frontier SET lease_until = ? WHERE worker = ? AND status = ?",
+                                 (now + self.lease, worker, LEASED)).rowcount
+
+    @_serialized
+    def done(self, *urls):
+        now = time.time()
+        self.conn.executemany("UPDATE frontier SET status = 'done', worker = NULL, lease_until = NULL, updated = ? "
+                              "WHERE url = ?", [(now, u) for u in urls])
+
+    @_serialized
+    def release(self, url: str):
+        """Échec d'une URL : de nouveau à faire, ou en échec après MAX_ATTEMPTS tentatives."""
+        self.conn.execute(
+            "UPDATE frontier SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'todo' END, "
+            "worker = NULL, lease_until = NULL, updated = ? WHERE url = ? AND status = ?",
+            (self.max_attempts, time.time(), url, LEASED))
+
+    @_serialized
+    def release_worker(self, worker: str) -> int:
+        """Rend les URLs encore réservées par `worker` (arrêt propre, ou relance sous le même id) ;
+        la tentative n'est pas comptée."""
+        return self.conn.execute(
+            "UPDATE frontier SET status = 'todo', worker = NULL, lease_until = NULL, "
+            "attempts = MAX(attempts - 1, 0), updated = ? WHERE worker = ? AND status = ?",
+            (time.time(), worker, LEASED)).rowcount
+
+    # ---------- État ----------
+    @_serialized
+    def pending(self, worker: str = None) -> int:
+        """URLs réservées par d'autres workers, bail en cours (le crawl n'est pas fini)."""
+        return self.conn.execute("SELECT COUNT(*) FROM frontier WHERE status = ? AND lease_until >= ? "
+                                 "AND worker IS NOT ?", (LEASED, time.time(), worker)).fetchone()[0]
+
+    @_serialized
+    def counts(self) -> dict:
+        out = {TODO: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        out.update(self.conn.execute("SELECT status, COUNT(*) FROM frontier GROUP BY status").fetchall())
+        return out
+
+    def finished(self) -> bool:
+        c = self.counts()
+        return c[TODO] == 0 and c[LEASED] == 0
+
+    @_serialized
+    def close(self):
+        self.conn.close()
+
+
+# ---------- Scrapy ----------
+class FrontierMiddleware:
+    """Middleware de spider, sans effet hors crawl partagé (spider.frontier absent) :
+    - requêtes produites par les callbacks -> frontière (réclamées ensuite par n'importe quel worker)
+    - page marquée faite une fois toutes ses sorties traitées (annonces écrites par JsonlShardPipeline),
+      dans la même transaction que l'ajout de ses requêtes
+    - exception dans le callback -> URL rendue (nouvelle tentative)"""
+
+    def process_spider_output(self, response, result, spider):
+        frontier = getattr(spider, "frontier", None)
+        if frontier is None:
+            yield from result
+            return
+        found = []
+        for r in result:
+            if isinstance(r, Request):
+                found.append(r)
+            else:
+                yield r
+        url = response.meta.get("frontier_url")
+        if found or url:
+            d = frontier.call(frontier.complete, url, frontier.request_rows(found, spider))
+            d.addCallback(self._completed, spider, url)
+            d.addErrback(lambda f: spider.logger.error(f"Frontière : page {url} non enregistrée ({f.value!r})"))
+
+    @staticmethod
+    def _completed(added, spider, url):
+        spider.crawler.stats.inc_value("frontier/added", added)
+        if url:
+            spider.crawler.stats.inc_value("frontier/done")
+
+    def process_spider_exception(self, response, exception, spider):
+        frontier = getattr(spider, "frontier", None)
+        if frontier is not None and response.meta.get("frontier_url"):
+            frontier.call(frontier.release, response.meta["frontier_url"])
+        return None
+
+
+class JsonlShardPipeline:
+    """Annonces d'un worker en JSON Lines (ajout, flush à chaque annonce) : rien n'est perdu dans un
+    tampon quand la page est marquée faite. SHARD_PATH en réglage Scrapy."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get("SHARD_PATH"))
+
+    def open_spider(self, spider):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.f = open(self.path, "a", encoding="utf-8")
+
+    def process_item(self, item, spider):
+        self.f.write(json.dumps(dict(item), ensure_ascii=False) + "\n")
+        self.f.flush()
+        return item
+
+    def close_spider(self, spider):
+        self.f.close()
+
+
+# ---------- Lignes de commande ----------
+def seed(fr: Frontier) -> int:
+    """Seeds du spider (SEEDS, ou SEARCH_URLS en CRAWL_MODE=serp), mêmes règles de dédoublonnage."""
+    import spider
+    from seeds import iter_seeds
+    from listing_key import clean_url
+    from crawl_state import listing_id_from_url
+    if spider.CRAWL_MODE == "serp":
+        return fr.add(iter_seeds(spider.SEARCH_URLS, 0, spider.SEEDS_CAPACITY), "serp")
+    urls = iter_seeds(spider.URLS_PATH, spider.MAX_URLS, spider.SEEDS_CAPACITY, key=listing_id_from_url)
+    return fr.add(map(clean_url, urls), "detail")
+
+
+def run_worker(worker_id: str, db: str = FRONTIER_DB, shard_dir: str = SHARD_DIR):
+    """Un processus de crawl sur la frontière `db` (bloquant jusqu'à la fin du crawl)."""
+    os.environ.update({"FRONTIER_DB": db, "WORKER_ID": worker_id, "RAW_FEED": ""})
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from spider import SelogerSpider
+
+    settings = get_project_settings()
+    # priorité « cmdline » : passe devant les custom_settings du spider
+    settings.set("ITEM_PIPELINES", {JsonlShardPipeline: 300}, priority="cmdline")
+    settings.set("SHARD_PATH", os.path.join(shard_dir, f"{worker_id}.jsonl"), priority="cmdline")
+    process = CrawlerProcess(settings)
+    process.crawl(SelogerSpider)
+    process.start()
+
+
+def merge(shard_dir: str, out: str) -> int:
+    """Concatène les sorties des workers en un seul brut (entrée du cleaner)."""
+    n = 0
+    tmp = out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as w:
+        for path in sorted(glob.glob(os.path.join(shard_dir, "*.jsonl"))):
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                for line in f:
+                    if line.strip():
+                        w.write(line if line.endswith("\n") else line + "\n")
+                        n += 1
+    os.replace(tmp, out)
+    return n
+
+
+def print_status(fr: Frontier):
+    c = fr.counts()
+    total = sum(c.values())
+    workers = fr.conn.execute("SELECT worker, COUNT(*) FROM frontier WHERE status = ? GROUP BY worker",
+                              (LEASED,)).fetchall()
+    print(f"Frontière {fr.path} : {total} URLs • {c[DONE]} faites • {c[TODO]} à faire • "
+          f"{c[LEASED]} en cours • {c[FAILED]} en échec")
+    for w, k in workers:
+        print(f"  {w} : {k} en cours")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Crawl SeLoger reprenable, réparti sur plusieurs processus")
+    ap.add_argument("command", choices=["crawl", "worker", "seed", "status", "merge"])
+    ap.add_argument("-n", "--workers", type=int, default=int(os.getenv("CRAWL_WORKERS", "2")))
+    ap.add_argument("--db", default=FRONTIER_DB)
+    ap.add_argument("--shards", default=SHARD_DIR)
+    ap.add_argument("--out", default=os.getenv("RAW_FEED") or "data/raw_data.jsonl")
+    ap.add_argument("--id", default=os.getenv("WORKER_ID") or default_worker_id(), help="id du worker")
+    ap.add_argument("--fresh", action="store_true", help="repart d'une frontière vide")
+    args = ap.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker(args.id, args.db, args.shards)
+        return
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    fr = Frontier(args.db)
+    if args.command == "status":
+        print_status(fr)
+        return
+    if args.command == "merge":
+        print(f"{merge(args.shards, args.out)} annonces -> {args.out}")
+        return
+
+    # nouveau crawl si demandé, si la frontière est vide ou si le précédent est terminé ; sinon reprise
+    if args.fresh or sum(fr.counts().values()) == 0 or fr.finished():
+        fr.reset()
+        for path in glob.glob(os.path.join(args.shards, "*.jsonl")):
+            os.remove(path)
+        print(f"Nouveau crawl : {seed(fr)} URLs dans {args.db}")
+    else:
+        print("Reprise du crawl interrompu")
+    print_status(fr)
+    if args.command == "seed":
+        return
+
+    # ids stables : un worker relancé récupère tout de suite ses propres baux
+    host = socket.gethostname()
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--id", f"{host}-w{i}",
+                               "--db", args.db, "--shards", args.shards]) for i in range(args.workers)]
+    codes = [p.wait() for p in procs]
+    print_status(fr)
+    if fr.finished():
+        print(f"Crawl terminé : {merge(args.shards, args.out)} annonces -> {args.out}")
+    else:
+        print("Crawl incomplet : relancer la même commande pour reprendre")
+    sys.exit(max(codes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Index de géocodage local : code postal -> (lat, lon, communes)
+- Construit une fois depuis la table GeoNames FR (celle qu'utilise pgeocode), puis versionné
+  dans data/geo/fr_postal_v1/ : tableaux NumPy triés, lus en mémoire mappée (démarrage ~0)
+- Recherche vectorisée par np.searchsorted, utilisée par le cleaner et l'app
+- Repli sur pgeocode si l'index n'a pas encore été construit, sauf GEO_OFFLINE=1 (CI sans réseau :
+  coordonnées manquantes plutôt qu'un téléchargement)
+Construction (une fois, sur un poste avec réseau ou depuis un FR.txt local), puis commit de data/geo/ :
+    python src/geoindex.py build                 # télécharge la table via pgeocode (réseau)
+    python src/geoindex.py build --source FR.txt # depuis un export GeoNames local (ou le cache pgeocode)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 1
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "geo",
+                         f"fr_postal_v{INDEX_VERSION}")
+SEP = "|"  # séparateur des communes d'un même code postal
+GEO_OFFLINE = os.getenv("GEO_OFFLINE", "0") == "1"  # pas de repli pgeocode (téléchargement)
+
+GEONAMES_COLUMNS = ["country_code", "postal_code", "place_name", "state_name", "state_code",
+                    "county_name", "county_code", "community_name", "community_code",
+                    "latitude", "longitude", "accuracy"]
+
+
+# ---------- Construction ----------
+def read_geonames(path) -> pd.DataFrame:
+    """Export GeoNames (TSV sans en-tête) ou copie en cache de pgeocode (CSV, mêmes colonnes en en-tête)."""
+    with open(path, encoding="utf-8") as f:
+        header = f.readline().startswith("country_code,")
+    if header:
+        return pd.read_csv(path, dtype={"postal_code": str}, keep_default_na=False, na_values=[""])
+    return pd.read_csv(path, sep="\t", header=None, names=GEONAMES_COLUMNS,
+                       dtype={"postal_code": str}, keep_default_na=False, na_values=[""])
+
+
+def load_source(source=None) -> pd.DataFrame:
+    """Table GeoNames brute (une ligne par commune) : fichier local, sinon la table FR que pgeocode
+    télécharge et garde en cache (PGEOCODE_DATA_DIR), relue depuis le disque."""
+    if source:
+        return read_geonames(source)
+    import pgeocode
+    pgeocode.Nominatim("fr")  # télécharge la table au premier appel
+    return read_geonames(os.path.join(pgeocode.STORAGE_DIR, "FR.txt"))
+
+
+def build(source=None, out_dir=INDEX_DIR):
+    raw = load_source(source)
+    raw = raw[raw["postal_code"].astype(str).str.fullmatch(r"\d{5}")]
+    g = raw.groupby("postal_code", sort=True)
+    # même agrégation que pgeocode : moyenne des communes du code postal
+    table = g[["latitude", "longitude"]].mean()
+    names = g["place_name"].apply(lambda x: SEP.join(dict.fromkeys(str(v) for v in x)))
+
+    codes = np.zeros(len(table), dtype=[("zip", "<i4"), ("lat", "<f4"), ("lon", "<f4")])
+    codes["zip"] = table.index.astype(int)
+    codes["lat"] = table["latitude"].to_numpy(np.float32)
+    codes["lon"] = table["longitude"].to_numpy(np.float32)
+    order = np.argsort(codes["zip"], kind="stable")
+    codes = codes[order]
+
+    encoded = [s.encode("utf-8") for s in names.to_numpy()[order]]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i4")
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "codes.npy"), codes)
+    np.save(os.path.join(out_dir, "communes_off.npy"), offsets)
+    np.save(os.path.join(out_dir, "communes.npy"), blob)
+    meta = {
+        "version": INDEX_VERSION,
+        "source": source or "pgeocode/GeoNames FR",
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "postal_codes": int(len(codes)),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# ---------- Lecture ----------
+class GeoIndex:
+    def __init__(self, path=INDEX_DIR):
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "communes_off.npy"), mmap_mode="r")
+        self.blob = np.load(os.path.join(path, "communes.npy"), mmap_mode="r")
+        self.zips = self.codes["zip"]
+
+    def _positions(self, zips):
+        """Codes postaux (str/int/NaN) -> (positions dans l'index, masque trouvé)."""
+        z = pd.to_numeric(pd.Series(zips, dtype=object).astype("string").str.strip(), errors="coerce")
+        z = z.to_numpy(dtype="float64", na_value=np.nan)
+        valid = ~np.isnan(z)
+        zi = np.where(valid, z, -1).astype(np.int64)
+        pos = np.searchsorted(self.zips, zi)
+        pos = np.minimum(pos, len(self.zips) - 1)
+        found = valid & (self.zips[pos] == zi)
+        return pos, found
+
+    def lookup(self, zips):
+        """Recherche par lot : (lat, lon) en float64, NaN si code inconnu."""
+        if len(self.zips) == 0:
+            nan = np.full(len(zips), np.nan)
+            return nan, nan.copy()
+        pos, found = self._positions(zips)
+        # float32 stocké -> arrondi à 1e-6° (~10 cm) pour retrouver des valeurs propres
+        lat = np.where(found, self.codes["lat"][pos], np.nan).astype("float64").round(6)
+        lon = np.where(found, self.codes["lon"][pos], np.nan).astype("float64").round(6)
+        return lat, lon
+
+    def communes(self, zipcode):
+        pos, found = self._positions([zipcode])
+        if not found[0]:
+            return []
+        a, b = int(self.offsets[pos[0]]), int(self.offsets[pos[0] + 1])
+        return bytes(self.blob[a:b]).decode("utf-8").split(SEP)
+
+
+@lru_cache(maxsize=1)
+def get_index(path=INDEX_DIR):
+    """Index chargé une fois par processus, ou None s'il n'a pas été construit."""
+    if not os.path.exists(os.path.join(path, "codes.npy")):
+        return None
+    return GeoIndex(path)
+
+
+def geocode_zips(zips):
+    """API commune cleaner/app : codes postaux -> (lat, lon) en tableaux float64 (NaN si inconnu).
+    Utilise l'index local ; à défaut (pas encore construit) retombe sur pgeocode, sauf GEO_OFFLINE,
+    et sans réseau renvoie des NaN plutôt que d'échouer."""
+    zips = list(zips)
+    idx = get_index()
+    if idx is not None:
+        return idx.lookup(zips)
+    try:
+        if GEO_OFFLINE:
+            raise RuntimeError("index absent (data/geo/) et GEO_OFFLINE=1")
+        import pgeocode
+        geo = pgeocode.Nominatim("fr").query_postal_code([str(z) for z in zips])
+        return geo["latitude"].to_numpy("float64"), geo["longitude"].to_numpy("float64")
+    except Exception as e:
+        warnings.warn(f"Géocodage indisponible (index absent, pgeocode en échec) : {e}")
+        nan = np.full(len(zips), np.nan)
+        return nan, nan.copy()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Index de géocodage CP -> coordonnées")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--source", help="export GeoNames FR.txt local (sinon téléchargement pgeocode)")
+    b.add_argument("--out", default=INDEX_DIR)
+    q = sub.add_parser("query")
+    q.add_argument("zips", nargs="+")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        meta = build(args.source, args.out)
+        print(f"Index v{meta['version']} : {meta['postal_codes']} codes postaux → {os.path.normpath(args.out)}")
+    else:
+        idx = get_index()
+        if idx is None:
+            sys.exit("Index absent : lance d'abord `python src/geoindex.py build`.")
+        lat, lon = idx.lookup(args.zips)
+        for z, a, o in zip(args.zips, lat, lon):
+            print(z, a, o, ", ".join(idx.communes(z)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction des JSON embarqués dans les <script> d'une page (JSON-LD, __NEXT_DATA__, états inline)
+- Un seul parcours des balises <script> de l'arbre lxml déjà construit par Scrapy
+- Décodage sans regex gourmande : json.JSONDecoder.raw_decode à partir de chaque '{' candidat
+- Backend orjson optionnel pour les payloads JSON « purs »
+- Résultat mis en cache par réponse (plusieurs étapes peuvent le redemander)
+"""
+
+import json
+import weakref
+
+try:  # backend rapide optionnel
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    orjson = None
+    _loads = json.loads
+
+_decoder = json.JSONDecoder()
+_cache = weakref.WeakKeyDictionary()
+
+PURE_JSON_TYPES = ("application/ld+json", "application/json")
+NEXT_MARKER = "__NEXT_DATA__"
+HINTS = ("price", "offers", "address", "geo")
+MAX_CANDIDATES = 64  # '{' essayés au plus par script inline
+
+
+def _loads_safe(txt):
+    try:
+        return _loads(txt)
+    except ValueError:
+        return None
+
+
+def _raw_decode_from(txt, start):
+    """Décode l'objet JSON qui commence à `start` ; renvoie (objet, fin) ou (None, start)."""
+    try:
+        return _decoder.raw_decode(txt, start)
+    except ValueError:
+        return None, start
+
+
+def objects_in_script(txt):
+    """Objets JSON d'un script inline, en un seul balayage linéaire du texte."""
+    out = []
+    # Next.js : window.__NEXT_DATA__ = {...};
+    k = txt.find(NEXT_MARKER)
+    if k != -1:
+        start = txt.find("{", k)
+        if start != -1:
+            # cas courant « = {...}; » en fin de script : décodage direct (orjson si dispo)
+            obj = _loads_safe(txt[start:].rstrip().rstrip(";")) if orjson else None
+            if obj is None:
+                obj, _ = _raw_decode_from(txt, start)
+            if obj is not None:
+                out.append(obj)
+        return out
+
+    if not any(h in txt for h in HINTS):
+        return out
+
+    # candidats = '{' suivis (espaces éventuels) d'une clé entre guillemets
+    pos, tries = txt.find("{"), 0
+    while pos != -1 and tries < MAX_CANDIDATES:
+        j = pos + 1
+        while j < len(txt) and txt[j] in " \t\r\n":
+            j += 1
+        if j < len(txt) and txt[j] == '"':
+            tries += 1
+            obj, end = _raw_decode_from(txt, pos)
+            if obj is not None:
+                out.append(obj)
+                pos = txt.find("{", end)
+                continue
+        pos = txt.find("{", pos + 1)
+    return out
+
+
+def json_blocks_from_root(root):
+    """Parcourt une fois les <script> d'un arbre lxml et renvoie les objets JSON trouvés."""
+    objs = []
+    for el in root.iter("script"):
+        txt = (el.text or "").strip()
+        if not txt:
+            continue
+        typ = (el.get("type") or "").strip().lower()
+        if typ in PURE_JSON_TYPES:
+            data = _loads_safe(txt)
+            if data is not None:
+                objs.append(data)
+        else:
+            objs.extend(objects_in_script(txt))
+    return objs
+
+
+def json_blocks(response):
+    """Version Scrapy, mise en cache par objet réponse."""
+    objs = _cache.get(response)
+    if objs is None:
+        objs = json_blocks_from_root(response.selector.root)
+        _cache[response] = objs
+    return objs
+
+
+def json_blocks_from_html(html: str):
+    """Version fichier/chaîne HTML (parsing local, benchmarks)."""
+    import lxml.html
+    if not html or not html.strip():
+        return []
+    return json_blocks_from_root(lxml.html.fromstring(html))
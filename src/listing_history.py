@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Historique des annonces (SQLite), alimenté à chaque run du cleaner au lieu d'être écrasé
+- listings : dernier état connu de chaque annonce (clé = id canonique, cf. listing_key), first_seen / last_seen / delisted_at
+- events   : journal en ajout seul (nouvelle annonce, baisse / hausse de prix, retrait, remise en ligne),
+  indexé par date -> « tous les changements depuis X » est un parcours d'index, sans relire l'historique
+- Retraits : annonces que le spider a vues répondre 404/410 (last_status de l'état de crawl) ;
+  remise en ligne dès que leur dernier fetch répond de nouveau 200/304
+"""
+
+import os
+import time
+import sqlite3
+
+import pandas as pd
+
+from crawl_state import GONE_STATUSES, gone_ids
+from listing_key import listing_ids
+
+HISTORY_DB = os.getenv("HISTORY_DB", "data/listing_history.sqlite")  # "" = pas d'historique
+
+FIELDS = ["url", "title", "price_eur", "surface_m2", "price_per_m2", "rooms", "city", "zipcode",
+          "latitude", "longitude"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id   TEXT PRIMARY KEY,
+    url          TEXT,
+    title        TEXT,
+    price_eur    REAL,
+    surface_m2   REAL,
+    price_per_m2 REAL,
+    rooms        REAL,
+    city         TEXT,
+    zipcode      TEXT,
+    latitude     REAL,
+    longitude    REAL,
+    first_seen   REAL,
+    last_seen    REAL,
+    delisted_at  REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    listing_id TEXT NOT NULL,
+    at         REAL NOT NULL,
+    kind       TEXT NOT NULL,  -- new | price_drop | price_rise | delisted | relisted
+    old_price  REAL,
+    new_price  REAL
+);
+CREATE INDEX IF NOT EXISTS events_at ON events (at);
+CREATE INDEX IF NOT EXISTS events_listing ON events (listing_id, at);
+"""
+
+_UPSERT = (
+    f"INSERT INTO listings (listing_id, {', '.join(FIELDS)}, first_seen, last_seen, delisted_at) "
+    f"VALUES (?, {', '.join('?' for _ in FIELDS)}, ?, ?, NULL) "
+    "ON CONFLICT (listing_id) DO UPDATE SET "
+    + ", ".join(f"{f} = excluded.{f}" for f in FIELDS)
+    + ", last_seen = excluded.last_seen, delisted_at = NULL"
+)
+
+
+def require_history(path: str, state_db: str):
+    """Arrêt si l'historique manque alors que l'état de crawl existe : le spider ne renverrait que les
+    annonces nouvelles ou modifiées et l'historique recréé ignorerait toutes les autres."""
+    if path and not os.path.exists(path) and state_db and os.path.exists(state_db):
+        raise SystemExit(f"Historique {path} absent mais état de crawl {state_db} présent : restaure l'historique "
+                         f"(versionné dans data/) ou supprime l'état de crawl pour repartir d'un crawl complet.")
+
+
+def _none(v):
+    """NaN / NA pandas -> NULL SQLite."""
+    return None if v is None or (not isinstance(v, str) and pd.isna(v)) else v
+
+
+class ListingHistory:
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def _known(self, ids, columns: str = "price_eur, delisted_at"):
+        """Dernier état (`columns`) des annonces `ids` déjà connues."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS run_ids (listing_id TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM run_ids")
+        self.conn.executemany("INSERT OR IGNORE INTO run_ids VALUES (?)", ((i,) for i in ids))
+        return pd.read_sql_query(
+            f"SELECT listing_id, {columns} FROM listings JOIN run_ids USING (listing_id)",
+            self.conn, index_col="listing_id",
+        )
+
+    def previous(self, ids) -> pd.DataFrame:
+        """CP, commune, €/m² et dernière vue des annonces `ids` déjà connues, indexé par listing_id :
+        à lire avant l'upsert du run (indicateurs de marché comptés par annonce)."""
+        ids = pd.Series(ids).dropna().astype("int64").astype(str)
+        return self._known(ids.tolist(), "zipcode, city, price_per_m2, last_seen")
+
+    def upsert(self, df: pd.DataFrame, at: float = None) -> dict:
+        """Intègre les annonces nettoyées d'un run ; journalise nouveautés, changements de prix et remises
+        en ligne. Renvoie le nombre d'événements par type. Rejouer le même run n'ajoute aucun événement."""
+        at = time.time() if at is None else at
+        if df.empty or "url" not in df:
+            return {}
+        ids = df["listing_id"] if "listing_id" in df else listing_ids(df["url"])
+        df = df.assign(listing_id=ids).dropna(subset=["listing_id"])
+        df["listing_id"] = df["listing_id"].astype("int64").astype(str)  # même clé texte que l'état de crawl
+        df = df.drop_duplicates("listing_id", keep="last")
+        known = self._known(df["listing_id"].tolist())
+
+        ids = df["listing_id"].to_numpy()
+        price = pd.to_numeric(df.get("price_eur", pd.Series(index=df.index, dtype="float64")),
+                              errors="coerce").to_numpy("float64")
+        old = known.reindex(ids)
+        old_price = old["price_eur"].to_numpy("float64")
+        is_new = ~pd.Index(ids).isin(known.index)
+        relisted = old["delisted_at"].notna().to_numpy()
+        moved = ~is_new & ~pd.isna(old_price) & ~pd.isna(price) & (price != old_price)
+
+        events = [(lid, at, "new", None, _none(p)) for lid, p in zip(ids[is_new], price[is_new])]
+        events += [(lid, at, "relisted", None, None) for lid in ids[relisted]]
+        events += [(lid, at, "price_drop" if p < o else "price_rise", float(o), float(p))
+                   for lid, o, p in zip(ids[moved], old_price[moved], price[moved])]
+
+        vals = df.reindex(columns=["listing_id"] + FIELDS).astype(object)
+        vals = vals.where(vals.notna(), None)  # NaN / NA -> NULL, colonne par colonne
+        rows = (row + (at, at) for row in vals.itertuples(index=False, name=None))
+        with self.conn:
+            # first_seen n'est écrit qu'à l'insertion (absent du DO UPDATE)
+            self.conn.executemany(_UPSERT, rows)
+            self.conn.executemany(
+                "INSERT INTO events (listing_id, at, kind, old_price, new_price) VALUES (?, ?, ?, ?, ?)", events)
+        counts = {}
+        for e in events:
+            counts[e[2]] = counts.get(e[2], 0) + 1
+        return counts
+
+    def mark_delisted(self, ids, at: float = None) -> int:
+        """Marque comme retirées les annonces `ids` encore en ligne ; renvoie le nombre de retraits."""
+        at = time.time() if at is None else at
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS gone_ids (listing_id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM gone_ids")
+            self.conn.executemany("INSERT OR IGNORE INTO gone_ids VALUES (?)", ((i,) for i in ids))
+            self.conn.execute(
+                "INSERT INTO events (listing_id, at, kind, old_price, new_price) "
+                "SELECT listing_id, ?, 'delisted', price_eur, NULL FROM listings "
+                "WHERE delisted_at IS NULL AND listing_id IN (SELECT listing_id FROM gone_ids)", (at,))
+            cur = self.conn.execute(
+                "UPDATE listings SET delisted_at = ? "
+                "WHERE delisted_at IS NULL AND listing_id IN (SELECT listing_id FROM gone_ids)", (at,))
+        return cur.rowcount
+
+    def mark_relisted(self, ids, at: float = None) -> int:
+        """Remet en ligne les annonces `ids` marquées retirées ; renvoie le nombre de remises en ligne."""
+        at = time.time() if at is None else at
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS back_ids (listing_id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM back_ids")
+            self.conn.executemany("INSERT OR IGNORE INTO back_ids VALUES (?)", ((i,) for i in ids))
+            self.conn.execute(
+                "INSERT INTO events (listing_id, at, kind, old_price, new_price) "
+                "SELECT listing_id, ?, 'relisted', NULL, NULL FROM listings "
+                "WHERE delisted_at IS NOT NULL AND listing_id IN (SELECT listing_id FROM back_ids)", (at,))
+            cur = self.conn.execute(
+                "UPDATE listings SET delisted_at = NULL, last_seen = ? "
+                "WHERE delisted_at IS NOT NULL AND listing_id IN (SELECT listing_id FROM back_ids)", (at,))
+        return cur.rowcount
+
+    def sync_gone(self, state_db: str) -> int:
+        """Retraits d'après l'état de crawl : annonces dont le dernier fetch a répondu 404/410.
+        Les annonces retirées dont le dernier fetch ne l'est plus (200, 304) sont remises en ligne,
+        y compris celles inchangées que le spider n'a pas ré-émises."""
+        if not state_db or not os.path.exists(state_db):
+            return 0
+        gone = gone_ids(state_db)
+        delisted = [r[0] for r in self.conn.execute("SELECT listing_id FROM listings WHERE delisted_at IS NOT NULL")]
+        src = sqlite3.connect(f"file:{state_db}?mode=ro", uri=True)
+        gone_sql = ", ".join("?" for _ in GONE_STATUSES)
+        try:
+            back = []
+            for i in range(0, len(delisted), 500):  # limite de paramètres SQLite
+                chunk = delisted[i:i + 500]
+                back += [r[0] for r in src.execute(
+                    f"SELECT listing_id FROM listings WHERE listing_id IN ({', '.join('?' for _ in chunk)}) "
+                    f"AND last_status NOT IN ({gone_sql})", (*chunk, *GONE_STATUSES))]
+        except sqlite3.OperationalError:  # état vide / sans table
+            back = []
+        finally:
+            src.close()
+        if back:
+            self.mark_relisted(back)
+        return self.mark_delisted(gone) if gone else 0
+
+    # ---------- Requêtes ----------
+    def changes_since(self, since: float, kinds=None, limit: int = None) -> pd.DataFrame:
+        """Événements depuis `since` (timestamp), du plus récent au plus ancien, avec le contexte de l'annonce.
+        Parcours de l'index events_at : coût proportionnel au nombre de changements, pas à l'historique."""
+        sql = ("SELECT e.at, e.kind, e.old_price, e.new_price, l.listing_id, l.title, l.city, l.zipcode, "
+               "l.price_per_m2, l.url FROM events e JOIN listings l USING (listing_id) WHERE e.at >= ?")
+        params = [since]
+        if kinds:
+            sql += f" AND e.kind IN ({', '.join('?' for _ in kinds)})"
+            params += list(kinds)
+        sql += " ORDER BY e.at DESC, e.seq DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        df = pd.read_sql_query(sql, self.conn, params=params)
+        df["at"] = pd.to_datetime(df["at"], unit="s", utc=True)
+        return df
+
+    def price_history(self, listing_id: str) -> pd.DataFrame:
+        """Prix successifs d'une annonce (événements de l'annonce, index events_listing)."""
+        df = pd.read_sql_query(
+            "SELECT at, kind, old_price, new_price FROM events WHERE listing_id = ? ORDER BY at, seq",
+            self.conn, params=(listing_id,))
+        df["at"] = pd.to_datetime(df["at"], unit="s", utc=True)
+        return df
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Identifiant canonique des annonces SeLoger
+- Id numérique extrait du chemin de l'URL (.../247201957.htm) : clé primaire (int64) du spider,
+  du cleaner, de l'historique et de l'app ; une même annonce atteinte depuis plusieurs recherches
+  n'est plus comptée qu'une fois
+- URL propre : l'URL sans query ni fragment (ln=, serp_view=, search=, m= ne sont que du tracking)
+- URL sans id reconnaissable : empreinte négative du chemin (jamais en collision avec un vrai id)
+"""
+
+import re
+import hashlib
+
+import pandas as pd
+
+LISTING_ID_RE = re.compile(r"/(\d{5,})\.htm")
+
+
+def clean_url(url):
+    """URL sans query ni fragment ; None si vide."""
+    if not isinstance(url, str):
+        return None
+    url = url.strip().partition("#")[0].partition("?")[0]
+    return url or None
+
+
+def _fallback_id(clean: str) -> int:
+    d = hashlib.blake2b(clean.encode("utf-8"), digest_size=8).digest()
+    return -(int.from_bytes(d, "little") >> 1) - 1  # int64 < 0
+
+
+def _id_of_clean(clean):
+    if clean is None:
+        return None
+    stem = clean.rpartition("/")[2]
+    if stem.endswith(".htm") and len(stem) >= 9 and stem[:-4].isdecimal():  # cas courant : .../247201957.htm
+        return int(stem[:-4])
+    m = LISTING_ID_RE.search(clean)
+    return int(m.group(1)) if m else _fallback_id(clean)
+
+
+def listing_id(url):
+    """Id SeLoger (int) de l'URL, sinon empreinte négative de l'URL propre ; None si pas d'URL."""
+    return _id_of_clean(clean_url(url))
+
+
+def canonical(url):
+    """(id, URL propre) d'une URL d'annonce."""
+    clean = clean_url(url)
+    return _id_of_clean(clean), clean
+
+
+# ---------- Version colonnes (cleaner, app) ----------
+# une boucle sur des chaînes courtes (partition + regex compilée) bat ici les méthodes .str de pandas
+def listing_ids(urls: pd.Series) -> pd.Series:
+    """Colonne d'URLs -> ids Int64 (<NA> sans URL)."""
+    return canonical_columns(urls)[0]
+
+
+def canonical_columns(urls: pd.Series):
+    """(ids Int64, URLs propres) d'une colonne d'URLs, en une passe."""
+    clean = [clean_url(u) for u in urls]
+    ids = pd.array([_id_of_clean(c) for c in clean], dtype="Int64")
+    return pd.Series(ids, index=urls.index), pd.Series(clean, index=urls.index, dtype=object)
+
+
+def with_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Ajoute/complète listing_id et remplace l'URL par sa forme propre (sorties d'avant les ids)."""
+    if "url" not in df.columns:
+        if "listing_id" not in df.columns:
+            df.insert(0, "listing_id", pd.Series(pd.NA, index=df.index, dtype="Int64"))
+        return df
+    ids, urls = canonical_columns(df["url"])  # l'id se déduit de l'URL : recalculé plutôt que relu (CSV -> float)
+    if "listing_id" in df.columns:
+        df["listing_id"] = ids.fillna(pd.to_numeric(df["listing_id"], errors="coerce").round().astype("Int64"))
+    else:
+        df.insert(0, "listing_id", ids)
+    df["url"] = urls
+    return df
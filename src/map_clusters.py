@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Agrégation spatiale côté serveur pour la carte pydeck
+- Index « quadtree » : coordonnées Web Mercator entières au niveau QUAD_LEVEL, calculées une fois
+  par version des données (data_layer.prepare) ; la cellule d'un point au zoom z s'obtient
+  par simple décalage de bits
+- Au-delà de POINT_LIMIT points, la carte envoie des cellules (effectif, médiane €/m²) ;
+  les cellules peu denses (<= CELL_POINTS annonces) restent détaillées point par point
+- Seules les colonnes utiles aux couches sont sérialisées vers le navigateur
+"""
+
+import numpy as np
+import pandas as pd
+
+QUAD_LEVEL = 20      # résolution de l'index (~40 cm à Paris)
+CELL_SHIFT = 2       # cellule = tuile de zoom z+2, soit ~64 px à l'écran
+MIN_ZOOM, MAX_ZOOM = 8, 16
+POINT_LIMIT = 3000   # en dessous : tous les points et leurs étiquettes
+MAX_CELLS = 1500     # au-dessus : niveau d'agrégation plus grossier
+CELL_POINTS = 3      # cellules <= CELL_POINTS annonces : points individuels
+
+POINT_COLUMNS = ["longitude", "latitude", "price_label", "title", "detail"]
+CELL_COLUMNS = ["longitude", "latitude", "count", "radius", "price_label", "title", "detail"]
+
+
+# ---------- Index ----------
+def quad_xy(lat, lon, level=QUAD_LEVEL):
+    """Coordonnées de tuile Web Mercator entières au niveau `level` (NaN -> -1)."""
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    n = float(1 << level)
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    with np.errstate(invalid="ignore"):
+        x = (lon + 180.0) / 360.0 * n
+        y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * n
+    x = np.where(ok, np.clip(x, 0, n - 1), -1).astype(np.int64)
+    y = np.where(ok, np.clip(y, 0, n - 1), -1).astype(np.int64)
+    return x, y
+
+
+def cell_keys(qx, qy, zoom):
+    """Identifiant de cellule (entier) des points au zoom `zoom`."""
+    shift = max(QUAD_LEVEL - (zoom + CELL_SHIFT), 0)
+    qx = np.asarray(qx, dtype=np.int64) >> shift
+    qy = np.asarray(qy, dtype=np.int64) >> shift
+    return (qx << 32) | qy
+
+
+def pick_zoom(qx, qy, max_cells=MAX_CELLS):
+    """Zoom le plus fin (MIN_ZOOM..MAX_ZOOM) où le nombre de cellules reste <= max_cells."""
+    for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+        if np.unique(cell_keys(qx, qy, zoom)).size <= max_cells:
+            return zoom
+    return MIN_ZOOM
+
+
+def fit_zoom(lat, lon):
+    """Zoom initial qui englobe l'étendue des points (borné à MIN_ZOOM..MAX_ZOOM)."""
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    span = max(np.nanmax(lat) - np.nanmin(lat), np.nanmax(lon) - np.nanmin(lon), 1e-3)
+    # ~1000 px de large : 4 tuiles de 256 px, marge comprise
+    return int(np.clip(np.floor(np.log2(360.0 / span)) + 1, MIN_ZOOM, MAX_ZOOM))
+
+
+# ---------- Données des couches ----------
+def _fmt_int(v: pd.Series) -> pd.Series:
+    """« 12 345 » (tiret si absent), en chaînes même pour une série vide."""
+    return pd.Series([f"{x:,.0f}".replace(",", " ") if pd.notna(x) else "–" for x in v],
+                     index=v.index, dtype=object)
+
+
+def point_data(gdf: pd.DataFrame) -> pd.DataFrame:
+    """Points individuels : position, étiquette k€ et texte du tooltip, rien d'autre."""
+    zipcode = gdf["zipcode_str"].astype("string").fillna("") if "zipcode_str" in gdf else ""
+    detail = (_fmt_int(gdf["price_eur"]) + " €  " + gdf["surface_m2"].round(1).astype(str) + " m²\n"
+              + gdf["city"].astype("string").fillna("") + " " + zipcode)
+    out = pd.DataFrame({
+        "longitude": gdf["longitude"].round(6),
+        "latitude": gdf["latitude"].round(6),
+        "price_label": gdf["price_label"],
+        "title": gdf["title"].astype("string").fillna("Annonce"),
+        "detail": detail,
+    })
+    return out[POINT_COLUMNS].reset_index(drop=True)
+
+
+def cell_data(gdf: pd.DataFrame, keys: np.ndarray) -> pd.DataFrame:
+    """Une ligne par cellule : barycentre, effectif, médiane €/m²."""
+    g = pd.DataFrame({
+        "key": keys,
+        "latitude": gdf["latitude"].to_numpy("float64"),
+        "longitude": gdf["longitude"].to_numpy("float64"),
+        "ppm2": pd.to_numeric(gdf["price_per_m2"], errors="coerce").to_numpy("float64"),
+    }).groupby("key", sort=False)
+    cells = g.agg(latitude=("latitude", "mean"), longitude=("longitude", "mean"),
+                  count=("ppm2", "size"), median=("ppm2", "median")).reset_index(drop=True)
+    median = _fmt_int(cells["median"].round(-1))
+    cells["radius"] = np.sqrt(cells["count"].to_numpy("float64"))  # aire ~ effectif
+    cells["price_label"] = cells["count"].astype(str) + " • " + median + " €/m²"
+    cells["title"] = cells["count"].astype(str) + " annonces"
+    cells["detail"] = "médiane " + median + " €/m²"
+    cells["latitude"], cells["longitude"] = cells["latitude"].round(6), cells["longitude"].round(6)
+    return cells[CELL_COLUMNS]
+
+
+def layer_data(gdf: pd.DataFrame, zoom: int):
+    """(points, cellules) à envoyer à la carte pour ce zoom.
+    Sous POINT_LIMIT : tout en points. Sinon : cellules denses agrégées, cellules creuses en points
+    (tant que ces points isolés restent sous POINT_LIMIT, sinon tout est agrégé)."""
+    if len(gdf) <= POINT_LIMIT:
+        return point_data(gdf), cell_data(gdf.iloc[:0], np.empty(0, dtype=np.int64))
+    keys = cell_keys(gdf["qx"].to_numpy(), gdf["qy"].to_numpy(), zoom)
+    _, inv, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    sparse = counts[inv] <= CELL_POINTS
+    if sparse.sum() > POINT_LIMIT:
+        sparse[:] = False
+    return point_data(gdf[sparse]), cell_data(gdf[~sparse], keys[~sparse])
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Indicateurs de marché par code postal et par commune : effectif, p10 / médiane / p90 du €/m², tendance
+- Esquisse de quantiles fusionnable (type DDSketch) : chaque €/m² tombe dans un seau logarithmique
+  (erreur relative <= ALPHA) ; l'état n'est qu'un comptage (niveau, clé, période, seau)
+- Effectifs en annonces, pas en observations : chaque annonce compte une fois dans « all » (sa dernière
+  version) et une fois par mois où elle a été vue (sa dernière version du mois). Un run ajoute le seau
+  courant de ses annonces et retire celui de leur version précédente, lue dans l'historique
+  (listing_history) avant l'upsert du run -> pas d'historique, pas d'indicateurs
+- Un même brut n'est compté qu'une fois (empreinte mémorisée dans les métadonnées)
+- Sorties : data/market_sketch.parquet (état) et data/market_stats.csv (indicateurs publiés)
+- Coût : à ~1M lignes, recalculer les quantiles exacts n'est pas plus lent (bench_market_stats) ;
+  l'esquisse sert surtout à ne pas relire l'historique complet à chaque run
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SKETCH = "data/market_sketch.parquet"
+STATS = "data/market_stats.csv"
+ALPHA = 0.01                          # erreur relative des quantiles
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = np.log(GAMMA)
+QUANTILES = {"p10": 0.10, "median": 0.50, "p90": 0.90}
+LEVELS = {"zipcode": "zipcode", "city": "city"}  # niveau -> colonne du DataFrame nettoyé
+KEEP_SOURCES = 100                    # empreintes de bruts déjà comptés conservées
+ALL = "all"                           # période des effectifs toutes périodes confondues
+UNIT = "listing"                      # unité des comptages (métadonnées de l'esquisse)
+
+SKETCH_SCHEMA = pa.schema([
+    ("level", pa.dictionary(pa.int8(), pa.string())),
+    ("key", pa.string()),
+    ("period", pa.string()),          # mois du run : "2026-10"
+    ("bucket", pa.int32()),
+    ("count", pa.int64()),
+])
+_GROUP = ["level", "key", "period", "bucket"]
+
+
+# ---------- Esquisse ----------
+def bucket_of(values) -> np.ndarray:
+    """Seau logarithmique de chaque valeur (> 0)."""
+    return np.ceil(np.log(np.asarray(values, dtype="float64")) / LOG_GAMMA).astype(np.int32)
+
+
+def bucket_value(buckets) -> np.ndarray:
+    """Valeur représentative d'un seau (erreur relative <= ALPHA pour tout point du seau)."""
+    return 2.0 * GAMMA ** np.asarray(buckets, dtype="float64") / (GAMMA + 1.0)
+
+
+def sketch_rows(df: pd.DataFrame, period: str, overall: bool = True) -> pd.DataFrame:
+    """Comptages (niveau, clé, période, seau) des €/m² de `df` (une ligne par annonce) ;
+    `overall` : mêmes comptages recopiés dans la période ALL."""
+    ppm2 = pd.to_numeric(df.get("price_per_m2", pd.Series(dtype="float64")), errors="coerce")
+    frames = []
+    for level, col in LEVELS.items():
+        if col not in df.columns:
+            continue
+        key = df[col].astype("string").str.strip()
+        ok = ppm2.gt(0) & key.notna() & key.ne("")
+        if not ok.any():
+            continue
+        part = pd.DataFrame({"key": key[ok].to_numpy(dtype=object), "bucket": bucket_of(ppm2[ok])})
+        part = part.groupby(["key", "bucket"], sort=False).size().rename("count").reset_index()
+        part.insert(0, "level", level)
+        part.insert(2, "period", period)
+        frames.append(part)
+        if overall:
+            frames.append(part.assign(period=ALL))
+    if not frames:
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in
+                             [("level", object), ("key", object), ("period", object),
+                              ("bucket", "int32"), ("count", "int64")]})
+    return pd.concat(frames, ignore_index=True)
+
+
+def listing_delta(df: pd.DataFrame, previous: pd.DataFrame, period: str) -> pd.DataFrame:
+    """Contribution d'un run, une fois par annonce : +1 au seau courant de chaque annonce de `df`,
+    -1 au seau de sa version précédente (`previous` : ListingHistory.previous, indexé par listing_id),
+    dans ALL toujours et dans `period` si l'annonce y avait déjà été comptée. Annonces sans id ignorées."""
+    df = df.dropna(subset=["listing_id"])
+    ids = df["listing_id"].astype("int64").astype(str)  # même clé texte que l'historique
+    df = df.assign(listing_id=ids).drop_duplicates("listing_id", keep="last")
+    prev = previous[previous.index.isin(df["listing_id"])] if previous is not None else pd.DataFrame()
+    parts = [sketch_rows(df, period)]
+    if not prev.empty:
+        seen = pd.to_datetime(prev["last_seen"], unit="s", utc=True).dt.strftime("%Y-%m")
+        parts.append(_negate(sketch_rows(prev, ALL, overall=False)))
+        parts.append(_negate(sketch_rows(prev[seen.to_numpy() == period], period, overall=False)))
+    return _sum(parts)
+
+
+def _negate(sketch: pd.DataFrame) -> pd.DataFrame:
+    return sketch.assign(count=-sketch["count"])
+
+
+def _sum(parts) -> pd.DataFrame:
+    parts = [s for s in parts if s is not None and not s.empty]
+    if not parts:
+        return sketch_rows(pd.DataFrame(), "")
+    merged = pd.concat(parts, ignore_index=True)
+    return merged.groupby(_GROUP, sort=True, observed=True)["count"].sum().reset_index()
+
+
+def merge(*sketches: pd.DataFrame) -> pd.DataFrame:
+    """Fusion d'esquisses : somme des comptages par (niveau, clé, période, seau), seaux vides retirés
+    (un retrait sans ajout correspondant, p. ex. esquisse réinitialisée, ne descend pas sous zéro)."""
+    merged = _sum(sketches)
+    return merged[merged["count"] > 0].reset_index(drop=True)
+
+
+def quantiles(sketch: pd.DataFrame, by) -> pd.DataFrame:
+    """Effectif + quantiles QUANTILES par groupe `by` (sous-ensemble de level/key/period)."""
+    s = sketch.groupby(by + ["bucket"], sort=True, observed=True)["count"].sum().reset_index()
+    if s.empty:
+        return pd.DataFrame(columns=by + ["count"] + list(QUANTILES))
+    grp = s.groupby(by, sort=False, observed=True)
+    cum = grp["count"].cumsum().to_numpy()
+    total = grp["count"].transform("sum").to_numpy()
+    out = grp["count"].sum().rename("count").reset_index()
+    gid = grp.ngroup().to_numpy()
+    for name, q in QUANTILES.items():
+        # premier seau dont l'effectif cumulé dépasse le rang q * (n - 1) (par groupe)
+        hit = cum > np.floor(q * (total - 1))
+        first = pd.Series(s["bucket"].to_numpy()[hit]).groupby(gid[hit], sort=True).first()
+        out[name] = np.round(bucket_value(first.reindex(np.arange(len(out))).to_numpy()), 0)
+    return out
+
+
+# ---------- Persistance ----------
+def load_sketch(path: str = SKETCH):
+    """(esquisse, empreintes des bruts déjà comptés) ; vide si le fichier n'existe pas."""
+    if not os.path.exists(path):
+        return merge(), []
+    table = pq.read_table(path)
+    meta = table.schema.metadata or {}
+    if table.num_rows and meta.get(b"unit", b"").decode() != UNIT:
+        # ancienne esquisse comptée en observations (une par ligne de chaque run) : repart de zéro
+        print(f"Indicateurs : esquisse {path} comptée en observations, réinitialisée (comptage par annonce).")
+        return merge(), []
+    df = table.to_pandas()
+    df["level"] = df["level"].astype(object)
+    return df, json.loads(meta.get(b"sources", b"[]"))
+
+
+def save_sketch(sketch: pd.DataFrame, sources, path: str = SKETCH):
+    table = pa.Table.from_pandas(sketch[_GROUP + ["count"]], schema=SKETCH_SCHEMA, preserve_index=False)
+    table = table.replace_schema_metadata({"sources": json.dumps(sources[-KEEP_SOURCES:]), "unit": UNIT})
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def summarize(sketch: pd.DataFrame) -> pd.DataFrame:
+    """Indicateurs publiés : une ligne par (niveau, clé) toutes périodes confondues (période ALL),
+    puis une ligne par (niveau, clé, période) pour la tendance."""
+    is_all = sketch["period"] == ALL
+    overall = quantiles(sketch[is_all], ["level", "key"]).assign(period=ALL)
+    by_period = quantiles(sketch[~is_all], ["level", "key", "period"])
+    cols = ["level", "key", "period", "count"] + list(QUANTILES)
+    return pd.concat([overall[cols], by_period[cols]], ignore_index=True)
+
+
+def file_fingerprint(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def update(df: pd.DataFrame, previous: pd.DataFrame, source: str = None, period: str = None,
+           sketch_path: str = SKETCH, stats_path: str = STATS):
+    """Verse les annonces nettoyées d'un run dans l'esquisse persistée et réécrit les indicateurs.
+    `previous` : versions précédentes de ces annonces (ListingHistory.previous, lu avant l'upsert du run) ;
+    `source` : empreinte du brut (un brut déjà compté est ignoré). Retourne le solde d'annonces du mois."""
+    period = period or current_period()
+    return apply_delta(listing_delta(df, previous, period), source, sketch_path, stats_path)
+
+
+def current_period() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m")
+
+
+def apply_delta(delta: pd.DataFrame, source: str = None, sketch_path: str = SKETCH, stats_path: str = STATS):
+    """Fusionne une esquisse de run (sketch_rows, éventuellement cumulée par lots) dans l'esquisse persistée."""
+    sketch, sources = load_sketch(sketch_path)
+    if source is not None and source in sources:
+        print(f"Indicateurs : brut {source[:8]} déjà compté, esquisse inchangée.")
+        return 0
+    sketch = merge(sketch, delta)
+    save_sketch(sketch, sources + ([source] if source else []), sketch_path)
+    summarize(sketch).to_csv(stats_path, index=False, encoding="utf-8")
+    month = delta[(delta["level"] == "zipcode") & (delta["period"] != ALL)]
+    n = int(month["count"].sum())
+    periods = ", ".join(sorted(month["period"].unique())) or "-"
+    print(f"Indicateurs : {n:+d} annonces par code postal ({periods}), {sketch['key'].nunique()} clés -> {stats_path}")
+    return n
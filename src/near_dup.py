@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Détection des re-publications : un même bien publié sous plusieurs listing_id
+(plusieurs agences, annonce supprimée puis reposée)
+- Blocage : seules les annonces d'un même bloc (CP, sinon ville ; pièces ; surface arrondie) sont
+  comparées. Deux grilles de surface décalées d'un demi-pas : deux surfaces à moins de
+  SURFACE_STEP / 2 m² partagent toujours un bloc
+- Titres comparés par MinHash (3-grammes de caractères, NUM_PERM permutations, calcul vectorisé
+  sur tous les titres) puis LSH par bandes : candidats = même bloc et même bande
+- Vérification : chaque candidat est comparé au premier membre de son seau (similarité MinHash
+  >= SIM_THRESHOLD, écart de prix <= MAX_PRICE_GAP), puis union-find -> grappes
+- Coût ~linéaire : ni comparaison deux à deux, ni seau parcouru plus d'une fois
+Résultat : colonne dup_cluster = plus petit listing_id de la grappe (le sien pour une annonce unique).
+"""
+
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+SURFACE_STEP = float(os.getenv("DUP_SURFACE_STEP", "4"))   # m², pas des grilles de surface
+NUM_PERM = 24                                               # permutations MinHash
+BANDS = 6                                                   # bandes LSH (NUM_PERM // BANDS valeurs par bande)
+SIM_THRESHOLD = float(os.getenv("DUP_SIM", "0.6"))          # similarité de Jaccard estimée minimale
+MAX_PRICE_GAP = float(os.getenv("DUP_PRICE_GAP", "0.1"))    # écart de prix relatif maximal
+
+_rng = np.random.default_rng(20240601)  # permutations fixes : grappes reproductibles d'un run à l'autre
+_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def norm_title(t) -> str:
+    """Minuscules, sans accents, alphanumérique + espaces simples (au moins 3 caractères)."""
+    if not isinstance(t, str):
+        return "   "
+    t = unicodedata.normalize("NFKD", t.lower()).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", t).strip().ljust(3)
+
+
+def minhash(titles) -> np.ndarray:
+    """Signatures MinHash (n, NUM_PERM) des 3-grammes de caractères, sans boucle par titre."""
+    titles = [norm_title(t) for t in titles]
+    if not titles:
+        return np.empty((0, NUM_PERM), dtype=np.uint64)
+    lens = np.fromiter(map(len, titles), np.int64, len(titles))
+    data = np.frombuffer("".join(titles).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+    starts = np.concatenate([[0], np.cumsum(lens)[:-1]])
+    # 3-gramme débutant en p valide s'il ne déborde pas sur le titre suivant
+    owner = np.repeat(np.arange(len(titles)), lens)
+    valid = np.arange(len(data)) - starts[owner] <= lens[owner] - 3
+    pos = np.flatnonzero(valid)
+    grams = (data[pos] << np.uint64(16)) | (data[pos + 1] << np.uint64(8)) | data[pos + 2]
+    first = np.concatenate([[0], np.cumsum(lens - 2)[:-1]])  # premier 3-gramme de chaque titre
+    sig = np.empty((len(titles), NUM_PERM), dtype=np.uint64)
+    for k in range(NUM_PERM):  # hachage multiplicatif (a * x + b) mod 2^64, bits de poids fort
+        h = (grams * _A[k] + _B[k]) >> np.uint64(32)
+        sig[:, k] = np.minimum.reduceat(h, first)
+    return sig
+
+
+def _blocks(df: pd.DataFrame):
+    """Deux codes de bloc par ligne (grilles de surface décalées) ; -1 = pas de bloc."""
+    loc = df["zipcode"].astype("string") if "zipcode" in df else pd.Series(pd.NA, index=df.index, dtype="string")
+    if "city" in df:
+        loc = loc.fillna(df["city"].astype("string").str.strip().str.lower())
+    rooms = pd.to_numeric(df.get("rooms"), errors="coerce").round().fillna(-1).astype("int64") \
+        if "rooms" in df else pd.Series(-1, index=df.index)
+    surface = pd.to_numeric(df["surface_m2"], errors="coerce").to_numpy("float64")
+    out = []
+    for shift in (0.0, 0.5):
+        cell = pd.Series(np.floor(surface / SURFACE_STEP + shift), index=df.index)
+        key = pd.DataFrame({"loc": loc, "rooms": rooms, "cell": cell})
+        code = key.groupby(["loc", "rooms", "cell"], sort=False, dropna=False).ngroup().to_numpy()
+        code[(loc.isna() | cell.isna()).to_numpy()] = -1
+        out.append(code)
+    return out
+
+
+def _components(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Union-find par propagation du plus petit label le long des arêtes (a, b)."""
+    label = np.arange(n)
+    while len(a):
+        low = np.minimum(label[a], label[b])
+        new = label.copy()
+        np.minimum.at(new, a, low)
+        np.minimum.at(new, b, low)
+        new = new[new]  # compression des chemins
+        if np.array_equal(new, label):
+            break
+        label = new
+    return label
+
+
+def dup_clusters(df: pd.DataFrame) -> pd.Series:
+    """dup_cluster (Int64) de chaque ligne : plus petit listing_id des annonces jugées identiques."""
+    ids = pd.to_numeric(df["listing_id"], errors="coerce").astype("Int64") if "listing_id" in df \
+        else pd.Series(pd.NA, index=df.index, dtype="Int64")
+    n = len(df)
+    if n < 2 or "surface_m2" not in df:
+        return ids.rename("dup_cluster")
+
+    # seules les lignes qui partagent un bloc avec une autre sont hachées
+    blocks = _blocks(df)
+    cand = np.zeros(n, dtype=bool)
+    for code in blocks:
+        counts = np.bincount(code[code >= 0], minlength=1)
+        cand |= (code >= 0) & (counts[np.where(code >= 0, code, 0)] > 1)
+    rows = np.flatnonzero(cand)
+    if len(rows) < 2:
+        return ids.rename("dup_cluster")
+
+    titles = df["title"].to_numpy(dtype=object)[rows] if "title" in df else [None] * len(rows)
+    sig = minhash(titles)
+    price = pd.to_numeric(df.get("price_eur"), errors="coerce").to_numpy("float64")[rows] \
+        if "price_eur" in df else np.full(len(rows), np.nan)
+
+    # LSH : clé (bloc, bande, empreinte des valeurs de la bande) ; leader = premier membre du seau
+    r = NUM_PERM // BANDS
+    local = np.arange(len(rows))
+    src, dst = [], []
+    for code in blocks:
+        block = code[rows]
+        ok = block >= 0
+        for j in range(BANDS):
+            band = np.zeros(len(rows), dtype=np.uint64)
+            for v in sig[:, j * r:(j + 1) * r].T:
+                band = (band ^ v) * _MIX
+            key = pd.DataFrame({"block": block[ok], "band": band[ok], "row": local[ok]})
+            leader = key.groupby(["block", "band"], sort=False)["row"].transform("first").to_numpy()
+            pair = leader != key["row"].to_numpy()
+            src.append(leader[pair])
+            dst.append(key["row"].to_numpy()[pair])
+    a, b = np.concatenate(src), np.concatenate(dst)
+
+    # vérification des paires candidates (vectorisée) : titres proches et prix compatibles
+    sim = (sig[a] == sig[b]).mean(axis=1)
+    gap = np.abs(price[a] - price[b]) / np.fmax(price[a], price[b])
+    keep = (sim >= SIM_THRESHOLD) & ~(gap > MAX_PRICE_GAP)  # prix manquant : titre seul
+    comp = _components(len(rows), a[keep], b[keep])
+
+    # id de grappe = plus petit listing_id de la composante
+    label = np.arange(n)
+    label[rows] = rows[comp]
+    return ids.groupby(label).transform("min").astype("Int64").rename("dup_cluster")
@@ -3,13 +3,28 @@
 Option A — Parsing **LOCAL** de fichiers HTML SeLoger (enregistrés manuellement).
 - Dépose tes fichiers dans data/html/ (pages résultats et/ou pages d'annonces).
 - On extrait un sous-ensemble: titre, prix, surface, pièces, ville, CP, lat/lon, URL.
-- Résultat: data/raw_data.json puis data/cleaned_data.csv (via cleaner).
+- Résultat: data/raw_data.jsonl (JSON Lines) puis data/cleaned_data.csv (via cleaner).
+- Gros dossiers : parcours récursif en flux, parsing réparti sur plusieurs processus,
+  annonces écrites au fil de l'eau, dédoublonnage par filtre de Bloom (mémoire fixe) sur l'id
+  canonique de l'annonce. Approximatif : un faux positif (~0,1 % à DEDUP_CAPACITY, bien plus
+  au-delà) écarte une annonce distincte ; le dédoublonnage exact se fait ensuite dans le cleaner.
+- Cartes d'annonces : une passe lxml marque chaque nœud (prix, surface, pièces, lien) ; la carte est
+  le plus petit bloc qui contient un lien et un prix/surface, ses champs sont lus sur les nœuds marqués.
+    python src/parse_local_html.py [--workers 8] [--html-dir data/html] [--out data/raw_data.jsonl]
 """
-import os, re, json
-from bs4 import BeautifulSoup as BS
+import os, re, sys, json, time, argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import lxml.html
+from lxml import etree
+
+from seeds import BloomFilter
+from listing_key import listing_id
 
 HTML_DIR = "data/html"
-OUT_JSON = "data/raw_data.json"
+OUT_JSON = "data/raw_data.jsonl"
+WORKERS = int(os.getenv("HTML_WORKERS", str(os.cpu_count() or 1)))  # 0 = dans ce processus
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "2000000"))       # annonces attendues (filtre de Bloom)
+PROGRESS_EVERY = 1000                                                # fichiers entre deux bilans
 
 def pick_num(txt):
     if not txt: return None
@@ -17,81 +32,203 @@ def pick_num(txt):
     if not m: return None
     return m.group(0).replace(" ", "").replace(",", ".")
 
-def parse_listing_card(card):
-    # Heuristique générique (le DOM peut changer)
-    title = card.get_text(" ", strip=True)[:140]
-    price = None
-    surface = None
-    rooms = None
-    url = None
-
-    a = card.find("a", href=True)
-    if a:
-        url = a["href"]
-
-    # Essais sur quelques libellés fréquents
-    for tag in card.find_all(True):
-        t = tag.get_text(" ", strip=True).lower()
-        if any(k in t for k in ["€", "prix"]):
-            price = pick_num(t)
-        if any(k in t for k in ["m²", "surface"]):
-            surface = pick_num(t)
-        if "pièce" in t or "pieces" in t or "pièces" in t:
-            rooms = pick_num(t)
+# Repères textuels (bits) : calculés une fois par chaîne de texte, propagés aux ancêtres
+PRICE, SURFACE, ROOMS, LINK, CARD = 1, 2, 4, 8, 16
+_MARKERS = ((PRICE, ("€", "prix")), (SURFACE, ("m²", "surface")), (ROOMS, ("pièce", "pieces")))
+_SKIP_TEXT = {"script", "style"}          # contenus ignorés par get_text (BeautifulSoup)
+_CARD_TAGS = {"article", "li", "div"}
+_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+def _marks(txt):
+    t = txt.lower()
+    return sum(bit for bit, keys in _MARKERS if any(k in t for k in keys))
+
+def _strings(el):
+    """Textes non vides sous `el`, dans l'ordre du document (= get_text(" ", strip=True))."""
+    if el.tag not in _SKIP_TEXT and el.text and el.text.strip():
+        yield el.text.strip()
+    for child in el:
+        if isinstance(child.tag, str):  # commentaires : seul leur tail compte
+            yield from _strings(child)
+        if child.tail and child.tail.strip():
+            yield child.tail.strip()
+
+def _text(el, limit=None):
+    """Texte de `el` ; avec `limit`, s'arrête dès `limit` caractères (titre des cartes)."""
+    if limit is None:
+        return " ".join(_strings(el))
+    out, n = [], 0
+    for s in _strings(el):
+        out.append(s)
+        n += len(s) + 1
+        if n > limit:
+            break
+    return " ".join(out)[:limit]
+
+def mark_tree(root):
+    """Une seule passe ascendante : bits PRICE/SURFACE/ROOMS du texte de chaque nœud, LINK (lien
+    <a href> dans le sous-arbre) et CARD (carte dans le sous-arbre). Une carte est le plus petit
+    article/li/div (ou nœud data-test) qui contient un lien et un prix ou une surface.
+    Renvoie (cartes dans l'ordre du document, bits par nœud)."""
+    cards, flags = [], {}
+    for el in reversed(list(root.iter(etree.Element))):  # enfants avant parents
+        f = _marks(el.text) if el.text and el.tag not in _SKIP_TEXT else 0
+        for child in el:
+            f |= flags.get(child, 0)
+            if child.tail:
+                f |= _marks(child.tail)
+        if (f & LINK and f & (PRICE | SURFACE) and not f & CARD
+                and (el.tag in _CARD_TAGS or el.get("data-test") is not None)):
+            f |= CARD
+            cards.append(el)
+        if el.tag == "a" and el.get("href") is not None:
+            f |= LINK
+        flags[el] = f
+    cards.reverse()
+    return cards, flags
 
+def _first_link(card, flags):
+    """Premier <a href> descendant (ordre du document), en ne descendant que dans les branches marquées."""
+    el = card
+    while True:
+        for child in el:
+            if flags.get(child, 0) & LINK:
+                if child.tag == "a" and child.get("href") is not None:
+                    return child.get("href")
+                el = child
+                break
+        else:
+            return None
+
+def _last_marked(card, bit, flags):
+    """Texte du dernier descendant (ordre du document) dont le texte porte `bit` : on suit la dernière
+    branche marquée jusqu'au nœud le plus profond. Un seul get_text par champ."""
+    el = card
+    while True:
+        for child in reversed(el):
+            if flags.get(child, 0) & bit:
+                el = child
+                break
+        else:
+            return _text(el).lower() if el is not card else None
+
+def parse_listing_card(card, flags):
+    # Heuristique générique (le DOM peut changer) : champs lus sur les nœuds repérés par mark_tree
+    title = _text(card, 140)
+    url = _first_link(card, flags)
+    price = pick_num(_last_marked(card, PRICE, flags))
+    surface = pick_num(_last_marked(card, SURFACE, flags))
+    rooms = pick_num(_last_marked(card, ROOMS, flags))
     return {"title": title or None, "price": price, "surface_m2": surface, "rooms": rooms, "url": url}
 
-def parse_file(path):
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        html = f.read()
-    soup = BS(html, "lxml")
+def parse_html(html):
+    if not html or not html.strip():
+        return []
+    try:
+        root = lxml.html.document_fromstring(html.encode("utf-8"), parser=_PARSER)
+    except etree.ParserError:  # document vide après parsing
+        return []
+    cards, flags = mark_tree(root)
 
     items = []
 
-    # 1) Essayer des blocs d'annonces (cards)
-    cards = soup.select("[data-test]") or soup.select("article,div,li")
-    for c in cards[:200]:  # garde une limite
-        it = parse_listing_card(c)
+    # 1) Blocs d'annonces (cards), repérés structurellement
+    for c in cards:
+        it = parse_listing_card(c, flags)
         if any([it.get("price"), it.get("surface_m2"), it.get("url")]):
             items.append(it)
 
     # 2) Si page détail: essayer de capturer des infos plus précises
     # (heuristiques simples)
-    h1 = soup.find("h1")
-    if h1:
-        t = h1.get_text(" ", strip=True)
+    h1 = next(root.iter("h1"), None)
+    if h1 is not None:
+        t = _text(h1)
         if t and len(t) > 5:
             # injecte un enregistrement "detail" minimal
             items.append({"title": t})
 
     return items
 
-def main():
-    all_items = []
-    for name in os.listdir(HTML_DIR):
-        if not name.lower().endswith((".html", ".htm")):
-            continue
-        path = os.path.join(HTML_DIR, name)
-        try:
-            items = parse_file(path)
-            all_items.extend(items)
-            print(f"Parsed {name}: +{len(items)} items")
-        except Exception as e:
-            print("Skip", name, e)
-
-    # dédoublonner grossièrement par URL + titre
-    seen = set()
-    dedup = []
-    for it in all_items:
-        key = (it.get("url"), it.get("title"))
-        if key in seen: 
-            continue
-        seen.add(key)
-        dedup.append(it)
-
-    with open(OUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(dedup[:200], f, ensure_ascii=False, indent=2)
-    print(f"Wrote {OUT_JSON} with {len(dedup[:200])} items")
+def parse_file(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return parse_html(f.read())
+
+def iter_html_files(root):
+    """Fichiers .html/.htm sous `root` (récursif), en flux et dans un ordre stable."""
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except FileNotFoundError:
+        return
+    for e in entries:
+        if e.is_dir(follow_symlinks=False):
+            yield from iter_html_files(e.path)
+        elif e.name.lower().endswith((".html", ".htm")):
+            yield e.path
+
+
+def parse_one(path):
+    """(chemin, annonces, erreur) : exécuté dans un processus de parsing."""
+    try:
+        return path, parse_file(path), None
+    except Exception as e:
+        return path, [], e
+
+
+def parse_many(paths, workers=WORKERS):
+    """Résultats de parse_one au fil de l'eau. Avec des workers, au plus 4 fichiers
+    par processus sont en vol : mémoire bornée quel que soit le nombre de fichiers."""
+    if workers <= 0:
+        yield from map(parse_one, paths)
+        return
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for path in paths:
+            pending.add(pool.submit(parse_one, path))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in done)
+        for f in pending:
+            yield f.result()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Parsing des pages SeLoger enregistrées dans data/html/")
+    ap.add_argument("--html-dir", default=HTML_DIR)
+    ap.add_argument("--out", default=OUT_JSON)
+    ap.add_argument("--workers", type=int, default=WORKERS, help="processus de parsing (0 = aucun)")
+    args = ap.parse_args(argv)
+
+    # dédoublonnage approché par id d'annonce (URL + titre sans URL), en mémoire fixe ; exact dans le cleaner
+    seen = BloomFilter(DEDUP_CAPACITY)
+    warned = False
+    n_files = n_items = n_dup = n_err = 0
+    t0 = time.perf_counter()
+    with open(args.out, "w", encoding="utf-8") as f:
+        for path, items, err in parse_many(iter_html_files(args.html_dir), args.workers):
+            n_files += 1
+            if err is not None:
+                n_err += 1
+                print("Skip", os.path.relpath(path, args.html_dir), err)
+                continue
+            for it in items:
+                lid = listing_id(it.get("url"))
+                if seen.add(str(lid) if lid is not None else f"\x1f{it.get('title')}"):
+                    n_dup += 1
+                    continue
+                f.write(json.dumps(it, ensure_ascii=False) + "\n")
+                n_items += 1
+                if n_items > DEDUP_CAPACITY and not warned:
+                    warned = True
+                    print(f"Attention : plus de {DEDUP_CAPACITY} annonces, le filtre de Bloom sature et écarte "
+                          f"des annonces distinctes ; relancer avec DEDUP_CAPACITY plus grand", file=sys.stderr)
+            if n_files % PROGRESS_EVERY == 0:
+                rate = n_files / (time.perf_counter() - t0)
+                print(f"{n_files} fichiers • {n_items} annonces • {rate:.0f} fichiers/s", file=sys.stderr)
+
+    dt = max(time.perf_counter() - t0, 1e-9)
+    print(f"Wrote {args.out} with {n_items} items ({n_files} files, {n_dup} doublons, {n_err} erreurs, "
+          f"{n_files / dt:.1f} fichiers/s, {args.workers or 'sans'} workers)")
 
 if __name__ == "__main__":
     main()
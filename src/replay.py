@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Enregistrement / rejeu hors-ligne des pages SeLoger (middleware de téléchargement Scrapy)
+- Magasin adressé par contenu : objects/<sha[:2]>/<sha>.gz (corps gzip, stocké une fois)
+  + index.jsonl (une ligne par fetch : url, url finale, statut, en-têtes, sha256, date)
+- HTTP_STORE_MODE=record : chaque réponse 200 est ajoutée au magasin
+- HTTP_STORE_MODE=replay : les réponses viennent du magasin, aucun réseau, aucune attente
+- Purge (le rejeu ne lit que la dernière version de chaque URL) : entrées remplacées ou plus vieilles
+  que --days retirées de l'index, objets plus référencés supprimés
+    python src/replay.py prune [--days 30] [--dir data/http_store]
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import argparse
+import calendar
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+logger = logging.getLogger(__name__)
+
+HTTP_STORE_DIR = "data/http_store"
+
+
+# ---------- Magasin ----------
+class HttpStore:
+    def __init__(self, root: str = HTTP_STORE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._index = None
+
+    # --- lecture ---
+    @property
+    def index(self) -> dict:
+        """url demandée -> dernière entrée d'index (chargé une fois)."""
+        if self._index is None:
+            self._index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            e = json.loads(line)
+                            self._index[e["url"]] = e
+        return self._index
+
+    def urls(self):
+        return list(self.index)
+
+    def body(self, sha: str) -> bytes:
+        with gzip.open(self._object_path(sha), "rb") as f:
+            return f.read()
+
+    def get(self, url: str):
+        """Réponse Scrapy reconstruite pour `url`, ou None si absente du magasin."""
+        e = self.index.get(url)
+        if e is None:
+            return None
+        headers = Headers({k: v for k, v in e["headers"].items()})
+        body = self.body(e["sha256"])
+        cls = responsetypes.from_args(headers=headers, url=e["final_url"], body=body)
+        return cls(url=e["final_url"], status=e["status"], headers=headers, body=body)
+
+    def __iter__(self):
+        """(url, réponse) pour tout le magasin, dans l'ordre d'enregistrement."""
+        for url in self.index:
+            yield url, self.get(url)
+
+    # --- écriture ---
+    def _object_path(self, sha: str) -> str:
+        return os.path.join(self.root, "objects", sha[:2], sha + ".gz")
+
+    def put(self, url: str, response):
+        sha = hashlib.sha256(response.body).hexdigest()
+        path = self._object_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(response.body)
+            os.replace(tmp, path)
+        entry = {
+            "url": url,
+            "final_url": response.url,
+            "status": response.status,
+            "headers": {k.decode("latin-1"): [v.decode("latin-1") for v in vs]
+                        for k, vs in response.headers.items()},
+            "sha256": sha,
+            "fetched_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if self._index is not None:
+            self._index[url] = entry
+
+
+    # --- purge ---
+    def prune(self, max_age_days: float = None):
+        """Garde la dernière entrée de chaque URL (celle que rejoue get), récupérée depuis moins de
+        `max_age_days` jours ; réécrit l'index et supprime les objets qu'il ne référence plus.
+        Renvoie (entrées retirées, objets supprimés)."""
+        if not os.path.exists(self.index_path):
+            return 0, 0
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            n_lines = sum(1 for line in f if line.strip())
+        keep = self.index
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 86400
+            keep = {u: e for u, e in keep.items()
+                    if calendar.timegm(time.strptime(e["fetched_at"], "%Y-%m-%dT%H:%M:%SZ")) >= cutoff}
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for e in keep.values():
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.index_path)
+        self._index = keep
+        live, removed = {e["sha256"] for e in keep.values()}, 0
+        for dirpath, _, files in os.walk(os.path.join(self.root, "objects")):
+            for name in files:
+                if name.endswith(".gz") and name[:-3] not in live:
+                    os.remove(os.path.join(dirpath, name))
+                    removed += 1
+        return n_lines - len(keep), removed
+
+
+# ---------- Middleware ----------
+class RecordReplayMiddleware:
+    """À placer avant PolitenessMiddleware (priorité plus basse) pour que le rejeu
+    court-circuite l'attente et le réseau."""
+
+    def __init__(self, crawler):
+        s = crawler.settings
+        self.mode = (s.get("HTTP_STORE_MODE") or "").lower()
+        if self.mode not in ("record", "replay"):
+            raise NotConfigured
+        self.stats = crawler.stats
+        self.store = HttpStore(s.get("HTTP_STORE_DIR") or HTTP_STORE_DIR)
+        logger.info("HTTP store %s : mode %s", self.store.root, self.mode)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        if self.mode != "replay":
+            return None
+        response = self.store.get(request.url)
+        if response is None:
+            self.stats.inc_value("replay/miss")
+            raise IgnoreRequest(f"absente du magasin : {request.url}")
+        self.stats.inc_value("replay/hit")
+        request.meta["throttle_skip"] = True
+        request.meta["download_latency"] = 0.0
+        return response
+
+    def process_response(self, request, response, spider):
+        if self.mode == "record" and response.status == 200 and not request.meta.get("throttle_skip"):
+            self.store.put(request.url, response)
+            self.stats.inc_value("record/stored")
+        return response
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Magasin HTTP (enregistrement / rejeu)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("prune", help="retire les entrées remplacées / anciennes et les objets orphelins")
+    p.add_argument("--days", type=float, default=None, help="âge maximal des entrées gardées (jours)")
+    p.add_argument("--dir", default=os.getenv("HTTP_STORE_DIR", HTTP_STORE_DIR))
+    args = ap.parse_args()
+    entries, objects = HttpStore(args.dir).prune(args.days)
+    print(f"{args.dir} : {entries} entrées d'index et {objects} objets retirés")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Pages de résultats de recherche SeLoger (SERP) : une requête pour toute une page d'annonces
+- Cartes lues dans le JSON embarqué (__NEXT_DATA__, JSON-LD ItemList…) : une carte est le plus
+  petit objet qui porte un id d'annonce (URL .../<id>.htm ou clé id) et un prix ou une surface ;
+  ses champs passent par la même table que les pages détail (src/field_paths.py)
+- Repli HTML : cartes repérées par la passe lxml de parse_local_html (mark_tree)
+- Pagination : lien rel="next" s'il existe, sinon paramètre page= incrémenté
+- Une carte complète (CARD_FIELDS) suffit pour une annonce déjà connue ; la page détail n'est
+  demandée que pour une annonce nouvelle ou une carte incomplète (décision dans spider.py)
+"""
+
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from listing_key import LISTING_ID_RE, canonical
+from field_paths import extract_fields
+from parse_local_html import mark_tree, parse_listing_card
+
+CARD_FIELDS = ("price", "surface_m2", "rooms", "zipcode")  # champs attendus d'une carte
+ID_KEYS = ("id", "classifiedId", "listingId", "adId")      # id d'annonce sans URL exploitable
+URL_KEYS = ("url", "classifiedURL", "permalink")
+_CONTAINERS = (dict, list)
+
+
+def _direct_id(node: dict):
+    """(id, URL) portés directement par l'objet : URL d'annonce, sinon clé id numérique (5+ chiffres)."""
+    url = next((node[k] for k in URL_KEYS if isinstance(node.get(k), str)), None)
+    if url is None and isinstance(node.get("mainEntityOfPage"), dict):
+        url = node["mainEntityOfPage"].get("@id")
+    if isinstance(url, str) and LISTING_ID_RE.search(url):
+        return canonical(url)[0], url
+    for k in ID_KEYS:
+        v = node.get(k)
+        if isinstance(v, (int, str)) and not isinstance(v, bool) and str(v).isdecimal() and len(str(v)) >= 5:
+            return int(v), url if isinstance(url, str) else None
+    return None, None
+
+
+def json_cards(objs):
+    """[(id, URL ou None, champs extract_fields)] des cartes du JSON embarqué, plus petits objets
+    d'abord : un objet qui contient une carte n'en est pas une (page, ItemList, ListItem…)."""
+    cards = []
+
+    def visit(node) -> bool:
+        if isinstance(node, list):
+            found = False
+            for v in node:
+                if isinstance(v, _CONTAINERS):
+                    found |= visit(v)
+            return found
+        found = False
+        for v in node.values():
+            if isinstance(v, _CONTAINERS):
+                found |= visit(v)
+        if found:
+            return True
+        lid, url = _direct_id(node)
+        if lid is None:
+            return False
+        f = extract_fields([node])
+        if f["price"] in (None, "") and f["surface"] in (None, ""):
+            return False
+        cards.append((lid, url or f["url"], f))
+        return True
+
+    for obj in objs:
+        if isinstance(obj, _CONTAINERS):
+            visit(obj)
+    return cards
+
+
+def html_cards(root):
+    """Même sortie que json_cards pour les cartes HTML (sans CP ni coordonnées) qui ont un lien d'annonce."""
+    cards, flags = mark_tree(root)
+    out = []
+    for c in cards:
+        it = parse_listing_card(c, flags)
+        if it["url"] and LISTING_ID_RE.search(it["url"]):
+            f = {"url": it["url"], "title": it["title"], "price": it["price"], "surface": it["surface_m2"],
+                 "rooms": it["rooms"], "city": None, "zipcode": None, "lat": None, "lon": None}
+            out.append((canonical(it["url"])[0], it["url"], f))
+    return out
+
+
+def missing(item: dict):
+    """Champs de CARD_FIELDS absents de l'annonce."""
+    return [k for k in CARD_FIELDS if item.get(k) in (None, "")]
+
+
+def card_view(item: dict) -> dict:
+    """Champs comparables entre carte et page détail (nombres en float, CP en texte) : base de
+    l'empreinte de contenu en mode SERP, pour qu'une annonce inchangée le reste quelle que soit sa source."""
+    out = {}
+    for k in CARD_FIELDS:
+        v = item.get(k)
+        if k != "zipcode" and v not in (None, ""):
+            try:
+                v = float(v)
+            except (TypeError, ValueError):
+                pass
+        out[k] = None if v in (None, "") else (str(v) if k == "zipcode" else v)
+    return out
+
+
+def page_number(url: str) -> int:
+    q = dict(parse_qsl(urlsplit(url).query))
+    return int(q["page"]) if q.get("page", "").isdecimal() else 1
+
+
+def with_page(url: str, page: int) -> str:
+    """Même recherche, page `page` (paramètre page= ajouté ou remplacé)."""
+    parts = urlsplit(url)
+    q = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "page"]
+    q.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(q)))
+
+
+def next_page(response):
+    """URL de la page suivante : rel="next" de la page, sinon page= + 1."""
+    href = response.css('link[rel="next"]::attr(href), a[rel="next"]::attr(href)').get()
+    if href:
+        return response.urljoin(href)
+    return with_page(response.url, page_number(response.url) + 1)
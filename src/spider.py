@@ -1,29 +1,76 @@
 # -*- coding: utf-8 -*-
 """
-Seloger 20 URLs -> JSON (Scrapy)
-- Lit data/urls.txt (≤20 uniques)
-- Requêtes lentes (REQUEST_DELAY) pour rester prudent
-- Parse via JSON intégré aux pages (JSON-LD / __NEXT_DATA__)
+Seloger URLs -> JSON (Scrapy)
+- Lit les seeds en flux (data/urls.txt par défaut, .gz / shards acceptés, plafond MAX_URLS)
+- Politesse non bloquante (src/throttle.py) : seau à jetons par hôte + délai adaptatif
+- Crawl incrémental (src/crawl_state.py) : requêtes conditionnelles, annonces inchangées sautées
+- Seeds dédoublonnées par id d'annonce et demandées sans query de tracking (src/listing_key.py)
+- Parse via JSON intégré aux pages (JSON-LD / __NEXT_DATA__), optionnellement dans N processus
+- CRAWL_MODE=serp : parcours paginé des recherches (SEARCH_URLS), annonces lues sur les cartes
+  (src/serp.py) ; page détail seulement pour une annonce nouvelle ou une carte incomplète
 - Fallback HTML (meta/regex) + ville depuis l'URL si nécessaire
+- Crawl partagé reprenable (src/frontier.py) : FRONTIER_DB = URLs réclamées par bail dans une base
+  SQLite commune à N processus, politesse par hôte commune à tous
+- Enregistrement / rejeu hors-ligne (src/replay.py) : HTTP_STORE_MODE=record|replay
+- Sortie par défaut : data/raw_data.jsonl (JSON Lines, une annonce par ligne) ;
+  crawl + nettoyage en flux sans brut : python src/stream_pipeline.py
 - À lancer avec:
-    scrapy runspider src/spider.py -O data/raw_data.json -s FEED_EXPORT_ENCODING=utf-8
+    scrapy runspider src/spider.py -O data/raw_data.jsonl -s FEED_EXPORT_ENCODING=utf-8
 """
 
 import os
 import re
-import json
+import sys
 import time
+import pickle
 from html import unescape
+from concurrent.futures import ProcessPoolExecutor
 
 import scrapy
-from scrapy.http import Request
+from scrapy.http import Request, HtmlResponse
 from dotenv import load_dotenv
-
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.request import request_from_dict
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.threads import deferToThread
+from twisted.internet.task import LoopingCall
+
+# src/ reste importable par les processus de parsing (runspider le retire du sys.path)
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from throttle import PolitenessMiddleware
+from seeds import iter_seeds, BloomFilter
+from crawl_state import GONE_STATUSES, CrawlState, listing_id_from_url, content_hash
+from listing_key import canonical, clean_url
+from json_extract import json_blocks
+from field_paths import extract_fields
+from replay import RecordReplayMiddleware, HttpStore
+from frontier import Frontier, FrontierMiddleware, CLAIM_BATCH, default_worker_id
+import serp
 
 # ---------- Config ----------
 load_dotenv()
 REQUEST_DELAY = float(os.getenv("REQUEST_DELAY", "3.0"))
-URLS_PATH = "data/urls.txt"
+# budget par hôte (pages/s) ; par défaut 1 page toutes les REQUEST_DELAY secondes
+RATE_PER_HOST = float(os.getenv("RATE_PER_HOST", str(1.0 / REQUEST_DELAY if REQUEST_DELAY > 0 else 0)))
+CONCURRENT_REQUESTS = int(os.getenv("CONCURRENT_REQUESTS", "8"))
+URLS_PATH = os.getenv("SEEDS", "data/urls.txt")  # fichiers, globs ou dossiers séparés par ','
+MAX_URLS = int(os.getenv("MAX_URLS", "0"))        # 0 = pas de limite
+SEEDS_CAPACITY = int(os.getenv("SEEDS_CAPACITY", "1000000"))  # taille du filtre de Bloom
+STATE_DB = os.getenv("STATE_DB", "data/crawl_state.sqlite")    # "" = crawl complet sans état
+REFRESH_AFTER_HOURS = float(os.getenv("REFRESH_AFTER_HOURS", "0"))  # ne pas re-télécharger avant N h
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))  # >0 : parsing dans N processus (opt-in)
+HTTP_STORE_MODE = os.getenv("HTTP_STORE_MODE", "")    # "record" | "replay" | "" (réseau seul)
+HTTP_STORE_DIR = os.getenv("HTTP_STORE_DIR", "data/http_store")
+RAW_FEED = os.getenv("RAW_FEED", "data/raw_data.jsonl")  # -O en ligne de commande reste prioritaire
+CRAWL_MODE = os.getenv("CRAWL_MODE", "detail")        # "detail" (URLs d'annonces) | "serp" (recherches)
+SEARCH_URLS = os.getenv("SEARCH_URLS", "data/search_urls.txt")  # mode serp : URLs de recherche
+SERP_MAX_PAGES = int(os.getenv("SERP_MAX_PAGES", "100"))        # pages suivies par recherche
+FRONTIER_DB = os.getenv("FRONTIER_DB", "")            # crawl partagé : base de la frontière ("" = seeds)
+WORKER_ID = os.getenv("WORKER_ID") or default_worker_id()
 
 UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -65,138 +112,23 @@ def first(*vals):
     return None
 
 
-def deep_get(obj, *paths):
-    """Essaye plusieurs chemins 'dot' dans des dicts/listes imbriqués."""
-    for path in paths:
-        cur = obj
-        try:
-            for key in path.split("."):
-                if isinstance(cur, list):
-                    nxt = None
-                    for it in cur:
-                        if isinstance(it, dict) and key in it:
-                            nxt = it[key]
-                            break
-                    cur = nxt if nxt is not None else (cur[0] if cur else None)
-                else:
-                    cur = cur[key]
-            if cur not in (None, "", [], {}):
-                return cur
-        except Exception:
-            continue
-    return None
-
-
-def walk_json(obj):
-    if isinstance(obj, dict):
-        yield obj
-        for v in obj.values():
-            yield from walk_json(v)
-    elif isinstance(obj, list):
-        for it in obj:
-            yield from walk_json(it)
-
-
 def parse_json_blocks(response):
-    """Récupère des objets JSON depuis <script> (JSON-LD, __NEXT_DATA__, etc.)."""
-    objs = []
-
-    # 1) JSON "purs"
-    for txt in response.css('script[type="application/ld+json"]::text, script[type="application/json"]::text').getall():
-        txt = (txt or "").strip()
-        if not txt:
-            continue
-        try:
-            data = json.loads(txt)
-            objs.append(data)
-        except Exception:
-            pass
-
-    # 2) Balises <script> génériques : __NEXT_DATA__ = {...}
-    for raw in response.css("script::text").getall():
-        t = (raw or "").strip()
-        if not t:
-            continue
-        # Next.js __NEXT_DATA__
-        m = re.search(r"__NEXT_DATA__\s*=\s*({.*?});", t, flags=re.S)
-        if m:
-            try:
-                data = json.loads(m.group(1))
-                objs.append(data)
-            except Exception:
-                pass
-            continue
-        # sinon, tenter 1 gros objet JSON s'il semble pertinent
-        if "price" in t or "offers" in t or "address" in t or "geo" in t:
-            m2 = re.search(r"({.*})", t, flags=re.S)
-            if m2:
-                try:
-                    data = json.loads(m2.group(1))
-                    objs.append(data)
-                except Exception:
-                    pass
-
-    return objs
+    """Récupère des objets JSON depuis <script> (JSON-LD, __NEXT_DATA__, etc.).
+    Un seul passage sur les scripts + raw_decode, voir src/json_extract.py."""
+    return json_blocks(response)
 
 
 def extract_from_jsonobjs(jsonobjs):
-    """Essaye de sortir les champs clés depuis tous les objets JSON trouvés."""
-    price = surface = rooms = city = zipcode = lat = lon = None
-    url = None
-    title = None
-
-    for obj in jsonobjs:
-        for d in walk_json(obj):
-            # URL / titre
-            url   = first(url, d.get("url"), deep_get(d, "mainEntityOfPage.@id"))
-            title = first(title, d.get("name"), d.get("headline"), d.get("title"))
-
-            # prix
-            price = first(
-                price,
-                d.get("price"),
-                deep_get(d, "offers.price"),
-                deep_get(d, "offers.0.price"),
-                deep_get(d, "price.value"),
-                deep_get(d, "pricing.price"),
-                deep_get(d, "ad.price.value"),
-            )
-
-            # surface
-            surface = first(
-                surface,
-                d.get("floorSize"), d.get("area"), d.get("livingArea"),
-                deep_get(d, "floorSize.value"),
-                deep_get(d, "surface.value"),
-                deep_get(d, "property.surface"),
-                deep_get(d, "habitableSurface"),
-            )
+    """Sort les champs clés de tous les objets JSON trouvés (table FIELD_SPECS compilée,
+    un seul parcours, arrêt anticipé : voir src/field_paths.py)."""
+    return normalize_fields(extract_fields(jsonobjs))
 
-            # pièces
-            rooms = first(
-                rooms,
-                d.get("numberOfRooms"), d.get("rooms"),
-                deep_get(d, "ad.rooms"), deep_get(d, "property.rooms"),
-            )
 
-            # adresse
-            city = first(
-                city,
-                deep_get(d, "address.addressLocality"),
-                deep_get(d, "address.locality"),
-                deep_get(d, "location.city"),
-                d.get("city"),
-            )
-            zipcode = first(
-                zipcode,
-                deep_get(d, "address.postalCode"),
-                deep_get(d, "address.zipCode"),
-                d.get("postalCode"),
-            )
-
-            # géo
-            lat = first(lat, deep_get(d, "geo.latitude"), d.get("latitude"))
-            lon = first(lon, deep_get(d, "geo.longitude"), d.get("longitude"))
+def normalize_fields(f):
+    """Champs bruts de field_paths -> annonce (types normalisés). Partagé avec les cartes SERP."""
+    price, surface, rooms = f["price"], f["surface"], f["rooms"]
+    city, zipcode, lat, lon = f["city"], f["zipcode"], f["lat"], f["lon"]
+    url, title = f["url"], f["title"]
 
     # Normalisation types
     if isinstance(price, str):   price   = num_from_text(price)
@@ -204,11 +136,11 @@ def extract_from_jsonobjs(jsonobjs):
     if isinstance(rooms, str):   rooms   = num_from_text(rooms)
 
     return {
-        "title": norm_text(title) if title else None,
+        "title": norm_text(str(title)) if title else None,
         "price": price,
         "surface_m2": surface,
         "rooms": rooms,
-        "city": norm_text(city) if city else None,
+        "city": norm_text(str(city)) if city else None,
         "zipcode": zipcode,
         "latitude": lat,
         "longitude": lon,
@@ -295,64 +227,356 @@ def fallback_from_html(response):
     }
 
 
+# ---------- Parsing d'une page ----------
+def build_item(response):
+    """JSON embarqué -> champs, puis fallback HTML / URL. Fonction pure (utilisable en worker)."""
+    jsonobjs = parse_json_blocks(response)
+    item = extract_from_jsonobjs(jsonobjs)
+
+    # Forcer l'URL de la page courante (forme propre) + id canonique, clé de l'annonce en aval
+    item["listing_id"], item["url"] = canonical(response.url)
+
+    # Si le "title" est générique, on le force à None pour déclencher le fallback
+    if item.get("title") and norm_text(item["title"]).lower() in ("seloger", "seloger.com", "www.seloger.com"):
+        item["title"] = None
+
+    # Fallback si les champs essentiels sont absents
+    if not any([item.get("price"), item.get("surface_m2"), item.get("rooms"), item.get("city"), item.get("zipcode")]):
+        fb = fallback_from_html(response)
+        for k, v in fb.items():
+            if item.get(k) in (None, "", [], {}):
+                item[k] = v
+
+    # Dernière chance : si pas de ville mais on peut la déduire de l'URL
+    if not item.get("city"):
+        item["city"] = city_from_url(response.url)
+
+    return item
+
+
+def card_item(response, lid, url, fields):
+    """Carte de page de résultats -> annonce (même forme que build_item)."""
+    item = normalize_fields(fields)
+    item["url"] = clean_url(response.urljoin(url)) if url else None
+    item["listing_id"] = lid
+    if not item.get("city"):
+        item["city"] = city_from_url(item["url"])
+    return item
+
+
+def item_hash(item):
+    """Empreinte de contenu ; en mode SERP, seulement les champs que la carte et la page détail
+    ont en commun (une annonce vue tantôt en carte, tantôt en détail ne paraît pas modifiée)."""
+    return content_hash(serp.card_view(item) if CRAWL_MODE == "serp" else item)
+
+
+def parse_page(url, body, encoding):
+    """Point d'entrée des processus de parsing : reconstruit la réponse et extrait l'item."""
+    return build_item(HtmlResponse(url, body=body, encoding=encoding))
+
+
+def deferred_from_future(fut):
+    """concurrent.futures.Future -> Deferred déclenché dans le thread du reactor."""
+    from twisted.internet import reactor
+    d = Deferred()
+
+    def done(f):
+        exc = f.exception()
+        if exc is not None:
+            reactor.callFromThread(d.errback, exc)
+        else:
+            reactor.callFromThread(d.callback, f.result())
+
+    fut.add_done_callback(done)
+    return d
+
+
 # ---------- Spider ----------
 class SelogerSpider(scrapy.Spider):
-    name = "seloger_20"
+    """Annonces SeLoger -> items JSON : seeds en flux (CRAWL_MODE=detail), pages de résultats
+    (CRAWL_MODE=serp) ou lots réclamés dans la frontière partagée (FRONTIER_DB) ; nombre de seeds
+    plafonné par MAX_URLS (0 = toutes)."""
+
+    name = "seloger"
     custom_settings = {
-        "DOWNLOAD_DELAY": REQUEST_DELAY,
-        "CONCURRENT_REQUESTS": 2,
+        # le délai est géré par PolitenessMiddleware (non bloquant, adaptatif)
+        "DOWNLOAD_DELAY": 0,
+        "CONCURRENT_REQUESTS": CONCURRENT_REQUESTS,
+        "DOWNLOADER_MIDDLEWARES": {RecordReplayMiddleware: 50, PolitenessMiddleware: 560},
+        "SPIDER_MIDDLEWARES": {FrontierMiddleware: 50},
+        "THROTTLE_SHARED_DB": FRONTIER_DB,  # crawl partagé : un seul budget par hôte pour tous les workers
+        "HTTP_STORE_MODE": HTTP_STORE_MODE,
+        "HTTP_STORE_DIR": HTTP_STORE_DIR,
+        "THROTTLE_RATE": RATE_PER_HOST,
+        "THROTTLE_BURST": float(os.getenv("THROTTLE_BURST", "1")),
+        "THROTTLE_MAX_DELAY": float(os.getenv("THROTTLE_MAX_DELAY", "60")),
         "DEFAULT_REQUEST_HEADERS": {
             "User-Agent": UA,
             "Accept-Language": "fr-FR,fr;q=0.9,en;q=0.8",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         },
+        # RAW_FEED="" : pas de brut (items nettoyés en flux par src/stream_pipeline.py)
+        "FEEDS": {RAW_FEED: {"format": "jsonlines", "encoding": "utf-8", "overwrite": True}} if RAW_FEED else {},
         "LOG_LEVEL": "INFO",
     }
 
+    state = None
+    pool = None
+    frontier = None
+    listings = 0  # mode serp : annonces distinctes vues sur les cartes
+
     def start_requests(self):
-        if not os.path.exists(URLS_PATH):
-            raise RuntimeError("Ajoute jusqu'à 20 URLs dans data/urls.txt")
-        with open(URLS_PATH, "r", encoding="utf-8") as f:
-            urls = [u.strip() for u in f if u.strip()]
-
-        # uniques + limite 20
-        seen, uniq = set(), []
-        for u in urls:
-            if u not in seen:
-                seen.add(u)
-                uniq.append(u)
-            if len(uniq) >= 20:
-                break
-
-        for i, url in enumerate(uniq, 1):
-            yield Request(url, callback=self.parse_detail, cb_kwargs={"idx": i, "total": len(uniq)})
-
-    def parse_detail(self, response, idx, total):
-        jsonobjs = parse_json_blocks(response)
-        item = extract_from_jsonobjs(jsonobjs)
-
-        # Forcer l'URL de la page courante
-        item["url"] = response.url
-
-        # Si le "title" est générique, on le force à None pour déclencher le fallback
-        if item.get("title") and norm_text(item["title"]).lower() in ("seloger", "seloger.com", "www.seloger.com"):
-            item["title"] = None
-
-        # Fallback si les champs essentiels sont absents
-        if not any([item.get("price"), item.get("surface_m2"), item.get("rooms"), item.get("city"), item.get("zipcode")]):
-            fb = fallback_from_html(response)
-            for k, v in fb.items():
+        replay = HTTP_STORE_MODE == "replay"
+        # en rejeu on re-parse tout l'historique : pas d'état incrémental
+        if STATE_DB and not replay:
+            # état partagé entre workers : écritures dans le pool de threads, une transaction par page
+            shared = bool(FRONTIER_DB)
+            self.state = CrawlState(STATE_DB, commit_every=1 if shared else 200, shared=shared)
+        if PARSE_WORKERS > 0:
+            self.pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+            self.logger.info(f"Parsing dans {PARSE_WORKERS} processus")
+        if FRONTIER_DB:
+            yield from self.frontier_requests()
+            return
+        if CRAWL_MODE == "serp":
+            yield from self.search_requests()
+            return
+        # itération paresseuse : Scrapy ne tire une seed que quand il a de la place
+        found = False
+        # une même annonce listée par plusieurs recherches (query de tracking différente) : une requête
+        seeds = HttpStore(HTTP_STORE_DIR).urls() if replay and "SEEDS" not in os.environ else \
+            map(clean_url, iter_seeds(URLS_PATH, MAX_URLS, SEEDS_CAPACITY, key=listing_id_from_url))
+        for i, url in enumerate(seeds, 1):
+            found = True
+            req = self.detail_request(url, i)
+            if req is not None:
+                yield req
+        if not found:
+            raise RuntimeError(f"Aucune URL trouvée dans {URLS_PATH} (data/urls.txt, une URL par ligne)")
+
+    # ---------- Crawl partagé (frontière) ----------
+    def frontier_requests(self):
+        """Aucune requête de départ : les lots sont réclamés à chaque spider_idle, hors du reactor."""
+        self.frontier = Frontier(FRONTIER_DB)
+        self.seen = BloomFilter(SEEDS_CAPACITY)
+        released = self.frontier.release_worker(WORKER_ID)  # baux d'une instance précédente de ce worker
+        self.logger.info(f"Worker {WORKER_ID} sur {FRONTIER_DB} ({released} URLs reprises)")
+        self.claiming, self.exhausted = False, False
+        self.crawler.signals.connect(self.frontier_idle, signal=signals.spider_idle)
+        self.start_heartbeat()
+        return []
+
+    def start_heartbeat(self):
+        self.heartbeat = LoopingCall(self.frontier.call, self.frontier.renew, WORKER_ID)
+        self.heartbeat.start(self.frontier.lease / 3, now=False).addErrback(self.heartbeat_failed)
+
+    def heartbeat_failed(self, failure):
+        """Renouvellement des baux en échec (base verrouillée au-delà du délai…) : la LoopingCall s'arrête
+        à la première erreur, on la relance ; les baux tiennent encore 2/3 de leur durée."""
+        self.logger.warning(f"Frontière : renouvellement des baux impossible ({failure.value!r}), relance")
+        if self.heartbeat is not None:
+            self.start_heartbeat()
+
+    def claim_rows(self):
+        """(lot réclamé, baux en cours chez les autres workers si le lot est vide) : un seul aller
+        dans le pool de threads."""
+        rows = self.frontier.claim(WORKER_ID, CLAIM_BATCH)
+        return rows, 0 if rows else self.frontier.pending(WORKER_ID)
+
+    def claim_batch(self, rows=None):
+        """Requêtes d'un lot réclamé dans la frontière (`rows`, sinon réclamation directe) ; None si
+        plus rien à réclamer."""
+        rows = self.frontier.claim(WORKER_ID, CLAIM_BATCH) if rows is None else rows
+        if not rows:
+            return None
+        out, skipped = [], []
+        for url, kind, blob in rows:
+            req = self.frontier_request(url, kind, blob)
+            if req is None:
+                skipped.append(url)
+            else:
+                out.append(req)
+        if skipped:
+            self.frontier.call(self.frontier.done, *skipped)
+        return out
+
+    def frontier_request(self, url, kind, blob):
+        if blob is not None:  # requête découverte par un worker (page suivante, page détail)
+            req = request_from_dict(pickle.loads(blob), spider=self)
+        elif kind == "serp":
+            req = Request(url, callback=self.parse_serp, cb_kwargs={"page": serp.page_number(url)})
+        else:
+            self.listings += 1
+            req = self.detail_request(url, self.listings)
+        if req is None:
+            return None
+        req.meta["frontier_url"] = url
+        # la frontière dédoublonne déjà, y compris entre workers
+        return req.replace(errback=self.frontier_failed, dont_filter=True)
+
+    def frontier_idle(self, spider):
+        """Scheduler vide : lot suivant réclamé dans le pool de threads ; le worker reste ouvert tant
+        que d'autres tiennent des baux (un worker mort rend les siens à l'expiration). Fin au premier
+        spider_idle qui suit un lot vide sans bail ailleurs."""
+        if not self.claiming:
+            if self.exhausted:
+                return
+            self.claiming = True
+            d = self.frontier.call(self.claim_rows)
+            d.addCallbacks(self.frontier_claimed, self.frontier_claim_failed)
+        raise DontCloseSpider
+
+    def frontier_claimed(self, result):
+        rows, pending = result
+        self.claiming = False
+        self.exhausted = not rows and not pending
+        for req in self.claim_batch(rows) or []:
+            self.crawler.engine.crawl(req)
+
+    def frontier_claim_failed(self, failure):
+        self.claiming = False
+        self.logger.warning(f"Frontière : réclamation impossible ({failure.value!r}), nouvel essai")
+
+    def frontier_failed(self, failure):
+        url = failure.request.meta.get("frontier_url")
+        self.logger.warning(f"Échec {failure.request.url} : {failure.value!r}")
+        if url:
+            self.frontier.call(self.frontier.release, url)
+
+    # ---------- Mode serp ----------
+    def search_requests(self):
+        self.seen = BloomFilter(SEEDS_CAPACITY)  # une annonce listée par plusieurs recherches : une fois
+        found = False
+        for url in iter_seeds(SEARCH_URLS, 0, SEEDS_CAPACITY):
+            found = True
+            yield Request(url, callback=self.parse_serp, cb_kwargs={"page": serp.page_number(url)})
+        if not found:
+            raise RuntimeError(f"Aucune URL de recherche dans {SEARCH_URLS} (une URL par ligne)")
+
+    def parse_serp(self, response, page):
+        """Page de résultats : annonces depuis les cartes, page détail si nouvelle ou incomplète,
+        puis page suivante (arrêt sur page sans annonce nouvelle ou SERP_MAX_PAGES : au-delà de
+        la fin, beaucoup de sites resservent la dernière page)."""
+        self.crawler.stats.inc_value("serp/pages")
+        cards = serp.json_cards(parse_json_blocks(response)) or serp.html_cards(response.selector.root)
+        fresh, out, items = 0, [], []
+        for lid, url, fields in cards:
+            if self.seen.add(str(lid)):
+                continue
+            fresh += 1
+            self.listings += 1
+            item = card_item(response, lid, url, fields)
+            lacks = serp.missing(item)
+            new = self.state is not None and self.state.get(str(lid)) is None
+            if item["url"] and (lacks or new):
+                req = self.detail_request(item["url"], self.listings, card=item)
+                if req is not None:
+                    self.crawler.stats.inc_value("serp/detail_missing" if lacks else "serp/detail_new")
+                    out.append(req)
+                    continue
+                # page détail récente (REFRESH_AFTER_HOURS) : la carte, même incomplète, porte le prix du jour
+            self.crawler.stats.inc_value("serp/from_card")
+            self.logger.info(
+                f"[{self.listings}] carte price={item.get('price')} surface={item.get('surface_m2')} "
+                f"rooms={item.get('rooms')} zipcode={item.get('zipcode')}"
+            )
+            items.append(item)
+        # pages suivantes : le filtre de doublons de Scrapy coupe les boucles (rel=next cyclique)
+        if fresh and page < SERP_MAX_PAGES:
+            out.append(Request(serp.next_page(response), callback=self.parse_serp, cb_kwargs={"page": page + 1}))
+        if not self.state or not items:
+            return items + out
+        # cartes de la page : une écriture d'état pour toutes
+        rows = [(str(i["listing_id"]), i["url"], 200, None, None, item_hash(i)) for i in items]
+        return self.emit_changed(rows, items).addCallback(lambda kept: kept + out)
+
+    # ---------- État de crawl ----------
+    def state_call(self, fn, *args):
+        """Deferred du résultat de fn(*args) sur l'état de crawl : dans le pool de threads si l'état est
+        partagé entre workers (attente du verrou d'écriture hors du reactor), appel direct sinon."""
+        return deferToThread(fn, *args) if self.state.shared else maybeDeferred(fn, *args)
+
+    def emit_changed(self, rows, items):
+        """Deferred des `items` dont le contenu a changé, après enregistrement de leurs fetchs (`rows`,
+        cf. CrawlState.record_many) ; les autres sont comptés dans state/unchanged."""
+        def keep(changed):
+            if not all(changed):
+                self.crawler.stats.inc_value("state/unchanged", changed.count(False))
+            return [item for item, c in zip(items, changed) if c]
+        return self.state_call(self.state.record_many, rows).addCallback(keep)
+
+    def detail_request(self, url, idx, card=None):
+        headers, meta = {}, {}
+        if self.state:
+            lid = listing_id_from_url(url)
+            row = self.state.get(lid)
+            if row and REFRESH_AFTER_HOURS and time.time() - row["last_fetch"] < REFRESH_AFTER_HOURS * 3600:
+                self.crawler.stats.inc_value("state/skipped_fresh")
+                return None
+            # ETag / Last-Modified connus -> le serveur peut répondre 304 sans corps
+            headers = self.state.conditional_headers(row)
+            # 404/410 reçus aussi : l'état de crawl en garde trace (retraits, cf. listing_history)
+            meta = {"listing_id": lid, "handle_httpstatus_list": [304, *GONE_STATUSES]}
+        if card is not None:
+            meta["card"] = card  # mode serp : complète les champs absents de la page détail
+        # déjà dédoublonné par le filtre de Bloom : inutile de garder les empreintes Scrapy
+        return Request(url, headers=headers, meta=meta, callback=self.parse_detail,
+                       cb_kwargs={"idx": idx}, dont_filter=True)
+
+    def parse_detail(self, response, idx):
+        lid = response.meta.get("listing_id")
+        if response.status == 304:
+            self.crawler.stats.inc_value("state/not_modified")
+            return self.state_call(self.state.record, lid, response.url, 304).addCallback(lambda _: [])
+        if response.status in GONE_STATUSES:
+            self.crawler.stats.inc_value("state/gone")
+            return self.state_call(self.state.record, lid, response.url, response.status).addCallback(lambda _: [])
+
+        if self.pool is None:
+            return self.emit_item(build_item(response), response, idx)
+
+        # parsing hors du thread du reactor : le Deferred se déclenche quand le worker a fini
+        fut = self.pool.submit(parse_page, response.url, response.body, response.encoding)
+        d = deferred_from_future(fut)
+        d.addCallback(self.emit_item, response, idx)
+        return d
+
+    def emit_item(self, item, response, idx):
+        card = response.meta.get("card")
+        if card:
+            for k, v in card.items():
                 if item.get(k) in (None, "", [], {}):
                     item[k] = v
-
-        # Dernière chance : si pas de ville mais on peut la déduire de l'URL
-        if not item.get("city"):
-            item["city"] = city_from_url(response.url)
-
         self.logger.info(
-            f"[{idx}/{total}] price={item.get('price')} surface={item.get('surface_m2')} "
+            f"[{idx}] price={item.get('price')} surface={item.get('surface_m2')} "
             f"rooms={item.get('rooms')} city={item.get('city')} zipcode={item.get('zipcode')}"
         )
 
-        yield item
-        time.sleep(REQUEST_DELAY)  # petite pause supplémentaire
+        if self.state:
+            etag = response.headers.get(b"ETag")
+            lm = response.headers.get(b"Last-Modified")
+            row = (response.meta.get("listing_id"), response.url, response.status,
+                   etag.decode("latin-1") if etag else None,
+                   lm.decode("latin-1") if lm else None,
+                   item_hash(item))
+            return self.emit_changed([row], [item])
+
+        return [item]
+
+    def closed(self, reason):
+        if self.frontier is not None:
+            heartbeat, self.heartbeat = self.heartbeat, None  # plus de relance après échec
+            if heartbeat.running:
+                heartbeat.stop()
+            self.frontier.release_worker(WORKER_ID)  # arrêt avant la fin : URLs rendues aux autres
+            self.frontier.close()
+        if CRAWL_MODE == "serp":
+            st = self.crawler.stats
+            pages = st.get_value("serp/pages", 0)
+            details = st.get_value("serp/detail_new", 0) + st.get_value("serp/detail_missing", 0)
+            self.logger.info(f"SERP : {self.listings} annonces, {pages} pages de résultats + {details} pages "
+                             f"détail ({(pages + details) / max(self.listings, 1):.2f} requête/annonce)")
+        if self.state:
+            self.state.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Crawl + nettoyage en une commande, sans aller-retour par raw_data.jsonl
+- CleanedStorePipeline (item pipeline Scrapy) : les annonces sont nettoyées par lots de STREAM_BATCH
+  avec les fonctions du cleaner (clean_records, normalize : types, géocodage CP, filtre ÎDF)
+- Chaque lot est ajouté au jeu Parquet (dataset.append) : visible dans l'app pendant le crawl,
+  mémoire bornée (un lot à la fois, plus CP / commune / €/m² par annonce pour les indicateurs),
+  historique mis à jour au fil de l'eau
+- Écritures (nettoyage, Parquet, historique, compaction) dans un thread dédié au pipeline : le reactor
+  continue de télécharger pendant qu'un lot s'écrit ; un seul thread, les lots gardent leur ordre et
+  la connexion SQLite de l'historique ne change pas de thread
+- Fin du crawl : indicateurs de marché (une fois par annonce sur tout le run, dernière version comme
+  le cleaner, moins la version d'avant le run lue dans l'historique au premier lot), retraits 404/410, puis compaction (une ligne par annonce, annonces retirées sorties
+  du jeu, re-publications, réécriture du jeu) comme en fin de cleaner
+    python src/stream_pipeline.py [-s STREAM_BATCH=500]      # mêmes variables d'env. que spider.py
+Le chemin classique (spider -> raw_data.jsonl -> cleaner) reste disponible.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+import cleaner
+import dataset
+import market_stats
+from crawl_state import gone_ids
+from listing_history import HISTORY_DB, ListingHistory, require_history
+
+STREAM_BATCH = int(os.getenv("STREAM_BATCH", "500"))  # annonces par lot écrit
+STATS_COLUMNS = ["zipcode", "city", "price_per_m2"]     # colonnes utiles à l'esquisse de marché
+
+
+class CleanedStorePipeline:
+    def __init__(self, batch_size: int = STREAM_BATCH, root: str = cleaner.OUT_DATASET,
+                 history_db: str = HISTORY_DB, state_db: str = None):
+        self.batch_size = batch_size
+        self.root = root
+        self.history_db = history_db
+        self.state_db = state_db
+        self.items = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        return cls(s.getint("STREAM_BATCH", STREAM_BATCH), s.get("STREAM_DATASET", cleaner.OUT_DATASET),
+                   s.get("HISTORY_DB", HISTORY_DB), s.get("STATE_DB", os.getenv("STATE_DB", "data/crawl_state.sqlite")))
+
+    # ---------- Cycle de vie Scrapy ----------
+    def open_spider(self, spider):
+        self.run = datetime.now(timezone.utc).strftime("stream-%Y%m%dT%H%M%S")
+        self.period = market_stats.current_period()
+        self.stats_rows = {}  # listing_id -> (id, CP, commune, €/m²) : dédoublonnage sur tout le run
+        self.stats_prev = []  # versions d'avant le run (historique), lues avant chaque upsert
+        self.history = None
+        self.n_batches = self.n_rows = 0
+        self.t0 = time.perf_counter()
+        self.pool = ThreadPool(1, 1, name="stream-pipeline")
+        self.pool.start()
+        return self.call(self.open_history)
+
+    def process_item(self, item, spider):
+        self.items.append(dict(item))
+        if len(self.items) >= self.batch_size:
+            # Deferred rendu à Scrapy : l'item est traité quand son lot est écrit
+            return self.flush(spider).addCallback(lambda _: item)
+        return item
+
+    def close_spider(self, spider):
+        d = self.flush(spider)
+        d.addCallback(lambda _: self.call(self.finish, spider))
+        return d.addBoth(self.stop_pool)
+
+    # ---------- Thread du pipeline ----------
+    def call(self, fn, *args):
+        """Deferred de fn(*args), exécuté dans le thread du pipeline (un appel à la fois, dans l'ordre)."""
+        return deferToThreadPool(reactor, self.pool, fn, *args)
+
+    def stop_pool(self, result):
+        self.pool.stop()
+        return result
+
+    def open_history(self):
+        self.history = ListingHistory(self.history_db) if self.history_db else None
+
+    def finish(self, spider):
+        """Fin du crawl : indicateurs de marché, retraits, compaction."""
+        if self.stats_rows and self.history is not None:
+            df = pd.DataFrame(list(self.stats_rows.values()), columns=["listing_id"] + STATS_COLUMNS)
+            previous = pd.concat(self.stats_prev) if self.stats_prev else None
+            try:
+                market_stats.apply_delta(market_stats.listing_delta(df, previous, self.period), source=self.run)
+            except Exception as e:
+                print("Indicateurs de marché ignorés (erreur):", e)
+        state = getattr(spider, "state", None)
+        if state is not None:
+            # pipelines fermés avant spider_closed : derniers 404/410 pas encore validés par le spider
+            state.commit()
+        if self.history is not None:
+            try:
+                gone = self.history.sync_gone(self.state_db)
+                print(f"Historique : {gone} retraits")
+            finally:
+                self.history.close()
+        previous = cleaner.load_previous(self.root)
+        if previous is not None:
+            # compaction : lots du run + sortie précédente -> une ligne par annonce, annonces retirées
+            # (404/410) sorties du jeu ; réécrit seulement si le run a changé quelque chose
+            kept = cleaner.drop_gone(previous, gone_ids(self.state_db))
+            if self.n_rows or len(kept) < len(previous):
+                cleaner.publish(kept)
+        spider.logger.info(f"Pipeline : {self.n_rows} annonces en {self.n_batches} lots "
+                           f"({time.perf_counter() - self.t0:.0f} s)")
+
+    # ---------- Lots ----------
+    def flush(self, spider=None):
+        """Deferred de l'écriture du lot en cours."""
+        items, self.items = self.items, []
+        return self.call(self.write, items, spider)
+
+    def write(self, items, spider=None):
+        if not items:
+            return
+        df = cleaner.normalize(cleaner.drop_duplicate_listings(cleaner.clean_records(items)))
+        if df.empty:
+            return
+        dataset.append(df, f"{self.run}-{self.n_batches:06d}", self.root)
+        # une annonce vue dans plusieurs lots ne compte qu'une fois (la dernière) ; sans id : pas comptée
+        stats = df.dropna(subset=["listing_id"]).reindex(columns=["listing_id"] + STATS_COLUMNS)
+        if self.history is not None:
+            try:
+                fresh = stats.loc[~stats["listing_id"].isin(self.stats_rows.keys()), "listing_id"]
+                prev = self.history.previous(fresh)
+                if not prev.empty:
+                    self.stats_prev.append(prev)
+                self.history.upsert(df)
+            except Exception as e:
+                print("Historique ignoré (erreur):", e)
+        self.stats_rows.update(zip(stats["listing_id"], stats.itertuples(index=False, name=None)))
+        self.n_batches += 1
+        self.n_rows += len(df)
+        if spider is not None:
+            spider.logger.info(f"Pipeline : lot {self.n_batches} ({len(df)} annonces) -> {self.root}/")
+
+
+def main(argv=None):
+    """Crawl + nettoyage : le spider sans flux brut, les items passent par CleanedStorePipeline."""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    os.environ.setdefault("RAW_FEED", "")  # pas de raw_data.jsonl (sauf RAW_FEED explicite)
+    from spider import SelogerSpider
+
+    settings = get_project_settings()
+    # priorité « cmdline » : passe devant les custom_settings du spider
+    settings.set("ITEM_PIPELINES", {CleanedStorePipeline: 300}, priority="cmdline")
+    argv = sys.argv[1:] if argv is None else argv
+    for a, b in zip(argv, argv[1:]):  # -s CLE=VALEUR, comme scrapy
+        if a == "-s" and "=" in b:
+            k, v = b.split("=", 1)
+            settings.set(k, v, priority="cmdline")
+    require_history(settings.get("HISTORY_DB", HISTORY_DB),
+                    settings.get("STATE_DB", os.getenv("STATE_DB", "data/crawl_state.sqlite")))
+    process = CrawlerProcess(settings)
+    process.crawl(SelogerSpider)
+    process.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Politesse non bloquante pour le spider SeLoger (middleware de téléchargement Scrapy)
+- Un seau à jetons par hôte : débit max THROTTLE_RATE pages/s, rafale THROTTLE_BURST
+- Délai adaptatif façon AutoThrottle : suit la latence mesurée, recule sur 429/503
+- Jamais de time.sleep : l'attente est un Deferred (reactor.callLater), le reactor reste libre
+- Log périodique : pages/s obtenues vs budget configuré
+- Crawl multi-processus (src/frontier.py) : THROTTLE_SHARED_DB = seaux communs dans une base SQLite,
+  le budget par hôte vaut pour l'ensemble des workers ; créneaux réservés par fenêtre de
+  THROTTLE_SHARED_WINDOW s (une transaction par fenêtre, dans le pool de threads de Twisted)
+"""
+
+import math
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import deferLater, LoopingCall
+from twisted.internet.threads import deferToThread
+from scrapy import signals
+from scrapy.utils.httpobj import urlparse_cached
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_STATUSES = (429, 503)
+STALE_SLOT = 1.0  # créneau partagé en retard de plus d'1 s : abandonné (pas de rafale au réveil)
+
+
+# ---------- Seau à jetons ----------
+class TokenBucket:
+    """Seau à jetons « à réservation » : chaque appel prend un jeton et renvoie
+    l'attente (s) avant de pouvoir partir. Le solde peut devenir négatif, ce qui
+    étale automatiquement les requêtes en file sans aucune boucle d'attente."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def reserve(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1.0
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class SharedBuckets:
+    """Seaux à jetons partagés par plusieurs processus (base SQLite commune) : même calcul que
+    TokenBucket, solde et date de chaque hôte relus et réécrits dans une transaction IMMEDIATE
+    (un seul processus à la fois). Horloge murale : comparable d'un processus à l'autre.
+    Les jetons sont pris par lots (reserve_slots) : chaque processus reçoit des créneaux datés,
+    qu'il consomme ensuite sans toucher à la base (take)."""
+
+    SCHEMA = "CREATE TABLE IF NOT EXISTS throttle (host TEXT PRIMARY KEY, tokens REAL, last REAL)"
+
+    def __init__(self, path: str):
+        # connexion utilisée depuis le pool de threads de Twisted : un appel à la fois (verrou)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(self.SCHEMA)
+        self.lock = threading.Lock()
+        self.slots = {}  # hôte -> instants de départ déjà réservés (deque)
+        self.transactions = 0
+
+    def reserve_slots(self, host: str, rate: float, burst: float = 1.0, n: int = 1, now: float = None) -> list:
+        """Prend `n` jetons en une transaction ; renvoie l'instant de départ (time.time) de chacun."""
+        now = time.time() if now is None else now
+        burst = max(1.0, burst)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, last FROM throttle WHERE host = ?", (host,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                self.conn.execute("INSERT OR REPLACE INTO throttle VALUES (?, ?, ?)", (host, tokens - n, now))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.transactions += 1
+        # k-ième jeton : solde tokens - (k + 1), disponible quand il redevient >= 0
+        return [now + max(0.0, (k + 1 - tokens) / rate) for k in range(n)]
+
+    def add(self, host: str, slots):
+        self.slots.setdefault(host, deque()).extend(slots)
+
+    def take(self, host: str):
+        """Attente (s) jusqu'au prochain créneau de `host` déjà réservé ; None s'il n'en reste pas."""
+        q = self.slots.get(host)
+        now = time.time()
+        while q and q[0] < now - STALE_SLOT:
+            q.popleft()
+        return max(0.0, q.popleft() - now) if q else None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class HostState:
+    """État de politesse d'un hôte : seau + délai adaptatif + compteurs."""
+
+    def __init__(self, rate, burst, min_delay, max_delay):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.pages = 0
+        self.backoffs = 0
+
+    def set_delay(self, delay):
+        self.delay = min(max(self.min_delay, delay), self.max_delay)
+        self.bucket.rate = 1.0 / self.delay if self.delay > 0 else self.bucket.rate
+
+
+# ---------- Middleware ----------
+class PolitenessMiddleware:
+    """Remplace DOWNLOAD_DELAY + time.sleep par un ordonnancement non bloquant.
+
+    Réglages (settings Scrapy) :
+        THROTTLE_RATE                 pages/s max par hôte (budget)
+        THROTTLE_BURST                rafale autorisée (jetons)
+        THROTTLE_MAX_DELAY            délai max entre 2 requêtes d'un hôte (s)
+        THROTTLE_TARGET_CONCURRENCY   requêtes simultanées visées par hôte
+        THROTTLE_STATS_INTERVAL       période du log de stats (s)
+        THROTTLE_SHARED_DB            base SQLite des seaux partagés entre processus ("" = seaux locaux)
+        THROTTLE_SHARED_WINDOW        budget réservé par transaction sur la base partagée (s de débit)
+    Une requête avec meta["throttle_skip"] passe sans attente (ex: rejeu local).
+    """
+
+    def __init__(self, crawler):
+        s = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.rate = s.getfloat("THROTTLE_RATE", 0.5)
+        self.burst = s.getfloat("THROTTLE_BURST", 1.0)
+        self.max_delay = s.getfloat("THROTTLE_MAX_DELAY", 60.0)
+        self.target_concurrency = s.getfloat("THROTTLE_TARGET_CONCURRENCY", 2.0)
+        self.stats_interval = s.getfloat("THROTTLE_STATS_INTERVAL", 30.0)
+        shared = s.get("THROTTLE_SHARED_DB")
+        self.shared = SharedBuckets(shared) if shared else None
+        self.shared_window = s.getfloat("THROTTLE_SHARED_WINDOW", 0.25)
+        self._refills = {}  # hôte -> Deferreds en attente du lot de créneaux en cours de réservation
+        self.hosts = {}
+        self.started = None
+        self._last_pages = 0
+        self._last_t = None
+        self._task = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    # --- hôtes ---
+    def _host(self, request):
+        host = urlparse_cached(request).hostname or ""
+        st = self.hosts.get(host)
+        if st is None:
+            min_delay = 1.0 / self.rate if self.rate > 0 else 0.0
+            st = HostState(self.rate, self.burst, min_delay, self.max_delay)
+            self.hosts[host] = st
+        return st
+
+    # --- hooks Scrapy ---
+    def process_request(self, request, spider):
+        if request.meta.get("throttle_skip") or self.rate <= 0:
+            return None
+        st = self._host(request)
+        if self.shared is None:
+            return self._wait(st.bucket.reserve())
+        host = urlparse_cached(request).hostname or ""
+        wait = self.shared.take(host)
+        if wait is not None:
+            return self._wait(wait)
+        # plus de créneau réservé : lot suivant pris dans la base commune, hors du thread du reactor
+        return self._shared_wait(host, st).addCallback(self._wait)
+
+    def _wait(self, wait):
+        if wait <= 0:
+            return None
+        self.stats.inc_value("throttle/wait_time", wait)
+        # Deferred qui se déclenche après `wait` s : la chaîne continue ensuite
+        return deferLater(reactor, wait, lambda: None)
+
+    def _batch(self, st) -> int:
+        """Jetons réservés par transaction : THROTTLE_SHARED_WINDOW s au débit courant de l'hôte."""
+        return max(1, math.ceil(st.bucket.rate * self.shared_window))
+
+    def _shared_wait(self, host, st) -> Deferred:
+        """Deferred de l'attente (s) avant le prochain créneau partagé de `host` ; une seule
+        réservation en cours par hôte, les requêtes arrivées entre-temps attendent son résultat."""
+        wait = self.shared.take(host)
+        if wait is not None:
+            d = Deferred()
+            d.callback(wait)
+            return d
+        d = Deferred()
+        waiters = self._refills.setdefault(host, [])
+        waiters.append(d)
+        if len(waiters) == 1:
+            t = deferToThread(self.shared.reserve_slots, host, st.bucket.rate, st.bucket.burst, self._batch(st))
+            t.addCallbacks(self._refilled, self._refill_failed, (host, st), None, (host, st))
+        return d
+
+    def _refilled(self, slots, host, st):
+        self.shared.add(host, slots)
+        for d in self._refills.pop(host):
+            wait = self.shared.take(host)
+            if wait is None:  # plus de requêtes en attente que de créneaux : lot suivant
+                self._shared_wait(host, st).chainDeferred(d)
+            else:
+                d.callback(wait)
+
+    def _refill_failed(self, failure, host, st):
+        logger.warning("Seaux partagés indisponibles (%s) : seau local pour %s", failure.value, host)
+        for d in self._refills.pop(host):
+            d.callback(st.bucket.reserve())
+
+    def process_response(self, request, response, spider):
+        if request.meta.get("throttle_skip"):
+            return response
+        st = self._host(request)
+        st.pages += 1
+        self.stats.inc_value("throttle/pages")
+
+        if response.status in BACKOFF_STATUSES:
+            retry_after = self._retry_after(response)
+            st.set_delay(max(st.delay * 2.0, retry_after or 0.0))
+            st.backoffs += 1
+            self.stats.inc_value("throttle/backoffs")
+            logger.info("Backoff %s (HTTP %s) → délai %.2fs", urlparse_cached(request).hostname,
+                        response.status, st.delay)
+            return response
+
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            # Même politique qu'AutoThrottle : viser `target_concurrency` requêtes en vol
+            target = latency / self.target_concurrency
+            new_delay = max(target, (st.delay + target) / 2.0)
+            # pages d'erreur courtes = latence faible : on ne réduit pas sur non-200
+            if response.status == 200 or new_delay > st.delay:
+                st.set_delay(new_delay)
+        return response
+
+    @staticmethod
+    def _retry_after(response):
+        raw = response.headers.get(b"Retry-After")
+        if not raw:
+            return None
+        try:
+            return float(raw.decode("latin-1").strip())
+        except ValueError:
+            return None
+
+    # --- stats ---
+    def spider_opened(self, spider):
+        self.started = self._last_t = time.monotonic()
+        if self.stats_interval > 0:
+            self._task = LoopingCall(self.log_stats, spider)
+            self._task.start(self.stats_interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self._task and self._task.running:
+            self._task.stop()
+        self.log_stats(spider, final=True)
+        if self.shared is not None:
+            self.shared.close()
+
+    def log_stats(self, spider, final=False):
+        now = time.monotonic()
+        pages = sum(st.pages for st in self.hosts.values())
+        elapsed = max(now - (self.started or now), 1e-9)
+        window = max(now - (self._last_t or now), 1e-9)
+        recent = (pages - self._last_pages) / window
+        self._last_pages, self._last_t = pages, now
+        budget = self.rate * max(1, len(self.hosts))
+        delays = ", ".join(f"{h}={st.delay:.2f}s" for h, st in self.hosts.items()) or "-"
+        logger.info(
+            "%s%d pages • %.2f pages/s (moyenne) • %.2f pages/s (récent) • budget %.2f pages/s "
+            "• backoffs=%d • délais: %s",
+            "[fin] " if final else "", pages, pages / elapsed, recent, budget,
+            sum(st.backoffs for st in self.hosts.values()), delays,
+        )
+        self.stats.set_value("throttle/pages_per_sec", round(pages / elapsed, 3))
+        self.stats.set_value("throttle/budget_pages_per_sec", round(budget, 3))
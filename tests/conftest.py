@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Tests unitaires : modules de src/ importés tels quels (comme bench/synthetic.py)."""
+
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
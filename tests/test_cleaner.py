@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from cleaner import merge_previous
+
+
+def frame(*rows):
+    return pd.DataFrame(rows, columns=["listing_id", "title", "price_eur"]).astype({"listing_id": "Int64"})
+
+
+def test_merge_previous_replaces_updated_and_keeps_the_rest():
+    old = frame((1, "a", 100), (2, "b", 200))
+    new = frame((2, "b", 190), (3, "c", 300))
+    out = merge_previous(new, old)
+    assert out.set_index("listing_id")["price_eur"].to_dict() == {1: 100, 2: 190, 3: 300}
+    assert len(out) == 3
+
+
+def test_merge_previous_drops_gone_listings():
+    old = frame((1, "a", 100), (2, "b", 200), (3, "c", 300))
+    out = merge_previous(frame((3, "c", 310)), old, gone={"2"})
+    assert sorted(out["listing_id"].tolist()) == [1, 3]
+
+
+def test_merge_previous_without_new_rows_or_old_output():
+    old = frame((1, "a", 100), (2, "b", 200))
+    assert merge_previous(frame(), old, gone={"1"})["listing_id"].tolist() == [2]
+    new = frame((1, "a", 100))
+    assert merge_previous(new, None) is new
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from crawl_state import CrawlState, gone_ids
+
+URL = "https://www.seloger.com/annonces/achat/appartement/paris-11eme-75/247201957.htm"
+
+
+@pytest.fixture
+def state(tmp_path):
+    st = CrawlState(str(tmp_path / "state.sqlite"), commit_every=1)
+    yield st
+    st.close()
+
+
+def test_record_detects_new_and_changed_content(state):
+    assert state.record("1", URL, 200, chash="a") is True    # nouvelle
+    assert state.record("1", URL, 200, chash="a") is False   # inchangée
+    assert state.record("1", URL, 200, chash="b") is True    # modifiée
+    assert state.get("1")["content_hash"] == "b"
+
+
+def test_record_without_hash_is_not_a_change(state):
+    state.record("1", URL, 200, etag='"v1"', chash="a")
+    assert state.record("1", URL, 304) is False
+    row = state.get("1")
+    assert row["last_status"] == 304
+    assert row["etag"] == '"v1"'  # validateurs conservés
+    assert state.conditional_headers(row) == {"If-None-Match": '"v1"'}
+
+
+def test_gone_clears_validators_and_return_counts_as_change(state):
+    state.record("1", URL, 200, etag='"v1"', last_modified="Mon", chash="a")
+    assert state.record("1", URL, 410) is False
+    row = state.get("1")
+    assert (row["etag"], row["last_modified"], row["content_hash"]) == (None, None, None)
+    # remise en ligne, même contenu : changement (doit repasser par l'historique)
+    assert state.record("1", URL, 200, chash="a") is True
+    assert state.record("1", URL, 200, chash="a") is False
+
+
+def test_record_many_matches_record(state):
+    state.record("1", URL, 200, chash="a")
+    rows = [("1", URL, 200, None, None, "a"), ("2", URL, 200, None, None, "x"), ("1", URL, 200, None, None, "c")]
+    assert state.record_many(rows) == [False, True, True]
+
+
+def test_gone_ids(tmp_path, state):
+    state.record("1", URL, 200, chash="a")
+    state.record("2", URL, 404)
+    state.record("3", URL, 410)
+    state.commit()
+    assert gone_ids(state.path) == {"2", "3"}
+    assert gone_ids(str(tmp_path / "absent.sqlite")) == set()
+    assert gone_ids("") == set()
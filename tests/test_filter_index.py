@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import FilterIndex
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    n = 2000
+    out = pd.DataFrame({
+        "price_eur": rng.integers(100, 1000, n).astype(float) * 1000,
+        "surface_m2": rng.integers(10, 150, n).astype(float),
+        "city": rng.choice(["Paris", "Montreuil", "Vincennes", None], n),
+    })
+    out.loc[::50, "price_eur"] = np.nan
+    return out
+
+
+def test_query_matches_pandas_masks(df):
+    index = FilterIndex(df)
+    price, surface, cities = (300_000, 600_000), (30, 80), ("Paris", "Vincennes")
+    mask = (df["price_eur"].between(*price) & df["surface_m2"].between(*surface) & df["city"].isin(cities))
+    assert np.array_equal(index.query(price, surface, cities), np.flatnonzero(mask))
+    assert np.array_equal(index.query(cities=["Montreuil"]), np.flatnonzero(df["city"] == "Montreuil"))
+    assert len(index.query()) == len(df)
+    assert len(index.query(cities=["Inconnue"])) == 0
+
+
+def test_query_is_cached_by_parameters(df):
+    index = FilterIndex(df)
+    assert index.query((1, 2e6), None, ("Paris",)) is index.query((1.0, 2e6), None, ["Paris"])
+
+
+def test_page_matches_sort_values_with_stable_ties(df):
+    index = FilterIndex(df)
+    rows = index.query(surface=(20, 120))
+    for ascending in (True, False):
+        expected = df.iloc[rows].sort_values("price_eur", ascending=ascending, kind="stable",
+                                             na_position="last").index.to_numpy()
+        got = np.concatenate([index.page(rows, "price_eur", ascending, page=p, size=100)
+                              for p in range(len(rows) // 100 + 1)])
+        assert np.array_equal(got, expected)
+    assert np.array_equal(index.page(rows, None, page=1, size=10), rows[10:20])
+
+
+def test_page_cache_hits_on_equal_rows_from_a_new_array(df):
+    index = FilterIndex(df)
+    rows = index.query(cities=["Paris"])
+    index.page(rows, "surface_m2", False)
+    index.page(rows[np.ones(len(rows), dtype=bool)], "surface_m2", False, page=1)  # copie (ex. dédoublonnage)
+    assert len(index._sorted) == 1
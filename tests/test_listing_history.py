@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from crawl_state import CrawlState
+from listing_history import ListingHistory
+
+
+def listings(*rows):
+    return pd.DataFrame(rows, columns=["listing_id", "url", "price_eur", "price_per_m2", "zipcode", "city"])
+
+
+@pytest.fixture
+def history(tmp_path):
+    h = ListingHistory(str(tmp_path / "history.sqlite"))
+    yield h
+    h.close()
+
+
+def kinds(history):
+    return history.changes_since(0)["kind"].tolist()
+
+
+def test_upsert_logs_new_and_price_changes(history):
+    assert history.upsert(listings((1, "u1", 300000, 6000, "75011", "Paris"),
+                                   (2, "u2", 200000, 5000, "93100", "Montreuil")), at=1.0) == {"new": 2}
+    counts = history.upsert(listings((1, "u1", 290000, 5800, "75011", "Paris"),
+                                     (2, "u2", 210000, 5250, "93100", "Montreuil")), at=2.0)
+    assert counts == {"price_drop": 1, "price_rise": 1}
+    drop = history.changes_since(1.5, kinds=("price_drop",)).iloc[0]
+    assert (drop["listing_id"], drop["old_price"], drop["new_price"]) == ("1", 300000, 290000)
+
+
+def test_upsert_same_run_twice_adds_no_event(history):
+    df = listings((1, "u1", 300000, 6000, "75011", "Paris"))
+    history.upsert(df, at=1.0)
+    assert history.upsert(df, at=2.0) == {}
+    assert kinds(history) == ["new"]
+
+
+def test_previous_reads_last_known_version(history):
+    history.upsert(listings((1, "u1", 300000, 6000, "75011", "Paris")), at=1.0)
+    prev = history.previous(pd.Series([1, 2]))
+    assert prev.index.tolist() == ["1"]
+    assert prev.loc["1", "price_per_m2"] == 6000 and prev.loc["1", "last_seen"] == 1.0
+
+
+def test_sync_gone_delists_then_relists(tmp_path, history):
+    history.upsert(listings((1, "u1", 300000, 6000, "75011", "Paris"),
+                            (2, "u2", 200000, 5000, "93100", "Montreuil")), at=1.0)
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    state.record("1", "u1", 410)
+    state.commit()
+    assert history.sync_gone(state.path) == 1
+    assert history.sync_gone(state.path) == 0  # déjà retirée
+    # de nouveau en ligne : remise en ligne journalisée au prochain sync
+    state.record("1", "u1", 200, chash="a")
+    state.close()
+    assert history.sync_gone(state.path) == 0
+    assert history.price_history("1")["kind"].tolist() == ["new", "delisted", "relisted"]
+    delisted = pd.read_sql_query("SELECT delisted_at FROM listings WHERE listing_id = '1'", history.conn)
+    assert delisted["delisted_at"].isna().all()
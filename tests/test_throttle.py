@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from throttle import STALE_SLOT, SharedBuckets, TokenBucket
+
+
+def test_token_bucket_burst_then_rate():
+    b = TokenBucket(rate=2.0, burst=3)
+    b.last = 0.0
+    assert [b.reserve(now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # solde négatif : les suivantes s'étalent à 1 / rate
+    assert b.reserve(now=0.0) == pytest.approx(0.5)
+    assert b.reserve(now=0.0) == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_up_to_burst():
+    b = TokenBucket(rate=1.0, burst=2)
+    b.last = 0.0
+    b.reserve(now=0.0), b.reserve(now=0.0)
+    assert b.reserve(now=100.0) == 0.0
+    assert b.tokens == pytest.approx(1.0)  # plafonné à burst avant la prise
+
+
+def test_reserve_slots_spaced_at_rate(tmp_path):
+    sb = SharedBuckets(str(tmp_path / "t.sqlite"))
+    slots = sb.reserve_slots("h", rate=4.0, burst=1, n=4, now=1000.0)
+    assert slots == pytest.approx([1000.0, 1000.25, 1000.5, 1000.75])
+    assert sb.transactions == 1
+    sb.close()
+
+
+def test_reserve_slots_shared_between_processes(tmp_path):
+    db = str(tmp_path / "t.sqlite")
+    a, b = SharedBuckets(db), SharedBuckets(db)
+    first = a.reserve_slots("h", rate=2.0, burst=1, n=2, now=1000.0)
+    second = b.reserve_slots("h", rate=2.0, burst=1, n=2, now=1000.0)
+    # le second processus voit le solde du premier : ses créneaux suivent, pas de rafale commune
+    assert first == pytest.approx([1000.0, 1000.5])
+    assert second == pytest.approx([1001.0, 1001.5])
+    # un autre hôte a son propre budget
+    assert b.reserve_slots("autre", rate=2.0, burst=1, n=1, now=1000.0) == [1000.0]
+    a.close(), b.close()
+
+
+def test_take_drops_stale_slots(tmp_path):
+    sb = SharedBuckets(str(tmp_path / "t.sqlite"))
+    now = time.time()
+    sb.add("h", [now - STALE_SLOT - 5, now + 0.5])
+    assert sb.take("h") == pytest.approx(0.5, abs=0.05)
+    assert sb.take("h") is None
+    sb.close()